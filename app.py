@@ -20,6 +20,14 @@ from flask_wtf.csrf import CSRFProtect
 from config import config
 from models import db
 from security import login_manager
+from services.access_log_journal import AccessLogJournal
+from services.scan_metrics import ScanMetrics
+from services.pass_number_service import PassNumberService
+from services.fulfilment_service import FulfilmentService
+from services.qr_cache import QRCache
+from services.pdf_render_pool import PdfRenderPool
+from services.pdf_cache import PdfCache
+from services.print_spooler_service import PrintSpoolerService
 from utils import format_date, format_datetime, time_ago, get_status_color, get_status_label, get_role_label
 from utils.i18n import get_text, load_translations
 from flask import session
@@ -36,6 +44,14 @@ def create_app(config_name=None):
     
     db.init_app(app)
     login_manager.init_app(app)
+    AccessLogJournal.init_app(app)
+    ScanMetrics.init_app(app)
+    PassNumberService.init_app(app)
+    FulfilmentService.init_app(app)
+    QRCache.init_app(app)
+    PdfRenderPool.init_app(app)
+    PdfCache.init_app(app)
+    PrintSpoolerService.init_app(app)
     csrf = CSRFProtect(app)
     
     app.jinja_env.filters['format_date'] = format_date
@@ -93,6 +109,7 @@ def create_app(config_name=None):
 
     # CSRF Exemption for Webhooks
     csrf.exempt(app.view_functions['telegram.webhook'])
+    csrf.exempt(app.view_functions['api.stripe_webhook']) # Authenticated by the Stripe-Signature header
     
     @app.route('/login-check')
     def login_check():
@@ -102,9 +119,11 @@ def create_app(config_name=None):
     
     @app.after_request
     def add_header(response):
-        response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '-1'
+        # Ticket downloads set 'private, no-cache' themselves: stored by the browser, revalidated by ETag
+        if not response.cache_control.private:
+            response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
+            response.headers['Pragma'] = 'no-cache'
+            response.headers['Expires'] = '-1'
 
         # CyberConfiance Security Headers
         response.headers['X-Content-Type-Options'] = 'nosniff'
@@ -27,6 +27,74 @@ class Config:
     SUPPORT_WHATSAPP = os.environ.get('SUPPORT_WHATSAPP', '243860493345')
     LEAD_MAGNET_LINK = os.environ.get('LEAD_MAGNET_LINK', 'https://tidycal.com/moamyoneart/consultation-gratuite-15-min')
 
+    # Gate Session (in-memory per-flight token map used by /api/scan)
+    GATE_SESSION_ENABLED = os.environ.get('GATE_SESSION_ENABLED', 'True') == 'True'
+    GATE_SESSION_TTL = int(os.environ.get('GATE_SESSION_TTL', 360)) # Outlives the scanner's 5 min refresh
+    GATE_SESSION_CHECK_INTERVAL = float(os.environ.get('GATE_SESSION_CHECK_INTERVAL', 5)) # Closures made by other workers seen within this delay
+
+    # Signed QR tokens (HMAC with SecurityKey, keyring cached per worker)
+    TOKEN_SIGNING_ENABLED = os.environ.get('TOKEN_SIGNING_ENABLED', 'True') == 'True'
+    TOKEN_KEYRING_TTL = int(os.environ.get('TOKEN_KEYRING_TTL', 300))
+
+    # AccessLog write-behind journal (rejected scans are spooled then group-committed)
+    ACCESS_LOG_WRITE_BEHIND = os.environ.get('ACCESS_LOG_WRITE_BEHIND', 'False') == 'True'
+    ACCESS_LOG_FLUSH_SIZE = int(os.environ.get('ACCESS_LOG_FLUSH_SIZE', 200))
+    ACCESS_LOG_FLUSH_INTERVAL = float(os.environ.get('ACCESS_LOG_FLUSH_INTERVAL', 2.0))
+    ACCESS_LOG_SPOOL_DIR = os.environ.get('ACCESS_LOG_SPOOL_DIR')
+    ACCESS_LOG_SPOOL_FSYNC = os.environ.get('ACCESS_LOG_SPOOL_FSYNC', 'False') == 'True'
+
+    # Scan latency histograms (per worker, read from /api/metrics/scan)
+    SCAN_METRICS_ENABLED = os.environ.get('SCAN_METRICS_ENABLED', 'True') == 'True'
+
+    # Pass numbers handed out from blocks reserved per worker and airport prefix
+    PASS_NUMBER_BLOCK_SIZE = int(os.environ.get('PASS_NUMBER_BLOCK_SIZE', 1000))
+
+    # POS sale idempotency keys are replayable for this long, then cleared by scripts/expire_idempotency_keys.py
+    IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+    # Stripe order fulfilment (tickets, PDFs, delivery) off the webhook request
+    FULFILMENT_WORKERS = int(os.environ.get('FULFILMENT_WORKERS', 2)) # Threads per web worker, 0 = scripts/fulfilment_worker.py only
+    FULFILMENT_POLL_INTERVAL = float(os.environ.get('FULFILMENT_POLL_INTERVAL', 5.0))
+    FULFILMENT_MAX_ATTEMPTS = int(os.environ.get('FULFILMENT_MAX_ATTEMPTS', 5))
+    FULFILMENT_LEASE_SECONDS = int(os.environ.get('FULFILMENT_LEASE_SECONDS', 300)) # Running jobs older than this are taken over
+
+    # ESC/POS print spooler: raw jobs sent to the network printers (Printer.ip_address, port 9100)
+    PRINT_SPOOLER_WORKERS = int(os.environ.get('PRINT_SPOOLER_WORKERS', 1)) # Threads per web worker, 0 = scripts/print_spooler.py only
+    PRINT_POLL_INTERVAL = float(os.environ.get('PRINT_POLL_INTERVAL', 2.0))
+    PRINT_MAX_ATTEMPTS = int(os.environ.get('PRINT_MAX_ATTEMPTS', 5))
+    PRINT_LEASE_SECONDS = int(os.environ.get('PRINT_LEASE_SECONDS', 60)) # Sending jobs older than this are taken over
+
+    # Fulfilment and print spooler threads start with the first request of each web worker, not with their first job
+    WORKERS_AUTOSTART = os.environ.get('WORKERS_AUTOSTART', 'False') == 'True'
+    PRINT_SOCKET_TIMEOUT = float(os.environ.get('PRINT_SOCKET_TIMEOUT', 10.0))
+
+    # Rendered QR codes: LRU per worker plus a content-addressed directory shared by the workers
+    QR_CACHE_SIZE = int(os.environ.get('QR_CACHE_SIZE', 1024))
+    QR_CACHE_DISK = os.environ.get('QR_CACHE_DISK', 'True') == 'True'
+    QR_CACHE_DIR = os.environ.get('QR_CACHE_DIR') # Default: instance/qr_cache
+    QR_CACHE_MAX_AGE_DAYS = int(os.environ.get('QR_CACHE_MAX_AGE_DAYS', 30)) # Applied by scripts/prune_caches.py
+    QR_CACHE_MAX_MB = int(os.environ.get('QR_CACHE_MAX_MB', 512))
+
+    # Ticket logos resolved and decoded once per worker; reloaded when the marker changes, else after this delay (seconds)
+    BRANDING_CACHE_TTL = int(os.environ.get('BRANDING_CACHE_TTL', 300))
+    BRANDING_MARKER_FILE = os.environ.get('BRANDING_MARKER_FILE') # Rewritten on logo changes, checked by every worker. Default: instance/branding.version
+
+    # Rendered ticket PDFs, keyed by their ETag: LRU per worker plus a directory shared by the workers
+    PDF_CACHE_SIZE = int(os.environ.get('PDF_CACHE_SIZE', 256))
+    PDF_CACHE_DISK = os.environ.get('PDF_CACHE_DISK', 'True') == 'True'
+    PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR') # Default: instance/pdf_cache
+    PDF_CACHE_MAX_AGE_DAYS = int(os.environ.get('PDF_CACHE_MAX_AGE_DAYS', 30)) # Applied by scripts/prune_caches.py
+    PDF_CACHE_MAX_MB = int(os.environ.get('PDF_CACHE_MAX_MB', 2048))
+
+    # Ticket PDFs draw the QR code as vector modules; 'bitmap' embeds a PNG instead
+    TICKET_QR_MODE = os.environ.get('TICKET_QR_MODE', 'vector')
+
+    # Bulk ticket PDFs of BULK_PDF_PARALLEL_MIN passes or more are rendered in chunks by a process pool
+    BULK_PDF_WORKERS = int(os.environ.get('BULK_PDF_WORKERS', 0)) # 0 = one per CPU, 1 = always serial
+    BULK_PDF_CHUNK_SIZE = int(os.environ.get('BULK_PDF_CHUNK_SIZE', 100))
+    BULK_PDF_PARALLEL_MIN = int(os.environ.get('BULK_PDF_PARALLEL_MIN', 200))
+    BULK_PDF_STREAM_CHUNK_SIZE = int(os.environ.get('BULK_PDF_STREAM_CHUNK_SIZE', 20)) # Tickets per streamed part of a batch download
+
     LANGUAGES = ['fr', 'en']
     DEFAULT_LANGUAGE = 'fr'
 
@@ -35,6 +103,8 @@ class DevelopmentConfig(Config):
 
 class ProductionConfig(Config):
     DEBUG = False
+    ACCESS_LOG_WRITE_BEHIND = os.environ.get('ACCESS_LOG_WRITE_BEHIND', 'True') == 'True'
+    WORKERS_AUTOSTART = os.environ.get('WORKERS_AUTOSTART', 'True') == 'True'
 
     # Security Hardening: Enforce PostgreSQL in Production
     if os.environ.get('FLASK_ENV') == 'production':
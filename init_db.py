@@ -28,17 +28,17 @@ def check_and_update_schema(db, app):
     expected_schema = {
         'users': ['uuid', 'role', 'location', 'is_active', 'phone', 'first_name', 'last_name', 'email', 'username', 'password_hash', 'created_at', 'updated_at'],
         'flights': ['source', 'capacity', 'status', 'manifest_pax_count', 'aircraft_registration', 'flight_number', 'airline', 'departure_airport', 'arrival_airport', 'departure_time', 'arrival_time', 'created_at'],
-        'gopasses': ['token', 'pass_number', 'payment_status', 'payment_ref', 'scan_date', 'scan_location', 'payment_method', 'sold_by', 'sales_channel', 'passenger_document_type', 'transaction_id', 'issue_date', 'flight_id', 'holder_id', 'pass_type_id', 'price', 'currency', 'passenger_name', 'passenger_passport', 'status', 'scanned_by'],
-        'access_logs': ['status', 'validation_time', 'is_offline', 'validator_id', 'pass_id'],
+        'gopasses': ['token', 'pass_number', 'payment_status', 'payment_ref', 'scan_date', 'scan_location', 'payment_method', 'sold_by', 'sales_channel', 'passenger_document_type', 'transaction_id', 'issue_date', 'flight_id', 'holder_id', 'pass_type_id', 'price', 'currency', 'passenger_name', 'passenger_passport', 'status', 'scanned_by', 'updated_at'],
+        'access_logs': ['status', 'validation_time', 'is_offline', 'validator_id', 'pass_id', 'flight_id'],
         'pass_types': ['color', 'name'],
         'app_configs': ['value', 'description', 'updated_at'],
         'payment_gateways': ['is_active', 'config_json', 'provider'],
-        'transactions': ['uuid', 'agent_id', 'amount_collected', 'currency', 'payment_method', 'provider_ref', 'status', 'is_offline_sync', 'verification_source', 'flight_details', 'created_at', 'sales_channel', 'payment_reference', 'source_metadata'],
+        'transactions': ['uuid', 'agent_id', 'amount_collected', 'ticket_count', 'currency', 'payment_method', 'provider_ref', 'status', 'is_offline_sync', 'verification_source', 'flight_details', 'created_at', 'sales_channel', 'payment_reference', 'source_metadata', 'idempotency_key'],
         'cash_deposits': ['agent_id', 'supervisor_id', 'amount', 'deposit_date', 'notes'],
         'mobile_money_logs': ['transaction_ref', 'amount', 'currency', 'provider', 'status', 'timestamp', 'reconciled'],
         'offline_sync_logs': ['agent_id', 'sync_time', 'record_count', 'status', 'details'],
         'devices': ['unique_id', 'mac_address', 'device_type', 'last_ping', 'app_version', 'battery_level', 'is_sync'],
-        'printers': ['name', 'location', 'status', 'assigned_to'],
+        'printers': ['name', 'location', 'status', 'assigned_to', 'ip_address', 'port'],
         'security_keys': ['key_value', 'key_type', 'is_active', 'expires_at'],
         'airports': ['iata_code', 'name', 'city', 'country', 'type'],
         'airlines': ['name', 'iata_code', 'icao_code', 'country', 'logo_path', 'is_active'],
@@ -48,6 +48,11 @@ def check_and_update_schema(db, app):
         'telegram_subscribers': ['chat_id', 'username', 'first_name', 'status', 'role_label', 'subscriptions', 'requested_at', 'approved_at', 'approved_by']
     }
 
+    # Values of columns added to existing rows (same as scripts/update_schema.py)
+    backfills = {
+        ('gopasses', 'updated_at'): "UPDATE gopasses SET updated_at = COALESCE(scan_date, issue_date)"
+    }
+
     # Only create tables if they don't exist
     db.create_all()
 
@@ -66,8 +71,12 @@ def check_and_update_schema(db, app):
                     if col in ['is_active', 'is_offline', 'is_offline_sync', 'is_sync', 'reconciled']:
                         col_type = 'BOOLEAN DEFAULT FALSE' # Default false is safer for flags usually
                         if col == 'is_active': col_type = 'BOOLEAN DEFAULT TRUE'
-                    elif col in ['capacity', 'manifest_pax_count', 'record_count', 'battery_level', 'agent_id', 'flight_id', 'pass_id', 'validator_id', 'supervisor_id', 'holder_id', 'pass_type_id', 'transaction_id', 'sold_by', 'assigned_to', 'passenger_count_declared', 'scanned_by']:
+                    elif col in ['capacity', 'manifest_pax_count', 'record_count', 'battery_level', 'agent_id', 'flight_id', 'pass_id', 'validator_id', 'supervisor_id', 'holder_id', 'pass_type_id', 'transaction_id', 'sold_by', 'assigned_to', 'passenger_count_declared', 'scanned_by', 'ticket_count']:
                         col_type = 'INTEGER'
+                    elif col == 'port':
+                        col_type = 'INTEGER DEFAULT 9100' # Raw ESC/POS port
+                    elif col == 'ip_address':
+                        col_type = 'VARCHAR(45)'
                     elif col in ['scan_date', 'validation_time', 'updated_at', 'created_at', 'departure_time', 'arrival_time', 'last_ping', 'deposit_date', 'timestamp', 'sync_time', 'expires_at', 'issue_date', 'upload_date']:
                         col_type = 'TIMESTAMP'
                     elif col in ['price', 'amount', 'amount_collected']:
@@ -82,6 +91,8 @@ def check_and_update_schema(db, app):
                             # Adjust for SQLite vs Postgres if necessary, but standard SQL usually works for simple adds
                             # SQLite doesn't support adding columns with constraints easily in one go sometimes, but basic ADD COLUMN is supported.
                             conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {col} {col_type}"))
+                            if (table, col) in backfills:
+                                conn.execute(text(backfills[(table, col)]))
                             conn.commit()
                         print(f"Successfully added column '{col}' to '{table}'.")
                     except Exception as e:
@@ -91,11 +102,14 @@ def check_and_update_schema(db, app):
     indexes_to_check = [
         ('access_logs', 'ix_access_logs_validation_time', 'validation_time'),
         ('access_logs', 'ix_access_logs_status', 'status'),
+        ('access_logs', 'ix_access_logs_flight_id', 'flight_id'),
         ('flights', 'ix_flights_departure_airport', 'departure_airport'),
         ('flights', 'ix_flights_departure_time', 'departure_time'),
         ('flights', 'ix_flights_status', 'status'),
         ('gopasses', 'ix_gopasses_flight_id', 'flight_id'),
         ('gopasses', 'ix_gopasses_scan_date', 'scan_date'),
+        ('gopasses', 'ix_gopasses_transaction_id', 'transaction_id'),
+        ('gopasses', 'ix_gopasses_updated_at', 'updated_at'),
     ]
 
     for table_name, index_name, column_name in indexes_to_check:
@@ -118,6 +132,28 @@ def check_and_update_schema(db, app):
                 except Exception as e:
                     print(f"Failed to create index {index_name}: {e}")
 
+    # Idempotency keys must be unique; the partial index skips cleared (expired) keys
+    if 'transactions' in existing_tables:
+        if not any(idx['name'] == 'ix_transactions_idempotency_key' for idx in inspect(db.engine).get_indexes('transactions')):
+            print("Creating unique index ix_transactions_idempotency_key...")
+            try:
+                with db.engine.connect() as conn:
+                    conn.execute(text("CREATE UNIQUE INDEX ix_transactions_idempotency_key ON transactions (idempotency_key) WHERE idempotency_key IS NOT NULL"))
+                    conn.commit()
+                print("Index ix_transactions_idempotency_key created.")
+            except Exception as e:
+                print(f"Failed to create index ix_transactions_idempotency_key: {e}")
+
+    # Counters of an upgraded database are built once from its passes and scans
+    from services.flight_counter_service import FlightCounterService
+    try:
+        rebuilt = FlightCounterService.backfill()
+        if rebuilt:
+            print(f"Flight counters built for {rebuilt} flights.")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Failed to build flight counters: {e}")
+
     print("Schema check completed.")
 
 def init_database():
@@ -248,6 +284,9 @@ def init_database():
                             price=50.0
                         )
                         db.session.add(pass_obj)
+                # Inserted without the sale service: count them like an upgraded database
+                from services.flight_counter_service import FlightCounterService
+                FlightCounterService.backfill()
                 print("Sample passes created.")
 
         # Seed Infrastructure Data
@@ -115,11 +115,18 @@ class FlightManifest(db.Model):
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Only live keys are indexed; expired ones are cleared to NULL
+        db.Index('ix_transactions_idempotency_key', 'idempotency_key', unique=True,
+                 postgresql_where=db.text('idempotency_key IS NOT NULL'),
+                 sqlite_where=db.text('idempotency_key IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    uuid = db.Column(db.String(36), unique=True, default=lambda: str(uuid.uuid4()))
+    uuid = db.Column(db.String(36), unique=True, default=lambda: str(uuid.uuid4()), insert_sentinel=True) # Lets bulk sales batch their INSERTs
     agent_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    amount_collected = db.Column(db.Float, default=0.0)
+    amount_collected = db.Column(db.Float, default=0.0) # Basket total
+    ticket_count = db.Column(db.Integer, default=1) # GoPass line items in the basket
     currency = db.Column(db.String(10), default='USD')
     payment_method = db.Column(db.String(20)) # CASH, MOBILE_MONEY, CARD
     provider_ref = db.Column(db.String(100)) # ID transaction M-Pesa/Airtel
@@ -129,6 +136,7 @@ class Transaction(db.Model):
     # New fields for traceability
     sales_channel = db.Column(db.String(50), default='DESK') # WEB, DESK
     payment_reference = db.Column(db.String(100)) # Stripe ID or POS Session ID
+    idempotency_key = db.Column(db.String(64)) # Client key of the sale request, replayed on retries
     source_metadata = db.Column(db.JSON) # IP, Agent Name, etc.
 
     # New fields for POS Flight Verification
@@ -138,7 +146,7 @@ class Transaction(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     agent = db.relationship('User', foreign_keys=[agent_id])
-    # Relationship to tickets defined in GoPass via backref or explicitly here
+    # One transaction per payment (basket); its tickets are the GoPass line items
     # tickets = db.relationship('GoPass', backref='transaction')
 
     def to_dict(self):
@@ -146,6 +154,7 @@ class Transaction(db.Model):
             'id': self.id,
             'uuid': self.uuid,
             'amount_collected': self.amount_collected,
+            'ticket_count': self.ticket_count,
             'currency': self.currency,
             'payment_method': self.payment_method,
             'provider_ref': self.provider_ref,
@@ -157,7 +166,7 @@ class GoPass(db.Model):
     __tablename__ = 'gopasses'
 
     id = db.Column(db.Integer, primary_key=True)
-    token = db.Column(db.String(64), unique=True, nullable=False) # The QR content (hashed/signed)
+    token = db.Column(db.String(64), unique=True, nullable=False, insert_sentinel=True) # The QR content (hashed/signed)
     flight_id = db.Column(db.Integer, db.ForeignKey('flights.id'), nullable=False, index=True)
     
     pass_number = db.Column(db.String(20), unique=True)
@@ -178,7 +187,7 @@ class GoPass(db.Model):
     payment_ref = db.Column(db.String(100))
     
     # Transaction Link
-    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'))
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), index=True)
 
     # Usage Status
     status = db.Column(db.String(20), default='valid') # valid, consumed, expired, cancelled
@@ -189,6 +198,8 @@ class GoPass(db.Model):
     scan_location = db.Column(db.String(50))
     
     issue_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # Server clock of the last change (sale, scan, status): offline pack deltas
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Payment & Sales Details
     payment_method = db.Column(db.String(50)) # Cash, M-Pesa, Airtel, Orange, CB
@@ -222,6 +233,87 @@ class GoPass(db.Model):
             'transaction_id': self.transaction_id
         }
 
+class ScanIndex(db.Model):
+    """Narrow projection of gopasses read by the scan path, keyed by token digest."""
+    __tablename__ = 'scan_index'
+
+    token_digest = db.Column(db.LargeBinary(16), primary_key=True) # sha256(token)[:16]
+    pass_id = db.Column(db.Integer, db.ForeignKey('gopasses.id'), unique=True, nullable=False)
+    flight_id = db.Column(db.Integer, db.ForeignKey('flights.id'), nullable=False)
+    flight_date = db.Column(db.Date, nullable=False)
+    departure_airport = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='valid') # Mirrors GoPass.status
+
+class StripeEvent(db.Model):
+    """Stripe webhook deliveries, one row per event id; redeliveries of a stored event are no-ops."""
+    __tablename__ = 'stripe_events'
+
+    id = db.Column(db.String(255), primary_key=True) # Stripe event id (evt_...)
+    event_type = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='received', index=True) # received, processing, processed, failed, ignored
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    replay_count = db.Column(db.Integer, nullable=False, default=0)
+
+    job = db.relationship('FulfilmentJob', uselist=False, back_populates='event')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'event_type': self.event_type,
+            'status': self.status,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None,
+            'replay_count': self.replay_count,
+            'job_id': self.job.id if self.job else None
+        }
+
+class FulfilmentJob(db.Model):
+    """Ticket issuance, PDF rendering and delivery of a paid web order, run by the fulfilment workers."""
+    __tablename__ = 'fulfilment_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(255), db.ForeignKey('stripe_events.id'), unique=True) # One job per Stripe event
+    event_type = db.Column(db.String(100))
+    payload = db.Column(db.JSON, nullable=False) # Stripe object of the event (payment intent)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True) # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow) # Retry backoff
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id')) # Set once the tickets are issued
+    ticket_count = db.Column(db.Integer, nullable=False, default=0)
+    delivered_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    transaction = db.relationship('Transaction')
+    event = db.relationship('StripeEvent', back_populates='job')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'event_id': self.event_id,
+            'event_type': self.event_type,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'transaction_id': self.transaction_id,
+            'ticket_count': self.ticket_count,
+            'delivered_count': self.delivered_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class PassNumberSequence(db.Model):
+    """Next free pass number per prefix (departure airport); workers reserve blocks from it."""
+    __tablename__ = 'pass_number_sequences'
+
+    prefix = db.Column(db.String(10), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=1)
+
 class CashDeposit(db.Model):
     __tablename__ = 'cash_deposits'
 
@@ -256,6 +348,7 @@ class AccessLog(db.Model):
     validation_time = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     status = db.Column(db.String(20), default='valid', index=True)
     is_offline = db.Column(db.Boolean, default=False)
+    flight_id = db.Column(db.Integer, db.ForeignKey('flights.id'), index=True) # Flight being boarded at the gate
 
     pass_record = db.relationship('GoPass')
     validator = db.relationship('User')
@@ -267,7 +360,35 @@ class AccessLog(db.Model):
             'pass_record': self.pass_record.to_dict() if self.pass_record else None,
             'validator': self.validator.to_dict() if self.validator else None,
             'status': self.status,
-            'is_offline': self.is_offline
+            'is_offline': self.is_offline,
+            'flight_id': self.flight_id
+        }
+
+class FlightCounter(db.Model):
+    """Per-flight boarding counters, maintained by the sale and scan paths."""
+    __tablename__ = 'flight_counters'
+
+    flight_id = db.Column(db.Integer, db.ForeignKey('flights.id'), primary_key=True)
+    sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    scanned = db.Column(db.Integer, nullable=False, default=0)
+    rejected_invalid = db.Column(db.Integer, nullable=False, default=0)
+    rejected_already_scanned = db.Column(db.Integer, nullable=False, default=0)
+    rejected_wrong_flight = db.Column(db.Integer, nullable=False, default=0)
+    rejected_expired = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'flight_id': self.flight_id,
+            'sold': self.sold,
+            'revenue': self.revenue,
+            'scanned': self.scanned,
+            'rejected': {
+                'INVALID': self.rejected_invalid,
+                'ALREADY_SCANNED': self.rejected_already_scanned,
+                'WRONG_FLIGHT': self.rejected_wrong_flight,
+                'EXPIRED': self.rejected_expired
+            }
         }
 
 class OfflineSyncLog(db.Model):
@@ -328,13 +449,49 @@ class Printer(db.Model):
     location = db.Column(db.String(100))
     status = db.Column(db.String(20), default='connected') # connected, paper_error, offline
     assigned_to = db.Column(db.Integer, db.ForeignKey('users.id')) # Optional: assigned to a user/workstation
+    ip_address = db.Column(db.String(45)) # Network (ESC/POS) printer, reached by the print spooler
+    port = db.Column(db.Integer, default=9100)
 
     def to_dict(self):
         return {
             'id': self.id,
             'name': self.name,
             'location': self.location,
-            'status': self.status
+            'status': self.status,
+            'ip_address': self.ip_address,
+            'port': self.port
+        }
+
+class PrintJob(db.Model):
+    """Raw ESC/POS document for a network Printer, sent by the print spooler."""
+    __tablename__ = 'print_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    printer_id = db.Column(db.Integer, db.ForeignKey('printers.id'), nullable=False, index=True)
+    gopass_id = db.Column(db.Integer, db.ForeignKey('gopasses.id'))
+    payload = db.Column(db.LargeBinary, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True) # queued, sending, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow) # Retry backoff
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    printer = db.relationship('Printer')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'printer_id': self.printer_id,
+            'gopass_id': self.gopass_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'size': len(self.payload) if self.payload is not None else 0,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
         }
 
 class SecurityKey(db.Model):
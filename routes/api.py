@@ -8,8 +8,8 @@
 
 from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required, current_user
-from models import User, Flight, GoPass, AccessLog, AppConfig, PaymentGateway, db
-from services import FlightService, GoPassService, FinanceService, SettingsService
+from models import User, Flight, GoPass, AccessLog, AppConfig, PaymentGateway, FulfilmentJob, db
+from services import FlightService, GoPassService, FinanceService, SettingsService, OfflineSyncService, ScanMetrics, StripeEventService, QRCache, PdfCache, BrandingService
 from security import agent_required, admin_required
 from datetime import datetime
 from sqlalchemy.orm import joinedload
@@ -78,6 +78,60 @@ def scan_pass():
     
     return jsonify(result)
 
+@api_bp.route('/scan/offline-batch', methods=['POST'])
+@login_required
+def scan_offline_batch():
+    if current_user.role not in ['admin', 'controller']:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    data = request.get_json(silent=True) or {}
+
+    try:
+        result = OfflineSyncService.sync_batch(
+            events=data.get('scans'),
+            agent_id=current_user.id,
+            location=data.get('location') or current_user.location,
+            device_id=data.get('device_id') or request.headers.get('X-Device-Id')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(dict(result, success=True))
+
+@api_bp.route('/metrics/scan')
+@login_required
+def scan_metrics():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    metrics = ScanMetrics.get()
+    if metrics is None or not metrics.is_enabled():
+        return jsonify({'error': 'Scan metrics disabled'}), 404
+
+    group_by = [key.strip() for key in request.args.get('group_by', 'outcome').split(',') if key.strip()]
+    return jsonify(metrics.snapshot(
+        group_by=group_by,
+        airport=request.args.get('airport'),
+        flight_id=request.args.get('flight_id', type=int)
+    ))
+
+@api_bp.route('/metrics/qr')
+@login_required
+def qr_cache_metrics():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    return jsonify(QRCache.get().snapshot())
+
+@api_bp.route('/metrics/pdf')
+@login_required
+def pdf_cache_metrics():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    cache = PdfCache.get()
+    return jsonify(cache.snapshot() if cache is not None else {})
+
 @api_bp.route('/passes/search')
 @login_required
 def search_passes():
@@ -225,6 +279,10 @@ def upload_logo():
         config_entry.updated_at = datetime.utcnow()
         db.session.commit()
 
+        # New logo for the next tickets in every worker: the PDF cache keys
+        # carry the logo version, so PDFs with the old logo no longer match
+        BrandingService.invalidate()
+
         return jsonify({'message': 'Logo uploaded', 'url': url_path})
 
 @api_bp.route('/settings/public')
@@ -349,35 +407,67 @@ def stripe_webhook():
     except stripe.error.SignatureVerificationError as e:
         return 'Invalid signature', 400
 
-    if event['type'] == 'payment_intent.succeeded':
-        intent = event['data']['object']
-        metadata = intent.get('metadata', {})
+    # Persist the event and answer at once: Stripe times out on large orders.
+    # Fulfilment workers issue the tickets, PDFs and emails. A redelivered
+    # event is acknowledged without touching anything.
+    stripe_event, job = StripeEventService.record(json.loads(payload))
+    if stripe_event is None:
+        return jsonify(success=True, duplicate=True)
 
-        flight_id = metadata.get('flight_id')
-        passenger_name = metadata.get('passenger_name')
-        try:
-            quantity = int(metadata.get('quantity', 1))
-        except:
-            quantity = 1
-        passport = metadata.get('passport', 'UNKNOWN')
+    return jsonify(success=True, status=stripe_event.status, job_id=job.id if job else None)
 
-        for i in range(quantity):
-            gopass = GoPassService.create_gopass(
-                flight_id=flight_id,
-                passenger_name=passenger_name,
-                passenger_passport=passport,
-                payment_method='STRIPE',
-                payment_ref=intent['id'],
-                sales_channel='web'
-            )
 
-            # Generate PDF
-            pdf_bytes = GoPassService.generate_pdf_bytes(gopass)
+@api_bp.route('/stripe/events')
+@login_required
+def stripe_events():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
 
-            # Send Email (Stub)
-            print(f"STUB: Sending email to customer for Ticket {gopass.pass_number}")
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    events = StripeEventService.get_events(status=request.args.get('status'), limit=limit)
+    return jsonify([event.to_dict() for event in events])
+
+@api_bp.route('/stripe/events/<event_id>/replay', methods=['POST'])
+@login_required
+def replay_stripe_event(event_id):
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    try:
+        event = StripeEventService.replay(event_id)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(event.to_dict())
+
+
+@api_bp.route('/fulfilment/jobs')
+@login_required
+def fulfilment_jobs():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    query = FulfilmentJob.query
+    status = request.args.get('status')
+    if status:
+        query = query.filter(FulfilmentJob.status == status)
+    limit = min(request.args.get('limit', 50, type=int), 500)
+
+    jobs = query.order_by(FulfilmentJob.id.desc()).limit(limit).all()
+    counts = dict(db.session.query(FulfilmentJob.status, db.func.count(FulfilmentJob.id)).group_by(FulfilmentJob.status).all())
+    return jsonify({'counts': counts, 'jobs': [job.to_dict() for job in jobs]})
+
+@api_bp.route('/fulfilment/jobs/<int:job_id>')
+@login_required
+def fulfilment_job(job_id):
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
 
-    return jsonify(success=True)
+    job = db.session.get(FulfilmentJob, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
 
 
 @api_bp.route('/external/verify-flight', methods=['POST'])
@@ -102,17 +102,18 @@ def export_entity(entity_type):
             payment_method=payment_method
         )
 
-        headers = ['ID Transaction', 'Date', 'Type', 'Mode', 'Montant', 'Devise', 'Agent', 'Statut']
+        headers = ['ID Transaction', 'Date', 'Type', 'Mode', 'Billets', 'Montant', 'Devise', 'Agent', 'Statut']
         for t in transactions:
             data.append([
-                t.payment_ref or t.uuid,
-                t.issue_date.strftime('%Y-%m-%d %H:%M') if t.issue_date else '',
+                t.payment_reference or t.provider_ref or t.uuid,
+                t.created_at.strftime('%Y-%m-%d %H:%M') if t.created_at else '',
                 t.sales_channel,
                 t.payment_method,
-                t.price,
+                t.ticket_count or 1,
+                t.amount_collected,
                 t.currency,
-                t.seller.username if t.seller else 'System',
-                t.payment_status
+                t.agent.username if t.agent else 'System',
+                t.status
             ])
         title = "Journal des Ventes"
 
@@ -10,6 +10,7 @@ from flask import Blueprint, render_template
 from flask_login import login_required, current_user
 from services.pass_service import PassService
 from services.user_service import UserService
+from services.flight_counter_service import FlightCounterService
 from datetime import datetime, timedelta
 from models import AccessLog, GoPass, Flight, db
 from sqlalchemy.orm import joinedload
@@ -58,21 +59,9 @@ def index():
         func.date(Flight.departure_time) == today
     ).all()
 
-    # Optimized: Fetch scanned counts for all flights in one query
+    # Scanned counts come from the per-flight counters maintained by the scan paths
     flight_ids = [f.id for f in todays_flights]
-    scanned_counts_map = {}
-
-    if flight_ids:
-        scanned_counts_query = db.session.query(
-            GoPass.flight_id,
-            func.count(GoPass.id)
-        ).filter(
-            GoPass.flight_id.in_(flight_ids),
-            GoPass.scan_date != None
-        ).group_by(
-            GoPass.flight_id
-        ).all()
-        scanned_counts_map = {flight_id: count for flight_id, count in scanned_counts_query}
+    scanned_counts_map = FlightCounterService.get_scanned_counts(flight_ids)
 
     audit_data = []
     for f in todays_flights:
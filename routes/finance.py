@@ -85,15 +85,16 @@ def export_data(report_type):
         rows = []
         for t in data:
             rows.append([
-                t.payment_ref or t.id,
-                t.issue_date,
+                t.payment_reference or t.provider_ref or t.uuid,
+                t.created_at,
                 t.sales_channel,
                 t.payment_method,
-                t.price,
-                t.seller.username if t.seller else 'System',
-                t.payment_status
+                t.ticket_count or 1,
+                t.amount_collected,
+                t.agent.username if t.agent else 'System',
+                t.status
             ])
-        headers = ['ID Transaction', 'Date', 'Type', 'Mode', 'Montant', 'Agent', 'Statut']
+        headers = ['ID Transaction', 'Date', 'Type', 'Mode', 'Billets', 'Montant', 'Agent', 'Statut']
         csv_data = FinanceService.export_to_csv(rows, headers, 'transactions.csv')
         filename = f'transactions_{datetime.now().strftime("%Y%m%d%H%M")}.csv'
 
@@ -39,6 +39,25 @@ def security_keys():
     return render_template('infrastructure/security_keys.html', keys=keys_list)
 
 # API endpoints for updates (optional, if we want to update from UI)
+@infrastructure_bp.route('/api/printers/<int:printer_id>', methods=['POST'])
+def printer_update(printer_id):
+    printer = db.session.get(Printer, printer_id)
+    if not printer:
+        return jsonify({'status': 'error', 'message': 'Printer not found'}), 404
+
+    data = request.json or {}
+    if 'ip_address' in data:
+        printer.ip_address = data['ip_address'] or None
+    if 'port' in data:
+        try:
+            printer.port = int(data['port'] or 9100)
+        except (TypeError, ValueError):
+            return jsonify({'status': 'error', 'message': 'Invalid port'}), 400
+    if 'assigned_to' in data:
+        printer.assigned_to = data['assigned_to'] or None
+    db.session.commit()
+    return jsonify({'status': 'success', 'printer': printer.to_dict()})
+
 @infrastructure_bp.route('/api/devices/ping/<unique_id>', methods=['POST'])
 def device_ping(unique_id):
     device = Device.query.filter_by(unique_id=unique_id).first()
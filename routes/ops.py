@@ -6,12 +6,16 @@
  * Auditer par : La CyberConfiance, www.cyberconfiance.com
 """
 
-from flask import Blueprint, render_template, request, jsonify, url_for, flash
+from flask import Blueprint, render_template, request, jsonify, url_for, flash, Response, current_app
 from flask_login import login_required, current_user
 from services.flight_service import FlightService
 from services.gopass_service import GoPassService
-from models import db, GoPass
+from services.gate_session_service import GateSessionService
+from services.token_pack_service import TokenPackService
+from services.print_spooler_service import PrintSpoolerService
+from models import db, GoPass, Device, PrintJob
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from security import role_required, agent_required
 from datetime import datetime
 
@@ -34,10 +38,67 @@ def pos():
 
     return render_template('ops/pos.html', flights=flights, today=today, total_sales=total_sales)
 
+def _sale_response(tickets, total_price, issue_time, replayed=False, print_jobs=None):
+    """print_jobs: {gopass_id: print job id} of the tickets sent to the spooler."""
+    response_tickets = []
+    for gp in tickets:
+        response_tickets.append({
+            'gopass_id': gp.id,
+            'pass_number': gp.pass_number,
+            'pdf_url': url_for('public.download_pdf', id=gp.id, format='thermal'),
+            'print_job_id': print_jobs.get(gp.id) if print_jobs else None, # Sent to the counter printer, no PDF to print
+            'passenger_name': gp.passenger_name,
+            'price': gp.price
+        })
+
+    response = jsonify({
+        'success': True,
+        'tickets': response_tickets,
+        'total_price': total_price,
+        'time': issue_time,
+        'flight_number': tickets[-1].flight.flight_number if tickets else "",
+        'status': 'Payé'
+    })
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _replay_sale(idempotency_key):
+    """Response of the sale already recorded under idempotency_key, or None."""
+    transaction, tickets = GoPassService.find_sale(idempotency_key)
+    if transaction is None:
+        return None
+    if transaction.agent_id != current_user.id:
+        return jsonify({'error': "Clé d'idempotence déjà utilisée"}), 409
+
+    # Tickets already spooled by the first attempt must not be printed again
+    print_jobs = {}
+    if tickets:
+        for job_id, gopass_id in db.session.query(PrintJob.id, PrintJob.gopass_id)\
+                .filter(PrintJob.gopass_id.in_([gp.id for gp in tickets]))\
+                .order_by(PrintJob.id.desc()):
+            print_jobs[gopass_id] = job_id # First job of each ticket (reprints come later)
+
+    return _sale_response(
+        tickets, transaction.amount_collected, transaction.created_at.strftime('%H:%M'),
+        replayed=True, print_jobs=print_jobs
+    )
+
 @ops_bp.route('/pos/sale', methods=['POST'])
 @agent_required
 def pos_sale():
     data = request.get_json()
+
+    # A terminal retrying after a network failure resends the same key:
+    # answer with the tickets of the first attempt instead of selling again
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if idempotency_key:
+        if len(idempotency_key) > 64:
+            return jsonify({'error': "Clé d'idempotence invalide"}), 400
+        replay = _replay_sale(idempotency_key)
+        if replay is not None:
+            return replay
+
     flight_mode = data.get('flight_mode', 'today')
 
     flight_id = data.get('flight_id')
@@ -84,78 +145,98 @@ def pos_sale():
     if not passengers:
         return jsonify({'error': 'Aucun passager spécifié'}), 400
 
-    created_tickets = []
-    total_price = 0.0
-
     try:
-        for p in passengers:
-            name = p.get('name') or p.get('passenger_name')
-            doc_num = p.get('doc_num') or p.get('passenger_passport')
-            doc_type = p.get('doc_type') or p.get('passenger_document_type', 'Passeport')
-
-            if not name or not doc_num:
-                raise ValueError("Données passager incomplètes")
-
-            # Generate Metadata
-            terminal_id = "POS-01" # In real app, from config or cookie
-            session_ref = f"SES-{int(datetime.now().timestamp())}"
-            payment_ref_str = f"{terminal_id}-{session_ref}"
-
-            source_metadata = {
-                "terminal_id": terminal_id,
-                "session_id": session_ref,
-                "agent_name": current_user.username
-            }
-
-            gopass = GoPassService.create_gopass(
-                flight_id=flight_id,
-                passenger_name=name,
-                passenger_passport=doc_num,
-                passenger_document_type=doc_type,
-                price=unit_price,
-                payment_method='Cash',
-                payment_ref=payment_ref_str, # Use Session/Trans ID as payment_ref too
-                sold_by=current_user.id,
-                sales_channel='DESK',
-                payment_reference=payment_ref_str,
-                source_metadata=source_metadata,
-                verification_source=verification_source,
-                flight_details=flight_details,
-                commit=False
-            )
-            created_tickets.append(gopass)
-            total_price += unit_price
+        # Generate Metadata
+        terminal_id = "POS-01" # In real app, from config or cookie
+        session_ref = f"SES-{int(datetime.now().timestamp())}"
+        payment_ref_str = f"{terminal_id}-{session_ref}"
+
+        source_metadata = {
+            "terminal_id": terminal_id,
+            "session_id": session_ref,
+            "agent_name": current_user.username
+        }
+
+        created_tickets = GoPassService.create_gopasses_bulk(
+            flight_id=flight_id,
+            passengers=[
+                {
+                    'passenger_name': p.get('name') or p.get('passenger_name'),
+                    'passenger_passport': p.get('doc_num') or p.get('passenger_passport'),
+                    'passenger_document_type': p.get('doc_type') or p.get('passenger_document_type', 'Passeport')
+                }
+                for p in passengers
+            ],
+            price=unit_price,
+            payment_method='Cash',
+            payment_ref=payment_ref_str, # Use Session/Trans ID as payment_ref too
+            sold_by=current_user.id,
+            sales_channel='DESK',
+            payment_reference=payment_ref_str,
+            source_metadata=source_metadata,
+            verification_source=verification_source,
+            flight_details=flight_details,
+            idempotency_key=idempotency_key,
+            commit=False
+        )
+        total_price = unit_price * len(created_tickets)
 
         # Commit all transactions at once
         db.session.commit()
 
-        # Prepare Response
-        response_tickets = []
-        last_gopass = None
-        for gp in created_tickets:
-            last_gopass = gp
-            response_tickets.append({
-                'gopass_id': gp.id,
-                'pdf_url': url_for('public.download_pdf', id=gp.id, format='thermal'),
-                'passenger_name': gp.passenger_name,
-                'price': gp.price
-            })
+        # Counter with a network printer: tickets go to the print spooler (ESC/POS)
+        print_jobs = None
+        printer = PrintSpoolerService.printer_for(current_user)
+        if printer:
+            from flask import session
+            try:
+                jobs = PrintSpoolerService.enqueue_tickets(printer, created_tickets, lang=session.get('lang', 'fr'), created_by=current_user.id)
+                print_jobs = {job.gopass_id: job.id for job in jobs}
+            except Exception as e:
+                # The sale is recorded: the terminal falls back to the PDF print dialog
+                db.session.rollback()
+                current_app.logger.error(f"Print spooling failed for sale {payment_ref_str}: {e}")
 
-        issue_time = datetime.now().strftime('%H:%M')
+        # Same clock as a replay of this sale: the recorded transaction time (UTC, as printed on the tickets)
+        issue_time = created_tickets[0].transaction.created_at.strftime('%H:%M')
+        return _sale_response(created_tickets, total_price, issue_time, print_jobs=print_jobs)
 
-        return jsonify({
-            'success': True,
-            'tickets': response_tickets,
-            'total_price': total_price,
-            'time': issue_time,
-            'flight_number': last_gopass.flight.flight_number if last_gopass else "",
-            'status': 'Payé'
-        })
+    except IntegrityError:
+        db.session.rollback()
+        # A concurrent retry with the same key committed first
+        replay = _replay_sale(idempotency_key) if idempotency_key else None
+        if replay is not None:
+            return replay
+        return jsonify({'error': 'Conflit lors de l\'enregistrement de la vente'}), 409
 
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@ops_bp.route('/pos/print/<int:gopass_id>', methods=['POST'])
+@agent_required
+def pos_print(gopass_id):
+    """Reprint of a ticket on the agent's network printer."""
+    gopass = GoPassService.get_gopass(gopass_id)
+    if not gopass:
+        return jsonify({'error': 'Billet introuvable'}), 404
+
+    printer = PrintSpoolerService.printer_for(current_user)
+    if not printer:
+        return jsonify({'error': 'Aucune imprimante réseau assignée'}), 409
+
+    from flask import session
+    job = PrintSpoolerService.enqueue_tickets(printer, [gopass], lang=session.get('lang', 'fr'), created_by=current_user.id)[0]
+    return jsonify(job.to_dict()), 202
+
+@ops_bp.route('/pos/print-jobs/<int:job_id>')
+@agent_required
+def pos_print_job(job_id):
+    job = db.session.get(PrintJob, job_id)
+    if not job or (job.created_by != current_user.id and current_user.role != 'admin'):
+        return jsonify({'error': 'Impression introuvable'}), 404
+    return jsonify(job.to_dict())
+
 @ops_bp.route('/scanner')
 @role_required('admin', 'controller')
 def scanner():
@@ -166,3 +247,49 @@ def scanner():
     flights = FlightService.get_flights(airport_code=airport_code, date=today)
 
     return render_template('ops/scanner.html', flights=flights, today=today)
+
+@ops_bp.route('/scanner/session/<int:flight_id>', methods=['POST'])
+@role_required('admin', 'controller')
+def open_gate_session(flight_id):
+    # Preload the flight's token map so boarding scans are answered from memory
+    try:
+        gate = GateSessionService.open_session(flight_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+
+    return jsonify({
+        'success': True,
+        'flight_id': gate.flight_id,
+        'entries': len(gate.entries),
+        'closed': gate.closed
+    })
+
+@ops_bp.route('/scanner/pack/<int:flight_id>')
+@role_required('admin', 'controller')
+def download_token_pack(flight_id):
+    # Binary token pack for offline boarding; ?since=<version> returns a delta
+    since = request.args.get('since')
+    if since:
+        try:
+            TokenPackService.parse_version(since)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    try:
+        pack, version = TokenPackService.build_pack(flight_id, since=since)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+
+    # Scanner devices identify themselves to report their sync state
+    device_id = request.headers.get('X-Device-Id')
+    if device_id:
+        device = Device.query.filter_by(unique_id=device_id).first()
+        if device:
+            device.last_ping = datetime.utcnow()
+            device.is_sync = True
+            db.session.commit()
+
+    return Response(pack, mimetype='application/octet-stream', headers={
+        'X-Pack-Version': version,
+        'Content-Disposition': f'attachment; filename=gopass-pack-{flight_id}-{version}.bin'
+    })
@@ -6,15 +6,13 @@
  * Auditer par : La CyberConfiance, www.cyberconfiance.com
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app, Response, stream_with_context
 from sqlalchemy.orm import joinedload
-from services import FlightService, GoPassService, MockPaymentService, FinanceService, SettingsService
+from services import FlightService, GoPassService, MockPaymentService, FinanceService, SettingsService, PdfCache
 from models import PaymentGateway, GoPass, db
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 import io
-import qrcode
-import base64
-import json
 import uuid
 
 public_bp = Blueprint('public', __name__)
@@ -62,6 +60,14 @@ def checkout(flight_id):
     mobile_active = any(g.provider == 'MOBILE_MONEY_AGGREGATOR' and g.is_active for g in gateways)
 
     if request.method == 'POST':
+        # The form carries a key drawn when it was rendered: a double submit or
+        # a resend after a timeout shows the basket of the first submission
+        idempotency_key = (request.form.get('idempotency_key') or '')[:64] or None
+        if idempotency_key:
+            _, tickets = GoPassService.find_sale(idempotency_key)
+            if tickets:
+                return redirect(url_for('public.confirmation_batch', ref=tickets[0].payment_ref))
+
         payment_method = request.form.get('payment_method')
         selected_currency = request.form.get('currency', 'USD')
 
@@ -121,30 +127,45 @@ def checkout(flight_id):
         price_per_pax = FinanceService.calculate_flight_price(flight, selected_currency)
 
         try:
+            passengers = []
             for i in range(len(passenger_names)):
                 name = passenger_names[i]
                 passport = passports[i]
                 dtype = doc_types[i] if i < len(doc_types) else 'Passeport'
 
                 if name and passport:
-                    GoPassService.create_gopass(
-                        flight_id=flight.id,
-                        passenger_name=name,
-                        passenger_passport=passport,
-                        passenger_document_type=dtype,
-                        price=price_per_pax,
-                        currency=selected_currency,
-                        payment_method=payment_method,
-                        payment_ref=batch_ref,
-                        sales_channel='WEB',
-                        payment_reference=batch_ref,
-                        source_metadata=source_metadata,
-                        commit=False
-                    )
+                    passengers.append({
+                        'passenger_name': name,
+                        'passenger_passport': passport,
+                        'passenger_document_type': dtype
+                    })
+
+            GoPassService.create_gopasses_bulk(
+                flight_id=flight.id,
+                passengers=passengers,
+                price=price_per_pax,
+                currency=selected_currency,
+                payment_method=payment_method,
+                payment_ref=batch_ref,
+                sales_channel='WEB',
+                payment_reference=batch_ref,
+                source_metadata=source_metadata,
+                idempotency_key=idempotency_key,
+                commit=False
+            )
 
             db.session.commit()
             return redirect(url_for('public.confirmation_batch', ref=batch_ref))
 
+        except IntegrityError:
+            db.session.rollback()
+            # A concurrent submission of the same form committed first
+            _, tickets = GoPassService.find_sale(idempotency_key) if idempotency_key else (None, [])
+            if tickets:
+                return redirect(url_for('public.confirmation_batch', ref=tickets[0].payment_ref))
+            flash("Une erreur est survenue lors de la création des billets.", "danger")
+            return redirect(url_for('public.checkout', flight_id=flight_id))
+
         except Exception as e:
             db.session.rollback()
             current_app.logger.error(f"Error creating passes: {e}")
@@ -179,7 +200,8 @@ def checkout(flight_id):
                            mobile_active=mobile_active,
                            enable_demo_payment=enable_demo_payment,
                            pricing_options=pricing_options,
-                           available_currencies=avail_currencies)
+                           available_currencies=avail_currencies,
+                           idempotency_key=uuid.uuid4().hex)
 
 @public_bp.route('/confirmation/batch/<ref>')
 def confirmation_batch(ref):
@@ -188,26 +210,11 @@ def confirmation_batch(ref):
         flash("Aucun billet trouvé.", "warning")
         return redirect(url_for('public.index'))
 
+    # QR codes are loaded by the browser from qr_image (cached, in parallel), not inlined
     passes_data = []
     for gp in gopasses:
-        qr_payload = {
-            "id_billet": gp.id,
-            "vol": gp.flight.flight_number,
-            "date": gp.flight.departure_time.strftime('%Y-%m-%d'),
-            "hash_signature": gp.token
-        }
-        qr_data = json.dumps(qr_payload)
-
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        qr_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-        passes_data.append({'gopass': gp, 'qr_base64': qr_base64})
+        qr_version = GoPassService.qr_version(GoPassService.qr_payload(gp))
+        passes_data.append({'gopass': gp, 'qr_url': url_for('public.qr_image', id=gp.id, version=qr_version)})
 
     return render_template('public/confirmation.html', passes=passes_data, batch_ref=ref)
 
@@ -219,33 +226,94 @@ def confirmation(id):
         return redirect(url_for('public.index'))
     return redirect(url_for('public.confirmation_batch', ref=gopass.payment_ref))
 
+@public_bp.route('/qr/<int:id>/<version>.png')
+def qr_image(id, version):
+    """
+    QR code of a pass. The URL carries the version of its content, so the
+    image never changes and is cached for a year; a wrong or outdated
+    version is not found.
+    """
+    gopass = GoPassService.get_gopass(id)
+    if not gopass:
+        return "Pass non trouvé", 404
+
+    qr_data = GoPassService.qr_payload(gopass)
+    if GoPassService.qr_version(qr_data) != version:
+        return "QR code non trouvé", 404
+
+    response = Response(GoPassService.qr_png(gopass, qr_data), mimetype='image/png')
+    response.set_etag(version)
+    response.cache_control.private = True # The QR code is the ticket: no shared cache
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
 @public_bp.route('/download/<int:id>')
 def download_pdf(id):
     gopass = GoPassService.get_gopass(id)
     if not gopass:
         return "Pass non trouvé", 404
 
-    fmt = request.args.get('format', 'a4')
+    fmt = 'thermal' if request.args.get('format') == 'thermal' else 'a4'
     from flask import session
     lang = session.get('lang', 'fr')
-    pdf_bytes = GoPassService.generate_pdf_bytes(gopass, fmt=fmt, lang=lang)
+
+    # Repeat downloads (check-in): 304 on a matching ETag, cached PDF otherwise
+    etag = GoPassService.pdf_etag(gopass, fmt=fmt, lang=lang)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+
+    pdf_bytes, etag = GoPassService.cached_pdf_bytes(gopass, fmt=fmt, lang=lang, etag=etag)
 
     buffer = io.BytesIO(pdf_bytes)
     filename = f"GoPass_{gopass.flight.flight_number}_{gopass.id}.pdf"
 
-    return send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/pdf')
+    response = send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/pdf', etag=etag)
+    return _revalidate(response)
 
 @public_bp.route('/download/batch/<ref>')
 def download_batch(ref):
-    gopasses = GoPass.query.filter_by(payment_ref=ref).all()
+    gopasses = GoPass.query.options(joinedload(GoPass.flight), joinedload(GoPass.seller))\
+        .filter_by(payment_ref=ref).order_by(GoPass.id).all()
     if not gopasses:
         return "Billets introuvables", 404
 
     from flask import session
     lang = session.get('lang', 'fr')
-    pdf_bytes = GoPassService.generate_bulk_pdf(gopasses, lang=lang)
-
-    buffer = io.BytesIO(pdf_bytes)
     filename = f"GoPasses_{ref}.pdf"
 
-    return send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/pdf')
+    etag = GoPassService.batch_pdf_etag(gopasses, lang=lang)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+
+    cache = PdfCache.get()
+    cached_path = cache.cached_path(etag) if cache is not None else None
+    if cached_path:
+        response = send_file(cached_path, as_attachment=True, download_name=filename, mimetype='application/pdf', etag=etag)
+        return _revalidate(response)
+
+    # Streamed part by part: memory and first byte do not depend on the batch size
+    parts = GoPassService.stream_bulk_pdf(gopasses, lang=lang)
+    if cache is not None:
+        parts = cache.store_stream(etag, parts)
+    response = Response(
+        stream_with_context(parts),
+        mimetype='application/pdf',
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no' # Nginx passes the parts through
+        }
+    )
+    response.set_etag(etag)
+    return _revalidate(response)
+
+def _revalidate(response):
+    """Ticket downloads may be kept by the browser only, and revalidated with their ETag."""
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def _not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return _revalidate(response)
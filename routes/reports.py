@@ -9,6 +9,7 @@
 from flask import Blueprint, render_template, jsonify, make_response, send_file
 from flask_login import login_required
 from models import db, Flight, GoPass, AccessLog
+from services.flight_counter_service import FlightCounterService
 from sqlalchemy import func, case
 from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
@@ -32,18 +33,8 @@ AIRPORT_COORDS = {
 }
 
 def _get_scanned_counts(flight_ids):
-    if not flight_ids:
-        return {}
-    results = db.session.query(
-        GoPass.flight_id,
-        func.count(GoPass.id)
-    ).filter(
-        GoPass.flight_id.in_(flight_ids),
-        GoPass.scan_date != None
-    ).group_by(
-        GoPass.flight_id
-    ).all()
-    return {r[0]: r[1] for r in results}
+    # Maintained per flight by the scan paths: one primary-key read per flight
+    return FlightCounterService.get_scanned_counts(flight_ids)
 
 @reports_bp.route('/')
 @login_required
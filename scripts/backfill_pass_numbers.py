@@ -0,0 +1,41 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for backfill_pass_numbers.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+"""
+Gives a pass number (<departure airport>-<sequence>, e.g. FIH-0001234) to
+passes issued before numbers were allocated at sale time. Numbers come from
+the same per-airport sequences as new sales, oldest passes first, and each
+batch is committed on its own: the script can run while counters are
+selling and can be run again.
+
+Usage: python scripts/backfill_pass_numbers.py [--batch-size N]
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+from app import create_app
+from models import db
+from services.pass_number_service import PassNumberService
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill missing pass numbers")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Passes per committed batch")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        print("Numbering passes without pass number...")
+        count = PassNumberService.backfill(args.batch_size)
+        print(f"{count} passes numbered.")
+
+if __name__ == '__main__':
+    main()
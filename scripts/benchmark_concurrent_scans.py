@@ -0,0 +1,295 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for benchmark_concurrent_scans.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+"""
+Simulates N gates scanning one flight concurrently through
+GoPassService.validate_gopass, with a mix of valid, duplicate, wrong-flight
+and forged QR codes. Reports scans/sec and latency percentiles per outcome,
+then checks the boarding invariants: every pass of the flight gets exactly
+one VALID, one VALID access log and one counted scan, and every other scan
+gets the expected rejection code.
+
+The data is written to a dedicated database: a temporary SQLite file by
+default (deleted afterwards), or the PostgreSQL database given by --database.
+Benchmark flights are numbered BENCH-<timestamp> and left in place.
+
+Usage:
+    python scripts/benchmark_concurrent_scans.py
+    python scripts/benchmark_concurrent_scans.py --database postgresql://postgres@localhost/sgi_bench --gates 16 --passes 2000
+    python scripts/benchmark_concurrent_scans.py --min-throughput 150 --max-p99 80
+
+Exits with status 1 when an invariant is broken or a threshold is missed.
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('SESSION_SECRET', 'benchmark')
+
+import argparse
+import json
+import queue
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from config import config
+from models import db, User, Flight, GoPass, AccessLog, FlightCounter
+from services.gopass_service import GoPassService
+from services.access_log_journal import AccessLogJournal
+
+# Code every scan kind must get (duplicates: VALID once per pass, then ALREADY_SCANNED)
+EXPECTED_CODES = {
+    'valid': {'VALID', 'ALREADY_SCANNED'},
+    'duplicate': {'VALID', 'ALREADY_SCANNED'},
+    'wrong_flight': {'WRONG_FLIGHT'},
+    'forged': {'INVALID'}
+}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+def setup_flights(args, tag):
+    """Creates the gate agents, the boarding flight and a sibling flight with their passes."""
+    agents = []
+    for i in range(args.gates):
+        username = f'bench_gate_{i}'
+        agent = User.query.filter_by(username=username).first()
+        if not agent:
+            agent = User(
+                username=username, email=f'{username}@bench.local', role='controller',
+                first_name='Gate', last_name=str(i)
+            )
+            agent.set_password(uuid.uuid4().hex)
+            db.session.add(agent)
+        agents.append(agent)
+
+    departure = datetime.now().replace(microsecond=0)
+    flight = Flight(
+        flight_number=f'{tag}-A', airline='Benchmark', departure_airport='FIH',
+        arrival_airport='FBM', departure_time=departure, status='boarding'
+    )
+    sibling = Flight(
+        flight_number=f'{tag}-B', airline='Benchmark', departure_airport='FIH',
+        arrival_airport='GOM', departure_time=departure, status='boarding'
+    )
+    db.session.add_all([flight, sibling])
+    db.session.commit()
+
+    wrong_count = int(args.passes * args.wrong_flight)
+    passes = []
+    for target, count in ((flight, args.passes), (sibling, wrong_count)):
+        for i in range(count):
+            passes.append(GoPassService.create_gopass(
+                flight_id=target.id, passenger_name=f'Passenger {i}',
+                passenger_passport=f'BENCH{i:06d}', sold_by=agents[0].id, commit=False
+            ))
+    db.session.commit()
+
+    payloads = [(gopass.id, gopass.flight_id, GoPassService.qr_payload(gopass)) for gopass in passes]
+    return [agent.id for agent in agents], flight.id, sibling.id, payloads
+
+
+def build_workload(args, flight_id, payloads, rng):
+    """
+    Returns [(kind, pass_id, qr_content)]. Duplicates follow their original
+    so that concurrent gates race on the same pass.
+    """
+    originals = [(pass_id, qr) for pass_id, pass_flight_id, qr in payloads if pass_flight_id == flight_id]
+    rng.shuffle(originals)
+    duplicated = set(rng.sample(range(len(originals)), int(len(originals) * args.duplicates)))
+
+    workload = []
+    for i, (pass_id, qr) in enumerate(originals):
+        workload.append(('valid', pass_id, qr))
+        if i in duplicated:
+            workload.append(('duplicate', pass_id, qr))
+
+    extras = [('wrong_flight', pass_id, qr) for pass_id, pass_flight_id, qr in payloads if pass_flight_id != flight_id]
+    extras += [
+        ('forged', None, json.dumps({'hash_signature': '%064x' % rng.getrandbits(256)}))
+        for _ in range(int(args.passes * args.forged))
+    ]
+    for extra in extras:
+        workload.insert(rng.randrange(len(workload) + 1), extra)
+    return workload
+
+
+def run(app, args):
+    """Runs the benchmark inside app. Returns the list of problems found (empty when green)."""
+    rng = random.Random(args.seed)
+    tag = f'BENCH-{int(time.time() * 1000):x}'
+
+    with app.app_context():
+        db.create_all()
+        agent_ids, flight_id, sibling_id, payloads = setup_flights(args, tag)
+        workload = build_workload(args, flight_id, payloads, rng)
+
+    jobs = queue.Queue()
+    for job in workload:
+        jobs.put(job)
+
+    results = []
+    results_lock = threading.Lock()
+    start_barrier = threading.Barrier(args.gates + 1)
+
+    def gate(agent_id):
+        local = []
+        with app.app_context():
+            start_barrier.wait()
+            while True:
+                try:
+                    kind, pass_id, qr = jobs.get_nowait()
+                except queue.Empty:
+                    break
+                started = time.perf_counter()
+                try:
+                    code = GoPassService.validate_gopass(qr, flight_id, agent_id, 'FIH').get('code')
+                except Exception as e:
+                    db.session.rollback()
+                    code = f'ERROR: {e.__class__.__name__}: {e}'
+                local.append((kind, pass_id, code, (time.perf_counter() - started) * 1000.0))
+            db.session.remove()
+        with results_lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=gate, args=(agent_id,)) for agent_id in agent_ids]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # Report
+    latencies = sorted(latency for _, _, _, latency in results)
+    throughput = len(results) / elapsed if elapsed else 0.0
+    p99 = percentile(latencies, 0.99)
+    print(f"{len(results)} scans by {args.gates} gates in {elapsed:.2f}s: {throughput:.1f} scans/sec")
+    print(f"Latency (ms): p50 {percentile(latencies, 0.50):.2f}  p95 {percentile(latencies, 0.95):.2f}  "
+          f"p99 {p99:.2f}  max {latencies[-1] if latencies else 0.0:.2f}")
+
+    by_code = {}
+    for _, _, code, latency in results:
+        by_code.setdefault(code, []).append(latency)
+    for code, values in sorted(by_code.items(), key=lambda item: -len(item[1])):
+        values.sort()
+        print(f"  {code:<16} {len(values):>6}  p50 {percentile(values, 0.50):8.2f}  "
+              f"p95 {percentile(values, 0.95):8.2f}  p99 {percentile(values, 0.99):8.2f}")
+
+    # Invariants
+    problems = []
+    valid_by_pass = {}
+    for kind, pass_id, code, _ in results:
+        if code not in EXPECTED_CODES[kind]:
+            problems.append(f"{kind} scan of pass {pass_id} answered {code}")
+        if code == 'VALID':
+            valid_by_pass[pass_id] = valid_by_pass.get(pass_id, 0) + 1
+
+    boarding_passes = {pass_id for kind, pass_id, _, _ in results if kind == 'valid'}
+    for pass_id in boarding_passes:
+        if valid_by_pass.get(pass_id, 0) != 1:
+            problems.append(f"pass {pass_id} answered VALID {valid_by_pass.get(pass_id, 0)} times")
+
+    with app.app_context():
+        journal = AccessLogJournal.get()
+        if journal is not None:
+            journal.flush()
+
+        logged = dict(db.session.query(AccessLog.pass_id, db.func.count(AccessLog.id)).filter(
+            AccessLog.flight_id == flight_id, AccessLog.status == 'VALID'
+        ).group_by(AccessLog.pass_id).all())
+        for pass_id in boarding_passes:
+            if logged.get(pass_id, 0) != 1:
+                problems.append(f"pass {pass_id} has {logged.get(pass_id, 0)} VALID access logs")
+
+        consumed = GoPass.query.filter_by(flight_id=flight_id, status='consumed').count()
+        if consumed != len(boarding_passes):
+            problems.append(f"{consumed} passes consumed, expected {len(boarding_passes)}")
+
+        counter = db.session.get(FlightCounter, flight_id)
+        scanned = counter.scanned if counter else 0
+        if scanned != len(boarding_passes):
+            problems.append(f"flight counter reports {scanned} scanned, expected {len(boarding_passes)}")
+
+        sibling_consumed = GoPass.query.filter_by(flight_id=sibling_id, status='consumed').count()
+        if sibling_consumed:
+            problems.append(f"{sibling_consumed} wrong-flight passes were consumed")
+        db.session.remove()
+
+    if args.min_throughput and throughput < args.min_throughput:
+        problems.append(f"throughput {throughput:.1f} scans/sec below {args.min_throughput}")
+    if args.max_p99 and p99 > args.max_p99:
+        problems.append(f"p99 latency {p99:.2f} ms above {args.max_p99}")
+
+    return problems
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent gate scan benchmark")
+    parser.add_argument('--database', help="Database URL (default: temporary SQLite file)")
+    parser.add_argument('--gates', type=int, default=8, help="Concurrent gates (threads)")
+    parser.add_argument('--passes', type=int, default=500, help="Passes sold for the boarding flight")
+    parser.add_argument('--duplicates', type=float, default=0.2, help="Share of passes scanned twice")
+    parser.add_argument('--wrong-flight', type=float, default=0.1, help="Wrong-flight scans, as a share of passes")
+    parser.add_argument('--forged', type=float, default=0.05, help="Forged scans, as a share of passes")
+    parser.add_argument('--no-gate-session', action='store_true', help="Disable gate sessions")
+    parser.add_argument('--write-behind', action='store_true', help="Enable the AccessLog write-behind journal")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--min-throughput', type=float, help="Fail below this many scans/sec")
+    parser.add_argument('--max-p99', type=float, help="Fail above this p99 latency (ms)")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+
+    temp_path = None
+    database = args.database
+    if not database:
+        fd, temp_path = tempfile.mkstemp(suffix='.db', prefix='sgi_bench_')
+        os.close(fd)
+        database = f'sqlite:///{temp_path}'
+    elif ':memory:' in database:
+        sys.exit("An in-memory database cannot be shared between gates; use a file or PostgreSQL.")
+
+    # The engine is bound in create_app, so the URL must be set beforehand
+    config['default'].SQLALCHEMY_DATABASE_URI = database
+    from app import create_app
+    app = create_app('default')
+    app.config['GATE_SESSION_ENABLED'] = not args.no_gate_session
+    app.config['ACCESS_LOG_WRITE_BEHIND'] = args.write_behind
+
+    print(f"Benchmarking on {database.split('@')[-1]}...")
+    try:
+        problems = run(app, args)
+    finally:
+        if temp_path:
+            with app.app_context():
+                db.engine.dispose()
+            os.remove(temp_path)
+
+    if problems:
+        print(f"FAILED: {len(problems)} problem(s)")
+        for problem in problems[:20]:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print("OK: every pass boarded exactly once.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for expire_idempotency_keys.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+"""
+Clears the idempotency keys of POS sales older than IDEMPOTENCY_KEY_TTL_HOURS
+(or --hours), so that the unique index on live keys stays small. The sales
+themselves are kept. Meant to run from cron, e.g. every hour:
+
+    0 * * * * cd /var/www/sgi-gp && venv/bin/python scripts/expire_idempotency_keys.py
+
+Usage: python scripts/expire_idempotency_keys.py [--hours N]
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+from app import create_app
+from services.gopass_service import GoPassService
+
+def main():
+    parser = argparse.ArgumentParser(description="Expire POS sale idempotency keys")
+    parser.add_argument('--hours', type=int, help="Key lifetime in hours (default: IDEMPOTENCY_KEY_TTL_HOURS)")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        count = GoPassService.expire_idempotency_keys(args.hours)
+        print(f"{count} idempotency keys expired.")
+
+if __name__ == '__main__':
+    main()
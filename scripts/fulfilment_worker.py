@@ -0,0 +1,52 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for fulfilment_worker.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+"""
+Runs fulfilment workers outside the web processes: claims the queued
+FulfilmentJob rows stored by the Stripe webhook, issues the tickets,
+renders the PDFs and hands them to delivery. Use it with
+FULFILMENT_WORKERS=0 on the web workers, or alongside them.
+
+Usage:
+    python scripts/fulfilment_worker.py              # 2 threads, runs until stopped
+    python scripts/fulfilment_worker.py --threads 4
+    python scripts/fulfilment_worker.py --once       # drain due jobs, then exit
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import time
+from app import create_app
+from services.fulfilment_service import FulfilmentService
+
+def main():
+    parser = argparse.ArgumentParser(description="Stripe order fulfilment worker")
+    parser.add_argument('--threads', type=int, default=2)
+    parser.add_argument('--once', action='store_true', help="Process due jobs and exit")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        service = FulfilmentService.get()
+        if args.once:
+            print(f"{service.run_pending()} jobs processed.")
+            return
+
+        print(f"Fulfilment worker started with {args.threads} threads.")
+        service.start(args.threads)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for migrate_basket_transactions.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+"""
+Migrates sales recorded with one Transaction per ticket to baskets: one
+Transaction per payment, with its tickets as line items. Tickets sharing a
+payment reference, seller, payment method, currency and flight, and issued
+in one burst (less than 250 ms apart), are regrouped on the oldest of their
+transactions, which takes the basket amount and ticket count; the other
+transactions are kept with status 'superseded' and a link to their basket
+(source_metadata.superseded_by). Tickets are read in pages of --batch-size
+rows.
+
+Without --apply the script is a dry run: it reports what it would do and
+changes nothing. Run scripts/update_schema.py first (adds
+transactions.ticket_count). The script can be run again safely.
+
+Usage: python scripts/migrate_basket_transactions.py [--batch-size N] [--apply]
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+from app import create_app
+from services.finance_service import FinanceService
+
+def main():
+    parser = argparse.ArgumentParser(description="Group per-ticket transactions into baskets")
+    parser.add_argument('--batch-size', type=int, default=500, help="Baskets per committed batch")
+    parser.add_argument('--apply', action='store_true', help="Write the baskets (default: dry run)")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print("Migrating transactions to baskets..." if args.apply else "Dry run (use --apply to write)...")
+        written, superseded = FinanceService.migrate_basket_transactions(args.batch_size, dry_run=not args.apply)
+        print(f"{written} baskets written, {superseded} per-ticket transactions superseded.")
+
+if __name__ == '__main__':
+    main()
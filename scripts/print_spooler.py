@@ -0,0 +1,52 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for print_spooler.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+"""
+Runs the print spooler outside the web processes: claims the queued
+PrintJob rows stored by the POS and sends their ESC/POS bytes to the
+network printers. Use it with PRINT_SPOOLER_WORKERS=0 on the web workers,
+or alongside them.
+
+Usage:
+    python scripts/print_spooler.py                  # 1 thread, runs until stopped
+    python scripts/print_spooler.py --threads 2
+    python scripts/print_spooler.py --once           # send due jobs, then exit
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import time
+from app import create_app
+from services.print_spooler_service import PrintSpoolerService
+
+def main():
+    parser = argparse.ArgumentParser(description="ESC/POS print spooler")
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--once', action='store_true', help="Send due jobs and exit")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        service = PrintSpoolerService.get()
+        if args.once:
+            print(f"{service.run_pending()} jobs sent.")
+            return
+
+        print(f"Print spooler started with {args.threads} threads.")
+        service.start(args.threads)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for prune_caches.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+"""
+Keeps the QR code and ticket PDF disk caches (QR_CACHE_DIR, PDF_CACHE_DIR)
+bounded: deletes the files not used for <CACHE>_MAX_AGE_DAYS (or --days),
+then the least recently used ones until each directory fits in
+<CACHE>_MAX_MB (or --max-mb). A deleted entry is rendered again on its next
+use. Meant to run from cron, e.g. every night:
+
+    30 3 * * * cd /var/www/sgi-gp && venv/bin/python scripts/prune_caches.py
+
+Usage: python scripts/prune_caches.py [--days N] [--max-mb N]
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+from app import create_app
+from services.qr_cache import QRCache
+from services.pdf_cache import PdfCache
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune the QR code and ticket PDF disk caches")
+    parser.add_argument('--days', type=int, help="Maximum age in days since last use (default: QR_/PDF_CACHE_MAX_AGE_DAYS)")
+    parser.add_argument('--max-mb', type=int, help="Maximum size of each directory (default: QR_/PDF_CACHE_MAX_MB)")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        for label, cache in (('QR codes', QRCache.get()), ('PDFs', PdfCache.get())):
+            files, size = cache.prune(args.days, args.max_mb)
+            print(f"{files} cached {label} removed ({size / 1024 / 1024:.1f} MB).")
+
+if __name__ == '__main__':
+    main()
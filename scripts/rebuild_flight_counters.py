@@ -0,0 +1,41 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for rebuild_flight_counters.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+"""
+Recomputes the per-flight counters (flight_counters) from gopasses and
+access_logs to repair drift. init_db.py and scripts/update_schema.py build
+them once on an upgraded database whose counter table is still empty.
+Run it outside boarding peaks: scans counted while a flight is being
+rebuilt can be lost and would need another rebuild.
+
+Usage: python scripts/rebuild_flight_counters.py [flight_id ...]
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+from app import create_app
+from models import db
+from services.flight_counter_service import FlightCounterService
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild per-flight boarding counters")
+    parser.add_argument('flight_ids', nargs='*', type=int, help="Flights to rebuild (default: all)")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        print("Rebuilding flight counters...")
+        count = FlightCounterService.rebuild(args.flight_ids or None)
+        print(f"{count} flight counter rows written.")
+
+if __name__ == '__main__':
+    main()
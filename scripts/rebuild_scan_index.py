@@ -0,0 +1,41 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for rebuild_scan_index.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+"""
+Backfills the narrow scan projection (scan_index) from gopasses and
+flights, to initialise it on an existing database or repair drift.
+Batches are committed one at a time, so the script can run while gates
+are scanning: passes it has not reached yet are still found through the
+gopasses fallback of the scan path.
+
+Usage: python scripts/rebuild_scan_index.py [--batch-size N]
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+from app import create_app
+from models import db
+from services.scan_index_service import ScanIndexService, CHUNK_SIZE
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the scan index")
+    parser.add_argument('--batch-size', type=int, default=CHUNK_SIZE, help="Passes per committed batch")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        print("Rebuilding scan index...")
+        count = ScanIndexService.rebuild(args.batch_size)
+        print(f"{count} scan index rows written.")
+
+if __name__ == '__main__':
+    main()
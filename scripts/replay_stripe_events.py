@@ -0,0 +1,61 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for replay_stripe_events.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+"""
+Replays failed Stripe events: their fulfilment jobs are queued again and
+resume from the step where they stopped (tickets already issued or
+delivered are not issued or sent twice). The running fulfilment workers
+pick them up; add --run to process them in this process instead.
+
+Usage:
+    python scripts/replay_stripe_events.py evt_123 evt_456
+    python scripts/replay_stripe_events.py --all-failed
+    python scripts/replay_stripe_events.py --all-failed --run
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+from app import create_app
+from models import StripeEvent
+from services.stripe_event_service import StripeEventService
+from services.fulfilment_service import FulfilmentService
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay failed Stripe events")
+    parser.add_argument('event_ids', nargs='*')
+    parser.add_argument('--all-failed', action='store_true', help="Replay every failed event")
+    parser.add_argument('--run', action='store_true', help="Process the replayed jobs before exiting")
+    args = parser.parse_args()
+
+    if not args.event_ids and not args.all_failed:
+        parser.error("give event ids or --all-failed")
+
+    app = create_app()
+    with app.app_context():
+        event_ids = list(args.event_ids)
+        if args.all_failed:
+            event_ids += [event.id for event in StripeEvent.query.filter_by(status='failed').order_by(StripeEvent.received_at)]
+
+        replayed = 0
+        for event_id in event_ids:
+            try:
+                StripeEventService.replay(event_id)
+                replayed += 1
+                print(f"{event_id}: replayed")
+            except (LookupError, ValueError) as e:
+                print(f"{event_id}: {e}")
+
+        print(f"{replayed} events replayed.")
+        if args.run:
+            print(f"{FulfilmentService.get().run_pending()} jobs processed.")
+
+if __name__ == '__main__':
+    main()
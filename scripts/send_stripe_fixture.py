@@ -0,0 +1,95 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for send_stripe_fixture.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+"""
+Posts a Stripe webhook fixture to a local server, signed with
+STRIPE_WEBHOOK_SECRET exactly as Stripe signs its deliveries
+(Stripe-Signature: t=<timestamp>,v1=<HMAC-SHA256>). Lets the webhook and
+the fulfilment workers be exercised without a Stripe account or the
+Stripe CLI.
+
+Usage:
+    python scripts/send_stripe_fixture.py --flight-id 12
+    python scripts/send_stripe_fixture.py --fixture tests/fixtures/stripe/payment_intent_succeeded.json --url http://localhost:5000/api/payment/stripe-webhook
+    python scripts/send_stripe_fixture.py --event-id evt_same --print-only
+"""
+
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import hashlib
+import hmac
+import json
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'fixtures', 'stripe', 'payment_intent_succeeded.json')
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Stripe-Signature header value for payload (str)."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def load_fixture(path=DEFAULT_FIXTURE, event_id=None, flight_id=None, quantity=None):
+    """Fixture event as a dict. A fresh event id is generated unless event_id is given."""
+    with open(path, 'r', encoding='utf-8') as f:
+        event = json.load(f)
+
+    event['id'] = event_id or f"evt_local_{uuid.uuid4().hex[:16]}"
+    event['created'] = int(time.time())
+    intent = event['data']['object']
+    if flight_id is not None:
+        intent.setdefault('metadata', {})['flight_id'] = str(flight_id)
+    if quantity is not None:
+        intent.setdefault('metadata', {})['quantity'] = str(quantity)
+    return event
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a signed Stripe webhook fixture")
+    parser.add_argument('--url', default='http://localhost:5000/api/payment/stripe-webhook')
+    parser.add_argument('--fixture', default=DEFAULT_FIXTURE)
+    parser.add_argument('--secret', default=os.environ.get('STRIPE_WEBHOOK_SECRET'), help="Default: STRIPE_WEBHOOK_SECRET")
+    parser.add_argument('--event-id', help="Event id (default: a new one, to mimic a new delivery)")
+    parser.add_argument('--flight-id', type=int, help="Overrides metadata.flight_id")
+    parser.add_argument('--quantity', type=int, help="Overrides metadata.quantity")
+    parser.add_argument('--print-only', action='store_true', help="Print the payload and header instead of sending")
+    args = parser.parse_args()
+
+    if not args.secret:
+        sys.exit("No secret: set STRIPE_WEBHOOK_SECRET or pass --secret.")
+
+    payload = json.dumps(load_fixture(args.fixture, args.event_id, args.flight_id, args.quantity))
+    header = sign_payload(payload, args.secret)
+
+    if args.print_only:
+        print(f"Stripe-Signature: {header}")
+        print(payload)
+        return
+
+    req = urllib.request.Request(
+        args.url, data=payload.encode(), method='POST',
+        headers={'Content-Type': 'application/json', 'Stripe-Signature': header}
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            print(response.status, response.read().decode())
+    except urllib.error.HTTPError as e:
+        print(e.code, e.read().decode())
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
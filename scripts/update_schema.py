@@ -12,6 +12,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import create_app
 from models import db
+from services.flight_counter_service import FlightCounterService
 from sqlalchemy import text
 
 app = create_app()
@@ -68,4 +69,136 @@ with app.app_context():
     else:
         print("is_offline already exists in access_logs.")
 
+    # Add flight_id (gate flight) to access_logs
+    if not column_exists('access_logs', 'flight_id'):
+        print("Adding flight_id to access_logs...")
+        try:
+            db.session.execute(text("ALTER TABLE access_logs ADD COLUMN flight_id INTEGER REFERENCES flights(id)"))
+            db.session.commit()
+            print("Done.")
+        except Exception as e:
+            print(f"Error adding flight_id: {e}")
+            db.session.rollback()
+    else:
+        print("flight_id already exists in access_logs.")
+
+    # Add ticket_count (basket size) to transactions
+    if not column_exists('transactions', 'ticket_count'):
+        print("Adding ticket_count to transactions...")
+        try:
+            db.session.execute(text("ALTER TABLE transactions ADD COLUMN ticket_count INTEGER DEFAULT 1"))
+            db.session.commit()
+            print("Done. Run scripts/migrate_basket_transactions.py --apply to group existing tickets.")
+        except Exception as e:
+            print(f"Error adding ticket_count: {e}")
+            db.session.rollback()
+    else:
+        print("ticket_count already exists in transactions.")
+
+    # Add idempotency_key (POS retries) to transactions
+    if not column_exists('transactions', 'idempotency_key'):
+        print("Adding idempotency_key to transactions...")
+        try:
+            db.session.execute(text("ALTER TABLE transactions ADD COLUMN idempotency_key VARCHAR(64)"))
+            db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_transactions_idempotency_key ON transactions (idempotency_key) WHERE idempotency_key IS NOT NULL"))
+            db.session.commit()
+            print("Done.")
+        except Exception as e:
+            print(f"Error adding idempotency_key: {e}")
+            db.session.rollback()
+    else:
+        print("idempotency_key already exists in transactions.")
+
+    # One fulfilment job per Stripe event. Redeliveries stored before
+    # stripe_events existed left several jobs for one event: the most advanced
+    # job keeps the event, the others are detached (and stopped if not done).
+    print("Detaching duplicate fulfilment jobs of the same Stripe event...")
+    try:
+        rows = db.session.execute(text(
+            "SELECT id, event_id, status, transaction_id FROM fulfilment_jobs "
+            "WHERE event_id IN (SELECT event_id FROM fulfilment_jobs WHERE event_id IS NOT NULL "
+            "GROUP BY event_id HAVING COUNT(*) > 1) ORDER BY event_id, id"
+        )).all()
+        jobs_by_event = {}
+        for row in rows:
+            jobs_by_event.setdefault(row.event_id, []).append(row)
+        for event_id, jobs in jobs_by_event.items():
+            kept = min(jobs, key=lambda j: (j.status != 'done', j.transaction_id is None, j.id))
+            for job in jobs:
+                if job.id == kept.id:
+                    continue
+                db.session.execute(text(
+                    "UPDATE fulfilment_jobs SET event_id = NULL, last_error = :note, "
+                    "status = CASE status WHEN 'done' THEN 'done' ELSE 'failed' END WHERE id = :id"
+                ), {'id': job.id, 'note': f"Duplicate of job {kept.id} (event {event_id})"})
+        db.session.commit()
+        print(f"Done ({sum(len(jobs) - 1 for jobs in jobs_by_event.values())} jobs detached).")
+    except Exception as e:
+        print(f"Error detaching duplicate fulfilment jobs: {e}")
+        db.session.rollback()
+
+    print("Registering Stripe events of existing fulfilment jobs...")
+    try:
+        # One row per event id, from its oldest job, even if duplicates remain
+        db.session.execute(text(
+            "INSERT INTO stripe_events (id, event_type, status, received_at, processed_at, replay_count) "
+            "SELECT j.event_id, COALESCE(j.event_type, 'payment_intent.succeeded'), "
+            "CASE j.status WHEN 'done' THEN 'processed' WHEN 'failed' THEN 'failed' "
+            "WHEN 'running' THEN 'processing' ELSE 'received' END, j.created_at, j.finished_at, 0 "
+            "FROM fulfilment_jobs j WHERE j.event_id IS NOT NULL "
+            "AND j.id = (SELECT MIN(d.id) FROM fulfilment_jobs d WHERE d.event_id = j.event_id) "
+            "AND j.event_id NOT IN (SELECT id FROM stripe_events)"
+        ))
+        db.session.commit()
+        print("Done.")
+    except Exception as e:
+        print(f"Error registering Stripe events: {e}")
+        db.session.rollback()
+
+    print("Adding unique index on fulfilment_jobs.event_id...")
+    try:
+        db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_fulfilment_jobs_event_id ON fulfilment_jobs (event_id)"))
+        db.session.commit()
+        print("Done.")
+    except Exception as e:
+        print(f"Error adding unique index on fulfilment_jobs.event_id: {e}")
+        db.session.rollback()
+
+    # Server-side change marker of the passes (offline token pack deltas)
+    if not column_exists('gopasses', 'updated_at'):
+        print("Adding updated_at to gopasses...")
+        try:
+            db.session.execute(text("ALTER TABLE gopasses ADD COLUMN updated_at TIMESTAMP"))
+            db.session.execute(text("UPDATE gopasses SET updated_at = COALESCE(scan_date, issue_date)"))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_gopasses_updated_at ON gopasses (updated_at)"))
+            db.session.commit()
+            print("Done.")
+        except Exception as e:
+            print(f"Error adding updated_at: {e}")
+            db.session.rollback()
+    else:
+        print("updated_at already exists in gopasses.")
+
+    # Network address of the ESC/POS printers (print spooler)
+    for column, ddl in (('ip_address', 'VARCHAR(45)'), ('port', 'INTEGER DEFAULT 9100')):
+        if not column_exists('printers', column):
+            print(f"Adding {column} to printers...")
+            try:
+                db.session.execute(text(f"ALTER TABLE printers ADD COLUMN {column} {ddl}"))
+                db.session.commit()
+                print("Done.")
+            except Exception as e:
+                print(f"Error adding {column}: {e}")
+                db.session.rollback()
+        else:
+            print(f"{column} already exists in printers.")
+
+    # Dashboard and reports read only flight_counters: build it on first upgrade
+    try:
+        rebuilt = FlightCounterService.backfill()
+        print(f"Flight counters built for {rebuilt} flights." if rebuilt else "Flight counters already populated.")
+    except Exception as e:
+        print(f"Error building flight counters: {e}")
+        db.session.rollback()
+
     print("Schema update complete.")
@@ -7,6 +7,11 @@
 """
 
 from .qr_service import QRService
+from .qr_cache import QRCache
+from .pdf_render_pool import PdfRenderPool
+from .pdf_stream_writer import PdfStreamWriter
+from .pdf_cache import PdfCache
+from .branding_service import BrandingService
 from .user_service import UserService
 from .flight_service import FlightService
 from .gopass_service import GoPassService
@@ -14,5 +19,18 @@ from .finance_service import FinanceService
 from .telegram_service import TelegramService
 from .mock_payment_service import MockPaymentService
 from .settings_service import SettingsService
+from .gate_session_service import GateSessionService
+from .access_log_journal import AccessLogJournal
+from .token_signing_service import TokenSigningService
+from .token_pack_service import TokenPackService
+from .flight_counter_service import FlightCounterService
+from .offline_sync_service import OfflineSyncService
+from .scan_index_service import ScanIndexService
+from .scan_metrics import ScanMetrics
+from .pass_number_service import PassNumberService
+from .stripe_event_service import StripeEventService
+from .fulfilment_service import FulfilmentService
+from .escpos_service import EscPosService
+from .print_spooler_service import PrintSpoolerService
 
-__all__ = ['QRService', 'UserService', 'FlightService', 'GoPassService', 'FinanceService', 'TelegramService', 'MockPaymentService', 'SettingsService']
+__all__ = ['QRService', 'QRCache', 'PdfRenderPool', 'PdfStreamWriter', 'PdfCache', 'BrandingService', 'UserService', 'FlightService', 'GoPassService', 'FinanceService', 'TelegramService', 'MockPaymentService', 'SettingsService', 'GateSessionService', 'AccessLogJournal', 'TokenSigningService', 'TokenPackService', 'FlightCounterService', 'OfflineSyncService', 'ScanIndexService', 'ScanMetrics', 'PassNumberService', 'StripeEventService', 'FulfilmentService', 'EscPosService', 'PrintSpoolerService']
@@ -0,0 +1,320 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for access_log_journal.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from models import db, AccessLog
+from services.flight_counter_service import FlightCounterService
+from sqlalchemy import insert
+from datetime import datetime
+from flask import current_app
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class AccessLogJournal:
+    """
+    Write-behind journal for AccessLog rows of scans that change no state
+    (INVALID, ALREADY_SCANNED, WRONG_FLIGHT, EXPIRED).
+
+    Each row is appended to a local spool file before it is buffered, so a
+    worker that dies before the next group commit loses nothing: the next
+    worker to start replays spool files left behind by dead processes.
+    Spool names carry the pid and a random token drawn at process start,
+    so a worker that inherits a dead worker's pid never appends to or
+    deletes its files; recovery runs before a process opens its first
+    spool.
+    A background thread inserts the buffer in one statement when it reaches
+    ACCESS_LOG_FLUSH_SIZE rows or every ACCESS_LOG_FLUSH_INTERVAL seconds.
+
+    Delivery is at-least-once: a crash between the INSERT commit and the
+    spool deletion replays that batch once more.
+    """
+
+    SPOOL_PREFIX = 'access_log'
+
+    _process = None # (pid, token) of this process, drawn again after a fork
+
+    def __init__(self, app):
+        self.app = app
+        self.spool_dir = app.config.get('ACCESS_LOG_SPOOL_DIR') or os.path.join(app.instance_path, 'spool')
+        self.flush_size = int(app.config.get('ACCESS_LOG_FLUSH_SIZE', 200))
+        self.flush_interval = float(app.config.get('ACCESS_LOG_FLUSH_INTERVAL', 2.0))
+        self.fsync = app.config.get('ACCESS_LOG_SPOOL_FSYNC', False)
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._buffer = []
+        self._sealed = []
+        self._spool = None
+        self._spool_path = None
+        self._seq = 0
+        self._pid = None
+        self._thread = None
+        self._recover_lock = threading.Lock()
+        self._recovered_pid = None
+
+    @staticmethod
+    def init_app(app):
+        journal = AccessLogJournal(app)
+        app.extensions['access_log_journal'] = journal
+        if journal.is_enabled():
+            journal._recover_once()
+        return journal
+
+    @classmethod
+    def _identity(cls):
+        """'<pid>.<token>' naming the spool files of this process."""
+        pid = os.getpid()
+        if cls._process is None or cls._process[0] != pid:
+            cls._process = (pid, uuid.uuid4().hex[:12])
+        return f"{cls._process[0]}.{cls._process[1]}"
+
+    @staticmethod
+    def get():
+        return current_app.extensions.get('access_log_journal')
+
+    def is_enabled(self):
+        return self.app.config.get('ACCESS_LOG_WRITE_BEHIND', False)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def record(self, pass_id, validator_id, status, flight_id=None, validation_time=None, is_offline=False):
+        """
+        Spools and buffers one AccessLog row. Never touches the database.
+        Returns False when the spool cannot be written: the row is not kept
+        and the caller inserts it itself.
+        """
+        row = {
+            'pass_id': pass_id,
+            'validator_id': validator_id,
+            'validation_time': validation_time or datetime.utcnow(),
+            'status': status,
+            'is_offline': is_offline,
+            'flight_id': flight_id
+        }
+        line = json.dumps(dict(row, validation_time=row['validation_time'].isoformat())) + '\n'
+
+        self._recover_once()
+        with self._lock:
+            try:
+                spool = self._open_spool()
+                spool.write(line)
+                spool.flush()
+                if self.fsync:
+                    os.fsync(spool.fileno())
+            except OSError as e:
+                logger.error(f"AccessLog journal spool write failed, row inserted synchronously: {e}")
+                self._drop_spool()
+                return False
+            self._buffer.append(row)
+            should_flush = len(self._buffer) >= self.flush_size
+
+        self._ensure_worker()
+        if should_flush:
+            self._wakeup.set()
+        return True
+
+    def flush(self):
+        """Inserts every buffered row in one statement. Returns the row count."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return 0
+                rows = self._buffer
+                self._buffer = []
+                self._seal_spool()
+                segments = list(self._sealed)
+
+            try:
+                self._insert(rows)
+            except Exception as e:
+                logger.error(f"AccessLog journal flush failed, {len(rows)} rows kept in spool: {e}")
+                with self._lock:
+                    self._buffer = rows + self._buffer
+                return 0
+
+            with self._lock:
+                self._sealed = [s for s in self._sealed if s not in segments]
+            for segment in segments:
+                self._remove(segment)
+
+            return len(rows)
+
+    def _recover_once(self):
+        """Replays orphaned spools once per process, before it writes its own."""
+        if self._recovered_pid == os.getpid():
+            return
+        with self._recover_lock:
+            if self._recovered_pid == os.getpid():
+                return
+            try:
+                self.recover()
+            except Exception as e:
+                logger.error(f"AccessLog journal recovery failed: {e}")
+            self._recovered_pid = os.getpid()
+
+    def recover(self):
+        """Replays spool files left by workers that are no longer running."""
+        recovered = 0
+        identity = self._identity()
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, f'{self.SPOOL_PREFIX}.*'))):
+            if not self._is_orphan(path, identity):
+                continue
+
+            # Claimed by renaming it into our own name: of two workers
+            # recovering at once, only one gets the file. If we die now,
+            # the renamed file is an orphan of ours and is recovered later.
+            with self._lock:
+                self._seq += 1
+                claimed = os.path.join(self.spool_dir, f'{self.SPOOL_PREFIX}.{identity}.{self._seq}.spool')
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+
+            rows = self._read_spool(claimed)
+            try:
+                if rows:
+                    self._insert(rows)
+            except Exception as e:
+                logger.error(f"AccessLog journal recovery failed for {path}: {e}")
+                with self._lock:
+                    self._sealed.append(claimed) # Retried with the next flush of this worker
+                    self._buffer = rows + self._buffer
+                continue
+
+            self._remove(claimed)
+            recovered += len(rows)
+
+        if recovered:
+            logger.info(f"AccessLog journal recovered {recovered} rows from orphaned spool files")
+        return recovered
+
+    def _is_orphan(self, path, identity):
+        """Spool of a dead process: same pid under another token, or a pid no longer running."""
+        pid, token = self._owner(path)
+        if pid is None:
+            return False
+        if pid == os.getpid():
+            # Our pid: ours if the token matches, else a dead predecessor's
+            return f"{pid}.{token}" != identity
+        return not self._is_alive(pid)
+
+    def _insert(self, rows):
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(AccessLog), rows)
+                FlightCounterService.record_scans(rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+    def _open_spool(self):
+        # Must hold self._lock
+        if self._spool is None:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._seq += 1
+            self._spool_path = os.path.join(
+                self.spool_dir, f'{self.SPOOL_PREFIX}.{self._identity()}.{self._seq}.spool'
+            )
+            self._spool = open(self._spool_path, 'a', encoding='utf-8')
+        return self._spool
+
+    def _seal_spool(self):
+        # Must hold self._lock. The sealed segment is deleted once its rows are committed.
+        if self._spool is not None:
+            self._spool.close()
+            self._sealed.append(self._spool_path)
+            self._spool = None
+            self._spool_path = None
+
+    def _drop_spool(self):
+        # Must hold self._lock. After a failed write the next row opens a new
+        # spool; this one is sealed as is, its complete rows are still buffered.
+        spool, self._spool = self._spool, None
+        if spool is not None:
+            self._sealed.append(self._spool_path)
+            self._spool_path = None
+            try:
+                spool.close()
+            except OSError:
+                pass
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='access-log-journal', daemon=True)
+            self._thread.start()
+
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    @staticmethod
+    def _read_spool(path):
+        rows = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    # Torn write from the crash that orphaned this file
+                    continue
+                data['validation_time'] = datetime.fromisoformat(data['validation_time'])
+                data.setdefault('flight_id', None)
+                rows.append(data)
+        return rows
+
+    @staticmethod
+    def _owner(path):
+        """(pid, token) of a '<prefix>.<pid>.<token>.<seq>.spool' name, (None, None) otherwise."""
+        parts = os.path.basename(path).split('.')
+        if len(parts) != 5:
+            return None, None
+        try:
+            return int(parts[1]), parts[2]
+        except ValueError:
+            return None, None
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
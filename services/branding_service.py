@@ -0,0 +1,184 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for branding_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from models import db, AppConfig
+from reportlab.lib.utils import ImageReader
+from flask import current_app, has_app_context
+from PIL import Image
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Logos are drawn 2.5 cm wide at most: 400 px is above 400 dpi
+LOGO_MAX_PIXELS = 400
+
+
+class BrandingService:
+    """
+    Process-wide cache of the ticket branding: logo paths resolved from
+    AppConfig, their version (path, mtime, size: part of the PDF ETags) and
+    the decoded logos, scaled down to their printed size.
+
+    Rendering a ticket reads it without any query or file access. The cache
+    is dropped by invalidate() (logo upload, settings change) in the worker
+    that handles the change, which also rewrites a marker file
+    (BRANDING_MARKER_FILE): the other workers stat it on each get() and reload at
+    once when it changed, else after BRANDING_CACHE_TTL seconds. The new
+    logo_version changes the PDF cache keys, so no worker serves a ticket
+    rendered with the old logo.
+    """
+
+    _lock = threading.Lock()
+    _cache = None
+    _cache_timestamp = None
+    _cache_marker = None
+    _images = {} # json(logo_version) -> decoded logos, also filled in PdfRenderPool workers
+
+    @classmethod
+    def invalidate(cls):
+        with cls._lock:
+            cls._cache = None
+            cls._cache_timestamp = None
+            cls._images = {}
+        if has_app_context():
+            cls._bump_marker()
+
+    @staticmethod
+    def _marker_path():
+        return current_app.config.get('BRANDING_MARKER_FILE') or os.path.join(current_app.instance_path, 'branding.version')
+
+    @staticmethod
+    def _bump_marker():
+        """Tells the other workers of this host to reload the branding."""
+        path = BrandingService._marker_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(str(time.time_ns()))
+        except OSError as e:
+            logger.warning(f"Branding marker not written ({path}): {e}")
+
+    @staticmethod
+    def _read_marker():
+        try:
+            stat = os.stat(BrandingService._marker_path())
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    @classmethod
+    def get(cls):
+        """{'logo_paths': (rva, gopass), 'logo_version': [...], 'images': (rva, gopass)}"""
+        ttl = current_app.config.get('BRANDING_CACHE_TTL', 300)
+        now = time.monotonic()
+        marker = BrandingService._read_marker()
+        cache = cls._cache
+        if cache is not None and marker == cls._cache_marker and (not ttl or now - cls._cache_timestamp < ttl):
+            return cache
+
+        logo_paths = BrandingService.resolve_logo_paths()
+        logo_version = BrandingService.logo_version(logo_paths)
+        cache = {
+            'logo_paths': logo_paths,
+            'logo_version': logo_version,
+            'images': BrandingService.logo_images(logo_paths, logo_version)
+        }
+        with cls._lock:
+            cls._cache = cache
+            cls._cache_timestamp = now
+            cls._cache_marker = marker
+        return cache
+
+    @staticmethod
+    def resolve_logo_paths():
+        """
+        Resolves the paths for RVA and GoPass logos.
+        Returns a tuple (logo_rva_path, logo_gopass_path).
+        Paths are verified to exist; returns None if not found.
+        """
+        # Logo RVA
+        rva_conf = db.session.get(AppConfig, 'logo_rva_url')
+        logo_rva = None
+        if rva_conf and rva_conf.value and rva_conf.value.startswith('/static/'):
+            logo_rva = os.path.join(current_app.static_folder, rva_conf.value.replace('/static/', '', 1))
+
+        if not logo_rva or not os.path.exists(logo_rva):
+            logo_rva = os.path.join(current_app.static_folder, 'img/logo_rva.png')
+
+        if not os.path.exists(logo_rva):
+            logo_rva = None
+
+        # Logo GoPass
+        gopass_conf = db.session.get(AppConfig, 'logo_gopass_ticket_url')
+        if not gopass_conf or not gopass_conf.value:
+            gopass_conf = db.session.get(AppConfig, 'logo_gopass_url')
+
+        logo_gopass = None
+        if gopass_conf and gopass_conf.value and gopass_conf.value.startswith('/static/'):
+            logo_gopass = os.path.join(current_app.static_folder, gopass_conf.value.replace('/static/', '', 1))
+
+        if not logo_gopass or not os.path.exists(logo_gopass):
+            logo_gopass = os.path.join(current_app.static_folder, 'img/logo_gopass.png')
+
+        if not os.path.exists(logo_gopass):
+            logo_gopass = None
+
+        return logo_rva, logo_gopass
+
+    @staticmethod
+    def logo_version(logo_paths):
+        """Identifies the logo files: a re-upload (even under the same name) changes it."""
+        version = []
+        for path in logo_paths:
+            try:
+                stat = os.stat(path)
+                version.append([path, stat.st_mtime_ns, stat.st_size])
+            except (TypeError, OSError):
+                version.append(None)
+        return version
+
+    @classmethod
+    def logo_images(cls, logo_paths, logo_version=None):
+        """
+        Decoded logos of logo_paths, kept per logo_version. Needs no
+        application context: PdfRenderPool workers decode once per version.
+        """
+        if logo_version is None:
+            return tuple(BrandingService._decode(path) for path in logo_paths)
+
+        key = json.dumps(logo_version)
+        images = cls._images.get(key)
+        if images is None:
+            images = tuple(BrandingService._decode(path) for path in logo_paths)
+            with cls._lock:
+                cls._images = {key: images} # Older versions are no longer drawn
+        return images
+
+    @staticmethod
+    def _decode(path):
+        """
+        ImageReader of the logo scaled down to LOGO_MAX_PIXELS, decoded once.
+        Returns the original path if loading fails.
+        """
+        if not path:
+            return path
+        try:
+            with Image.open(path) as image:
+                image.load()
+                if max(image.size) > LOGO_MAX_PIXELS:
+                    image.thumbnail((LOGO_MAX_PIXELS, LOGO_MAX_PIXELS), Image.LANCZOS)
+                reader = ImageReader(image.copy())
+            reader.getRGBData() # Decoded now, not on the first page drawn
+            return reader
+        except Exception as e:
+            logger.warning(f"Logo {path} could not be loaded: {e}")
+            return path
@@ -0,0 +1,105 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for escpos_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from services.qr_service import QRService
+from utils.i18n import get_text
+
+ESC = b'\x1b'
+GS = b'\x1d'
+
+INIT = ESC + b'@'
+CODEPAGE_WPC1252 = ESC + b't\x10'
+ALIGN_LEFT = ESC + b'a\x00'
+ALIGN_CENTER = ESC + b'a\x01'
+BOLD_ON = ESC + b'E\x01'
+BOLD_OFF = ESC + b'E\x00'
+SIZE_NORMAL = GS + b'!\x00'
+SIZE_DOUBLE_HEIGHT = GS + b'!\x01'
+SIZE_DOUBLE = GS + b'!\x11'
+FEED_AND_CUT = GS + b'V\x42\x03' # Feed 3 lines, partial cut
+
+LINE_WIDTH = 48 # Font A characters on 80 mm paper
+DOTS_PER_MM = 8 # 203 dpi
+QR_SIZE_MM = 40
+
+
+class EscPosService:
+    """
+    Thermal ticket as raw ESC/POS commands, for network receipt printers.
+
+    Same content and order as the 80 mm PDF of GoPassService
+    (_draw_ticket_layout, fmt='thermal'): the printer uses its own fonts and
+    draws the QR code itself from the payload (GS ( k), so a ticket is a few
+    hundred bytes and prints without a browser or a print dialog. The logo
+    is left out: printer fonts carry the header text instead.
+    """
+
+    @staticmethod
+    def _text(text):
+        return text.encode('cp1252', errors='replace') + b'\n'
+
+    @staticmethod
+    def _qr(data):
+        """GS ( k: model 2, error correction M, module size fitting QR_SIZE_MM, then print."""
+        payload = data.encode('utf-8')
+        modules = len(QRService.matrix(data))
+        module_size = max(1, min(16, QR_SIZE_MM * DOTS_PER_MM // modules))
+        store_length = len(payload) + 3
+
+        def command(fn, params):
+            length = len(params) + 2
+            return GS + b'(k' + bytes([length % 256, length // 256, 49, fn]) + params
+
+        return b''.join([
+            command(65, b'\x32\x00'),                  # Model 2
+            command(67, bytes([module_size])),         # Module size (dots)
+            command(69, b'\x31'),                      # Error correction M, as the PDF
+            GS + b'(k' + bytes([store_length % 256, store_length // 256, 49, 80, 48]) + payload,
+            command(81, b'\x30')                       # Print
+        ])
+
+    @staticmethod
+    def render_ticket(ticket, lang='fr'):
+        """
+        ESC/POS bytes of one thermal ticket. ticket is the ticket_fields()
+        dict of a pass carrying its 'qr_data' (see GoPassService._bulk_ticket).
+        """
+        t = lambda k: get_text(k, lang)
+        out = [INIT, CODEPAGE_WPC1252, ALIGN_CENTER]
+
+        # 1. En-tête
+        out += [BOLD_ON, SIZE_DOUBLE_HEIGHT, EscPosService._text("RVA - GO PASS"), SIZE_NORMAL, BOLD_OFF]
+        out += [EscPosService._text(t('ticket_pdf.receipt_title')), EscPosService._text('-' * LINE_WIDTH)]
+
+        # 2. Détails du Vol
+        out += [BOLD_ON, SIZE_DOUBLE, EscPosService._text(f"{t('ticket_pdf.flight_label')} : {ticket['flight_number']}"), SIZE_NORMAL]
+        out += [EscPosService._text(f"{t('ticket_pdf.date_label')} : {ticket['departure_date']}")]
+        out += [EscPosService._text(f"DEP : {ticket['departure_airport']}"), BOLD_OFF, b'\n']
+
+        # 3. Détails Passager
+        passenger_name = ticket['passenger_name'].upper() if ticket['passenger_name'] else t('ticket_pdf.passenger_label')
+        out += [EscPosService._text(passenger_name), b'\n']
+
+        # 4. QR Code
+        out += [EscPosService._qr(ticket['qr_data']), b'\n']
+
+        # 5. Audit & Traçabilité
+        values = [
+            ('ticket_pdf.agent_id', ticket['agent_name'] or "Automate"),
+            ('ticket_pdf.terminal', "POS-001"), # Placeholder, as the PDF
+            ('ticket_pdf.time', ticket['issue_time'] or "N/A"),
+            ('ticket_pdf.trans', ticket['payment_ref'] or 'N/A'),
+            ('ticket_pdf.payment', ticket['payment_method'] or 'CASH')
+        ]
+        out.append(ALIGN_LEFT)
+        out += [EscPosService._text(f"{t(key)} : {value}") for key, value in values]
+
+        # 6. Pied de Ticket
+        out += [ALIGN_CENTER, b'\n', EscPosService._text(t('ticket_pdf.keep_ticket')), EscPosService._text("www.rva.cd")]
+        out.append(FEED_AND_CUT)
+        return b''.join(out)
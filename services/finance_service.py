@@ -6,61 +6,76 @@
  * Auditer par : La CyberConfiance, www.cyberconfiance.com
 """
 
-from models import db, GoPass, CashDeposit, MobileMoneyLog, User, PassType
-from sqlalchemy import func, and_
+from models import db, GoPass, Transaction, CashDeposit, MobileMoneyLog, User, PassType
+from sqlalchemy import func, and_, exists
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 import csv
 import io
 
+# Legacy sales wrote one Transaction per ticket within a single request:
+# tickets of one sale are issued this close together
+LEGACY_SALE_GAP = timedelta(milliseconds=250)
+# Slack between id order and issue order when closing a legacy sale
+LEGACY_SALE_HORIZON = timedelta(minutes=5)
+
+# Per-ticket transactions merged into a basket by migrate_basket_transactions
+# are kept for audit with this status and left out of the finance views
+SUPERSEDED = 'superseded'
+
 class FinanceService:
     @staticmethod
     def get_transactions(start_date=None, end_date=None, agent_id=None, payment_method=None, sales_channel=None):
-        query = GoPass.query
+        """Sales journal: one row per basket (Transaction), newest first."""
+        query = Transaction.query.options(joinedload(Transaction.agent))\
+            .filter(func.coalesce(Transaction.status, 'completed') != SUPERSEDED)
 
         if start_date:
             # Ensure start_date is a datetime object or parse it
             if isinstance(start_date, str):
                 start_date = datetime.strptime(start_date, '%Y-%m-%d')
-            query = query.filter(GoPass.issue_date >= start_date)
+            query = query.filter(Transaction.created_at >= start_date)
 
         if end_date:
             if isinstance(end_date, str):
                 end_date = datetime.strptime(end_date, '%Y-%m-%d')
             # Set end date to end of day
             end_date = end_date.replace(hour=23, minute=59, second=59)
-            query = query.filter(GoPass.issue_date <= end_date)
+            query = query.filter(Transaction.created_at <= end_date)
 
         if agent_id:
-            query = query.filter(GoPass.sold_by == agent_id)
+            query = query.filter(Transaction.agent_id == agent_id)
 
         if payment_method:
-            query = query.filter(GoPass.payment_method == payment_method)
+            query = query.filter(Transaction.payment_method == payment_method)
 
         if sales_channel:
-             query = query.filter(GoPass.sales_channel == sales_channel)
+             query = query.filter(Transaction.sales_channel == sales_channel)
 
         # Order by newest first
-        return query.order_by(GoPass.issue_date.desc()).all()
+        return query.order_by(Transaction.created_at.desc()).all()
 
     @staticmethod
     def get_agent_balances():
         # Get all agents
         agents = User.query.filter_by(role='agent').all()
-        balances = []
 
-        for agent in agents:
-            # Theoretical Sales (Cash only)
-            sales_total = db.session.query(func.sum(GoPass.price))\
-                .filter(GoPass.sold_by == agent.id)\
-                .filter(GoPass.payment_method == 'Cash')\
-                .filter(GoPass.payment_status == 'paid')\
-                .scalar() or 0.0
-
-            # Deposited Amount
-            deposited_total = db.session.query(func.sum(CashDeposit.amount))\
-                .filter(CashDeposit.agent_id == agent.id)\
-                .scalar() or 0.0
+        # Theoretical Sales (Cash only), summed over baskets in one grouped query
+        sales = dict(db.session.query(Transaction.agent_id, func.sum(Transaction.amount_collected))
+            .filter(Transaction.payment_method == 'Cash')
+            .filter(Transaction.status == 'completed')
+            .group_by(Transaction.agent_id)
+            .all())
 
+        # Deposited Amount
+        deposits = dict(db.session.query(CashDeposit.agent_id, func.sum(CashDeposit.amount))
+            .group_by(CashDeposit.agent_id)
+            .all())
+
+        balances = []
+        for agent in agents:
+            sales_total = sales.get(agent.id) or 0.0
+            deposited_total = deposits.get(agent.id) or 0.0
             balance = sales_total - deposited_total
 
             balances.append({
@@ -87,8 +102,11 @@ class FinanceService:
 
     @staticmethod
     def get_reconciliation():
-        # Get all Mobile Money Passes
-        mm_passes = GoPass.query.filter(GoPass.payment_method.in_(['M-Pesa', 'Airtel', 'Orange'])).all()
+        # Get all Mobile Money baskets (one per payment, whatever its ticket count)
+        mm_transactions = Transaction.query.filter(
+            Transaction.payment_method.in_(['M-Pesa', 'Airtel', 'Orange']),
+            func.coalesce(Transaction.status, 'completed') != SUPERSEDED
+        ).all()
 
         # Get all Mobile Money Logs
         mm_logs = MobileMoneyLog.query.all()
@@ -98,37 +116,37 @@ class FinanceService:
 
         reconciliation_data = []
 
-        # Check Passes vs Logs
-        for gp in mm_passes:
-            log = log_map.get(gp.payment_ref)
+        # Check Baskets vs Logs
+        for t in mm_transactions:
+            log = log_map.get(t.provider_ref)
             status = 'matched'
             discrepancy = 0.0
 
             if not log:
                 status = 'missing_in_provider'
-            elif log.amount != gp.price:
+            elif abs(log.amount - t.amount_collected) >= 0.01:
                 status = 'amount_mismatch'
-                discrepancy = gp.price - log.amount
+                discrepancy = t.amount_collected - log.amount
             elif log.status != 'success':
                 status = 'provider_failed'
 
             reconciliation_data.append({
-                'type': 'pass',
-                'id': gp.id,
-                'date': gp.issue_date,
-                'ref': gp.payment_ref,
-                'amount_sys': gp.price,
+                'type': 'transaction',
+                'id': t.id,
+                'date': t.created_at,
+                'ref': t.provider_ref,
+                'amount_sys': t.amount_collected,
                 'amount_provider': log.amount if log else 0.0,
-                'provider': gp.payment_method,
+                'provider': t.payment_method,
                 'status': status,
                 'discrepancy': discrepancy,
                 'color': 'green' if status == 'matched' else 'red'
             })
 
-        # Check Logs vs Passes (Orphans)
-        pass_refs = {gp.payment_ref for gp in mm_passes}
+        # Check Logs vs Baskets (Orphans)
+        transaction_refs = {t.provider_ref for t in mm_transactions}
         for log in mm_logs:
-            if log.transaction_ref not in pass_refs:
+            if log.transaction_ref not in transaction_refs:
                 reconciliation_data.append({
                     'type': 'log',
                     'id': log.id,
@@ -144,6 +162,121 @@ class FinanceService:
 
         return reconciliation_data
 
+    @staticmethod
+    def migrate_basket_transactions(batch_size=500, dry_run=True):
+        """
+        Regroups tickets sold before baskets existed, when every GoPass had
+        its own Transaction. Tickets of one sale (same payment_ref, seller,
+        method, currency and flight, issued less than LEGACY_SALE_GAP apart:
+        a legacy sale wrote all its rows in one request) are attached to a
+        single Transaction, the oldest one, whose amount and ticket count
+        become the basket totals. The emptied transactions are kept with
+        status SUPERSEDED and source_metadata['superseded_by'] set to the
+        basket id. Tickets without any transaction get a basket created from
+        their own fields. Two sales that shared a reference second stay
+        apart unless they were issued within the gap.
+
+        Tickets are read in id pages of batch_size rows and a basket is
+        written once no later ticket can join it, so memory stays bounded.
+
+        A dry run (the default) computes the same counts and rolls back.
+        Safe to run again: baskets already in shape are left untouched.
+        Returns (baskets written, transactions superseded).
+        """
+        counts = {'written': 0, 'superseded': 0, 'pending': 0}
+
+        def close(tickets):
+            FinanceService._write_basket(tickets, counts)
+            if counts['pending'] >= batch_size and not dry_run:
+                db.session.commit()
+                counts['pending'] = 0
+
+        open_sales = {}
+        last_id = 0
+        while True:
+            rows = db.session.query(
+                GoPass.id, GoPass.transaction_id, GoPass.payment_ref, GoPass.sold_by, GoPass.payment_method,
+                GoPass.currency, GoPass.flight_id, GoPass.price, GoPass.issue_date
+            ).filter(GoPass.id > last_id).order_by(GoPass.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            for row in rows:
+                # A ticket without payment reference cannot be matched: it stays on its own
+                if not row.payment_ref:
+                    close([row])
+                    continue
+
+                key = (row.payment_ref, row.sold_by, row.payment_method, row.currency, row.flight_id)
+                tickets = open_sales.get(key)
+                if tickets and row.issue_date and tickets[-1].issue_date \
+                        and row.issue_date - tickets[-1].issue_date > LEGACY_SALE_GAP:
+                    close(open_sales.pop(key))
+                    tickets = None
+                if tickets is None:
+                    tickets = open_sales[key] = []
+                tickets.append(row)
+
+            # Sales idle for LEGACY_SALE_HORIZON can take no later ticket
+            newest = max((row.issue_date for row in rows if row.issue_date), default=None)
+            if newest is not None:
+                for key in [k for k, t in open_sales.items() if t[-1].issue_date and t[-1].issue_date < newest - LEGACY_SALE_HORIZON]:
+                    close(open_sales.pop(key))
+
+        for tickets in open_sales.values():
+            close(tickets)
+
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+        return counts['written'], counts['superseded']
+
+    @staticmethod
+    def _write_basket(tickets, counts):
+        transaction_ids = sorted({t.transaction_id for t in tickets if t.transaction_id})
+        amount = sum(t.price or 0.0 for t in tickets)
+
+        if transaction_ids:
+            basket = db.session.get(Transaction, transaction_ids[0])
+            if (len(transaction_ids) == 1 and all(t.transaction_id for t in tickets)
+                    and basket.ticket_count == len(tickets) and abs((basket.amount_collected or 0.0) - amount) < 0.01):
+                return
+        else:
+            first = db.session.get(GoPass, tickets[0].id)
+            basket = Transaction(
+                agent_id=first.sold_by,
+                currency=first.currency,
+                payment_method=first.payment_method,
+                provider_ref=first.payment_ref,
+                status='completed',
+                sales_channel=first.sales_channel,
+                payment_reference=first.payment_ref,
+                created_at=first.issue_date
+            )
+            db.session.add(basket)
+            db.session.flush()
+
+        basket.amount_collected = amount
+        basket.ticket_count = len(tickets)
+        GoPass.query.filter(GoPass.id.in_([t.id for t in tickets]))\
+            .update({GoPass.transaction_id: basket.id}, synchronize_session=False)
+
+        merged = transaction_ids[1:]
+        if merged:
+            # Only transactions left without tickets are superseded; they stay for audit
+            for transaction in Transaction.query.filter(
+                Transaction.id.in_(merged),
+                ~exists().where(GoPass.transaction_id == Transaction.id)
+            ):
+                transaction.status = SUPERSEDED
+                transaction.source_metadata = dict(transaction.source_metadata or {}, superseded_by=basket.id)
+                counts['superseded'] += 1
+
+        counts['written'] += 1
+        counts['pending'] += 1
+
     @staticmethod
     def export_to_csv(data, headers, filename):
         output = io.StringIO()
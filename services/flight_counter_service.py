@@ -0,0 +1,189 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for flight_counter_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from models import db, FlightCounter, GoPass, AccessLog
+from sqlalchemy import func, case, update, insert, delete
+from sqlalchemy.dialects import postgresql, sqlite
+
+# AccessLog status -> rejection counter column
+REJECTION_COLUMNS = {
+    'INVALID': 'rejected_invalid',
+    'ALREADY_SCANNED': 'rejected_already_scanned',
+    'WRONG_FLIGHT': 'rejected_wrong_flight',
+    'EXPIRED': 'rejected_expired'
+}
+
+COUNTER_COLUMNS = ['sold', 'revenue', 'scanned'] + list(REJECTION_COLUMNS.values())
+
+# Only passes with this payment status count in revenue (as the reports)
+REVENUE_PAYMENT_STATUS = 'paid'
+
+
+class FlightCounterService:
+    """
+    Per-flight counters (sold, revenue, scanned, rejections by reason).
+
+    Increments are relative upserts (col = col + n) issued inside the caller's
+    transaction, so they commit or roll back with the sale or scan they count
+    and stay exact under concurrent gates. rebuild() recomputes them from
+    gopasses and access_logs to repair drift.
+    """
+
+    @staticmethod
+    def _upsert(rows):
+        """rows: [{'flight_id': id, <column>: delta, ...}] with the same keys."""
+        table = FlightCounter.__table__
+        columns = [key for key in rows[0] if key != 'flight_id']
+        dialect = db.session.get_bind().dialect.name
+
+        if dialect in ('postgresql', 'sqlite'):
+            dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = dialect_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.flight_id],
+                set_={col: table.c[col] + stmt.excluded[col] for col in columns}
+            )
+            db.session.execute(stmt, [
+                {col: row.get(col, 0) for col in COUNTER_COLUMNS} | {'flight_id': row['flight_id']}
+                for row in rows
+            ])
+            return
+
+        # Portable fallback: relative UPDATE, INSERT when the row is missing
+        for row in rows:
+            result = db.session.execute(
+                update(table)
+                .where(table.c.flight_id == row['flight_id'])
+                .values({col: table.c[col] + row[col] for col in columns})
+            )
+            if result.rowcount == 0:
+                db.session.execute(insert(table).values(
+                    {col: row.get(col, 0) for col in COUNTER_COLUMNS} | {'flight_id': row['flight_id']}
+                ))
+
+    @staticmethod
+    def increment(flight_id, **deltas):
+        if flight_id is None:
+            return
+        FlightCounterService._upsert([dict(deltas, flight_id=flight_id)])
+
+    @staticmethod
+    def increment_many(deltas_by_flight):
+        """deltas_by_flight: {flight_id: {column: delta}}"""
+        rows = [
+            {col: deltas.get(col, 0) for col in COUNTER_COLUMNS} | {'flight_id': flight_id}
+            for flight_id, deltas in deltas_by_flight.items()
+            if flight_id is not None
+        ]
+        if rows:
+            FlightCounterService._upsert(rows)
+
+    @staticmethod
+    def record_sale(flight_id, price, count=1, payment_status=REVENUE_PAYMENT_STATUS):
+        revenue = (price or 0.0) * count if payment_status == REVENUE_PAYMENT_STATUS else 0.0
+        FlightCounterService.increment(flight_id, sold=count, revenue=revenue)
+
+    @staticmethod
+    def record_scan(flight_id, status):
+        """Counts one scan outcome at the gate of flight_id."""
+        if status == 'VALID':
+            FlightCounterService.increment(flight_id, scanned=1)
+        elif status in REJECTION_COLUMNS:
+            FlightCounterService.increment(flight_id, **{REJECTION_COLUMNS[status]: 1})
+
+    @staticmethod
+    def record_scans(rows):
+        """Counts AccessLog-shaped dicts (flight_id, status) in one upsert."""
+        deltas = {}
+        for row in rows:
+            status = row.get('status')
+            column = 'scanned' if status == 'VALID' else REJECTION_COLUMNS.get(status)
+            if column and row.get('flight_id') is not None:
+                flight_deltas = deltas.setdefault(row['flight_id'], {})
+                flight_deltas[column] = flight_deltas.get(column, 0) + 1
+        FlightCounterService.increment_many(deltas)
+
+    @staticmethod
+    def get_counters(flight_ids):
+        """Returns {flight_id: FlightCounter} for the flights that have counters."""
+        if not flight_ids:
+            return {}
+        counters = FlightCounter.query.filter(FlightCounter.flight_id.in_(flight_ids)).all()
+        return {c.flight_id: c for c in counters}
+
+    @staticmethod
+    def get_scanned_counts(flight_ids):
+        return {flight_id: c.scanned for flight_id, c in FlightCounterService.get_counters(flight_ids).items()}
+
+    @staticmethod
+    def backfill():
+        """
+        Builds the counters of a database upgraded with passes or scans but
+        no flight_counters rows yet; the dashboard and reports read only
+        these. Returns the number of counter rows written, 0 if not needed.
+        """
+        if db.session.query(FlightCounter.flight_id).first() is not None:
+            return 0
+        if db.session.query(GoPass.id).first() is None and db.session.query(AccessLog.id).first() is None:
+            return 0
+        return FlightCounterService.rebuild()
+
+    @staticmethod
+    def rebuild(flight_ids=None):
+        """
+        Recomputes counters from the source tables. scanned counts passes
+        with a scan date; rejections count access logs at each gate flight.
+        Returns the number of counter rows written.
+        """
+        counters = {}
+
+        def row(flight_id):
+            return counters.setdefault(flight_id, {col: 0 for col in COUNTER_COLUMNS})
+
+        sales = db.session.query(
+            GoPass.flight_id,
+            func.count(GoPass.id),
+            func.sum(case((GoPass.payment_status == REVENUE_PAYMENT_STATUS, GoPass.price), else_=0.0)),
+            func.count(GoPass.scan_date)
+        ).group_by(GoPass.flight_id)
+        if flight_ids is not None:
+            sales = sales.filter(GoPass.flight_id.in_(flight_ids))
+
+        for flight_id, sold, revenue, scanned in sales.all():
+            counters_row = row(flight_id)
+            counters_row['sold'] = sold
+            counters_row['revenue'] = float(revenue or 0.0)
+            counters_row['scanned'] = scanned
+
+        rejections = db.session.query(
+            AccessLog.flight_id,
+            AccessLog.status,
+            func.count(AccessLog.id)
+        ).filter(
+            AccessLog.flight_id != None,
+            AccessLog.status.in_(list(REJECTION_COLUMNS))
+        ).group_by(AccessLog.flight_id, AccessLog.status)
+        if flight_ids is not None:
+            rejections = rejections.filter(AccessLog.flight_id.in_(flight_ids))
+
+        for flight_id, status, count in rejections.all():
+            row(flight_id)[REJECTION_COLUMNS[status]] = count
+
+        table = FlightCounter.__table__
+        clear = delete(table)
+        if flight_ids is not None:
+            clear = clear.where(table.c.flight_id.in_(flight_ids))
+        db.session.execute(clear)
+
+        if counters:
+            db.session.execute(insert(table), [
+                dict(values, flight_id=flight_id) for flight_id, values in counters.items()
+            ])
+        db.session.commit()
+
+        return len(counters)
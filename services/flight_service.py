@@ -179,6 +179,12 @@ class FlightService:
 
         flight.status = new_status
         db.session.commit()
+
+        # Closed flights must stop answering from the gate session cache
+        if new_status == 'closed':
+            from services.gate_session_service import GateSessionService
+            GateSessionService.invalidate(flight.id)
+
         return flight
 
     @staticmethod
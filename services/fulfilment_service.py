@@ -0,0 +1,296 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for fulfilment_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from models import db, FulfilmentJob, GoPass, Flight
+from services.finance_service import FinanceService
+from services.gopass_service import GoPassService
+from services.stripe_event_service import StripeEventService
+from sqlalchemy import update, or_, and_
+from datetime import datetime, timedelta
+from flask import current_app
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Delay before the n-th retry: 30 s, 1 min, 2 min, ... capped at 30 min
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 1800
+
+
+class LeaseLost(Exception):
+    """The job was taken over by another worker after this one's lease expired."""
+
+
+class FulfilmentService:
+    """
+    Fulfilment of paid web orders outside the Stripe webhook request.
+
+    The webhook only stores a FulfilmentJob (with its StripeEvent) and answers 200. Worker threads
+    (FULFILMENT_WORKERS per web worker, or scripts/fulfilment_worker.py)
+    claim queued jobs with a conditional UPDATE, so a job runs on one
+    worker at a time, then issue the tickets, render their PDFs and hand
+    them to delivery.
+
+    Each step is recorded on the job: tickets are issued in the same commit
+    that stores transaction_id, and delivered_count moves forward ticket by
+    ticket, so a retry resumes where the failed attempt stopped without
+    issuing or sending anything twice. Failures are retried with backoff up
+    to FULFILMENT_MAX_ATTEMPTS; a running job whose worker died is taken
+    over once its lease (FULFILMENT_LEASE_SECONDS) has expired.
+
+    A claim is identified by the attempt number it set: every write of a
+    step is a conditional UPDATE on (id, attempts) that also renews the
+    lease, so a slow worker whose job was taken over stops at its next step
+    instead of issuing or delivering alongside the new owner.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    @staticmethod
+    def init_app(app):
+        service = FulfilmentService(app)
+        app.extensions['fulfilment'] = service
+        if app.config.get('WORKERS_AUTOSTART'):
+            # Each web worker starts its threads with its first request (after
+            # the fork): jobs left queued by a restart run without a new order
+            app.before_request(service.start)
+        return service
+
+    @staticmethod
+    def get():
+        return current_app.extensions.get('fulfilment')
+
+    @staticmethod
+    def enqueue(event_id, event_type, payload, commit=True):
+        """
+        Stores the job and wakes the local workers. Returns the job.
+        With commit=False the caller commits, then calls notify().
+        """
+        job = FulfilmentJob(event_id=event_id, event_type=event_type, payload=payload)
+        db.session.add(job)
+        if commit:
+            db.session.commit()
+            FulfilmentService.notify()
+        else:
+            db.session.flush()
+        return job
+
+    @staticmethod
+    def notify():
+        """Wakes the workers of this process, starting them if needed."""
+        service = FulfilmentService.get()
+        if service is not None:
+            service.start()
+            service.wake()
+
+    # --- Workers ---
+
+    def start(self, workers=None):
+        """Starts the worker threads of this process (once per process)."""
+        workers = self.app.config.get('FULFILMENT_WORKERS', 2) if workers is None else workers
+        if workers <= 0 or (self._threads and self._pid == os.getpid()):
+            return
+
+        with self._lock:
+            if self._threads and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'fulfilment-{i}', daemon=True)
+                for i in range(workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        poll_interval = float(self.app.config.get('FULFILMENT_POLL_INTERVAL', 5.0))
+        with self.app.app_context():
+            while True:
+                try:
+                    processed = self.run_pending()
+                except Exception as e:
+                    logger.error(f"Fulfilment worker error: {e}")
+                    db.session.rollback()
+                    processed = 0
+                finally:
+                    db.session.remove()
+
+                if not processed:
+                    self._wakeup.wait(poll_interval)
+                    self._wakeup.clear()
+
+    def run_pending(self, max_jobs=None):
+        """Claims and processes due jobs until none is left. Returns the number processed."""
+        processed = 0
+        while max_jobs is None or processed < max_jobs:
+            claimed = self.claim()
+            if claimed is None:
+                break
+            self.process(*claimed)
+            processed += 1
+        return processed
+
+    def _claimable(self, now):
+        lease = timedelta(seconds=self.app.config.get('FULFILMENT_LEASE_SECONDS', 300))
+        return or_(
+            and_(FulfilmentJob.status == 'queued', FulfilmentJob.run_after <= now),
+            and_(FulfilmentJob.status == 'running', FulfilmentJob.started_at < now - lease)
+        )
+
+    def claim(self):
+        """Marks one due job as running for this worker. Returns (job id, attempt), or None."""
+        now = datetime.utcnow()
+        candidates = db.session.query(FulfilmentJob.id, FulfilmentJob.event_id, FulfilmentJob.attempts)\
+            .filter(self._claimable(now))\
+            .order_by(FulfilmentJob.id)\
+            .limit(10)\
+            .all()
+
+        for job_id, event_id, attempts in candidates:
+            # Conditional UPDATE: only one worker wins a given job
+            result = db.session.execute(
+                update(FulfilmentJob)
+                .where(FulfilmentJob.id == job_id, FulfilmentJob.attempts == attempts, self._claimable(now))
+                .values(status='running', started_at=now, attempts=attempts + 1)
+            )
+            if result.rowcount == 1:
+                StripeEventService.mark(event_id, 'processing')
+                db.session.commit()
+                return job_id, attempts + 1
+            db.session.commit()
+        return None
+
+    @staticmethod
+    def _fenced(job_id, attempt):
+        """UPDATE of the job that applies only while the claim of attempt still owns it."""
+        return update(FulfilmentJob).where(
+            FulfilmentJob.id == job_id,
+            FulfilmentJob.attempts == attempt,
+            FulfilmentJob.status == 'running'
+        )
+
+    def _write(self, job_id, attempt, **values):
+        """Fenced write renewing the lease (a bare call is a heartbeat). Raises LeaseLost."""
+        result = db.session.execute(
+            FulfilmentService._fenced(job_id, attempt).values(started_at=datetime.utcnow(), **values)
+        )
+        if result.rowcount != 1:
+            raise LeaseLost(f"Fulfilment job {job_id}: attempt {attempt} no longer owns the job")
+
+    # --- Steps ---
+
+    def process(self, job_id, attempt):
+        job = db.session.get(FulfilmentJob, job_id)
+        event_id, transaction_id, delivered_count = job.event_id, job.transaction_id, job.delivered_count
+        try:
+            if transaction_id is None:
+                gopasses = FulfilmentService.issue_tickets(job.payload)
+                transaction_id = gopasses[0].transaction_id
+                # Same commit as the tickets: a lost claim discards them
+                self._write(job_id, attempt, transaction_id=transaction_id, ticket_count=len(gopasses))
+                db.session.commit()
+
+            tickets = GoPass.query.filter_by(transaction_id=transaction_id).order_by(GoPass.id).all()
+            for gopass in tickets[delivered_count:]:
+                pdf_bytes = GoPassService.generate_pdf_bytes(gopass)
+                self._write(job_id, attempt) # Still ours before anything is sent
+                db.session.commit()
+                FulfilmentService.deliver(job, gopass, pdf_bytes)
+                self._write(job_id, attempt, delivered_count=FulfilmentJob.delivered_count + 1)
+                db.session.commit()
+
+            self._write(job_id, attempt, status='done', last_error=None, finished_at=datetime.utcnow())
+            StripeEventService.mark(event_id, 'processed')
+            db.session.commit()
+
+        except LeaseLost as e:
+            db.session.rollback()
+            logger.warning(f"{e}: stopped")
+
+        except Exception as e:
+            db.session.rollback()
+            # Bad order data will not fix itself: no retry
+            self._fail(job_id, attempt, e, permanent=isinstance(e, ValueError))
+
+    def _fail(self, job_id, attempt, error, permanent=False):
+        job = db.session.get(FulfilmentJob, job_id)
+        last_error = f"{error.__class__.__name__}: {error}"
+        max_attempts = self.app.config.get('FULFILMENT_MAX_ATTEMPTS', 5)
+
+        if permanent or attempt >= max_attempts:
+            values = dict(status='failed', finished_at=datetime.utcnow())
+            event_status = 'failed'
+        else:
+            delay = min(RETRY_BASE_SECONDS * 2 ** (attempt - 1), RETRY_MAX_SECONDS)
+            values = dict(status='queued', run_after=datetime.utcnow() + timedelta(seconds=delay))
+            event_status = 'received'
+
+        result = db.session.execute(FulfilmentService._fenced(job_id, attempt).values(last_error=last_error, **values))
+        if result.rowcount == 1:
+            StripeEventService.mark(job.event_id, event_status)
+            if event_status == 'failed':
+                logger.error(f"Fulfilment job {job_id} failed after {attempt} attempt(s): {last_error}")
+        db.session.commit()
+
+    @staticmethod
+    def issue_tickets(intent):
+        """Creates the basket and passes of a succeeded payment intent (uncommitted)."""
+        metadata = intent.get('metadata') or {}
+        try:
+            flight_id = int(metadata.get('flight_id'))
+        except (TypeError, ValueError):
+            raise ValueError("Vol invalide")
+        try:
+            quantity = max(1, int(metadata.get('quantity', 1)))
+        except (TypeError, ValueError):
+            quantity = 1
+
+        passenger = {
+            'passenger_name': metadata.get('passenger_name'),
+            'passenger_passport': metadata.get('passport', 'UNKNOWN')
+        }
+
+        flight = db.session.get(Flight, flight_id)
+        if flight is None:
+            raise ValueError("Vol invalide")
+
+        # Tariff price, as charged when the intent was created; Stripe
+        # amounts are in the smallest currency unit
+        currency = (intent.get('currency') or 'usd').upper()
+        price = FinanceService.calculate_flight_price(flight, currency)
+        if intent.get('amount') is not None and intent['amount'] != int(price * quantity * 100):
+            logger.warning(
+                f"Payment intent {intent['id']} amount {intent['amount']} differs from the tariff "
+                f"{price} {currency} x {quantity}"
+            )
+
+        return GoPassService.create_gopasses_bulk(
+            flight_id=flight_id,
+            passengers=[passenger] * quantity,
+            price=price,
+            currency=currency,
+            payment_method='STRIPE',
+            payment_ref=intent['id'],
+            sales_channel='web',
+            commit=False
+        )
+
+    @staticmethod
+    def deliver(job, gopass, pdf_bytes):
+        # Send Email (Stub)
+        logger.info(f"STUB: Sending email to customer for Ticket {gopass.pass_number} ({len(pdf_bytes)} bytes, job {job.id})")
@@ -0,0 +1,187 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for gate_session_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from models import db, GoPass, Flight
+from datetime import datetime, timedelta
+from flask import current_app
+import threading
+import time
+
+# Cap on cached "token not found" answers per session, so a flood of forged
+# QR codes cannot grow the worker memory without bound.
+MAX_NEGATIVE_ENTRIES = 10000
+
+
+class GateSession:
+    """
+    In-memory snapshot of the tokens a gate can meet while boarding one flight.
+
+    entries: token -> (pass_id, status, flight_id, flight_number, flight_date)
+    A value of None records a token known to be absent from the database.
+    """
+
+    def __init__(self, flight, entries, ttl):
+        self.flight_id = flight.id
+        self.flight_number = flight.flight_number
+        self.flight_date = flight.departure_time.date()
+        self.closed = flight.status == 'closed'
+        self.entries = entries
+        self.expires_at = datetime.utcnow() + ttl
+        self.negative_count = 0
+        self.checked_at = time.monotonic() # Last read of the flight status
+        self.lock = threading.Lock()
+
+    def is_expired(self):
+        return datetime.utcnow() >= self.expires_at
+
+    def lookup(self, token):
+        """Returns (found, entry). found is False when the token was never seen."""
+        if token in self.entries:
+            return True, self.entries[token]
+        return False, None
+
+    def remember(self, token, entry):
+        """Caches a database answer for a token that missed the preloaded map."""
+        with self.lock:
+            if entry is None:
+                if self.negative_count >= MAX_NEGATIVE_ENTRIES:
+                    return
+                self.negative_count += 1
+            self.entries[token] = entry
+
+    def set_status(self, token, status):
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry:
+                self.entries[token] = (entry[0], status) + entry[2:]
+
+
+class GateSessionService:
+    """
+    Per-flight gate sessions held in worker memory.
+
+    A session is opened by the scanner when it selects a flight
+    (/ops/scanner/session/<id>) and answers the INVALID, WRONG_FLIGHT and
+    EXPIRED cases without touching the database; scans of a flight without
+    a session take the normal lookup. Consumption itself always goes through
+    a conditional UPDATE, so it stays atomic across workers; the cached
+    status is only a hint.
+
+    Closing the flight drops the session of the worker that handles it. The
+    other workers re-read the flight status every GATE_SESSION_CHECK_INTERVAL
+    seconds (one primary key read), so they stop answering for a closed
+    flight within that window; the whole map expires after GATE_SESSION_TTL.
+    """
+
+    DEFAULT_TTL = 360
+    DEFAULT_CHECK_INTERVAL = 5
+
+    @staticmethod
+    def _registry():
+        return current_app.extensions.setdefault('gate_sessions', {})
+
+    @staticmethod
+    def _registry_lock():
+        return current_app.extensions.setdefault('gate_sessions_lock', threading.Lock())
+
+    @staticmethod
+    def is_enabled():
+        return current_app.config.get('GATE_SESSION_ENABLED', True)
+
+    @staticmethod
+    def open_session(flight_id):
+        """
+        Preloads the token map for a flight and registers it for this worker.
+        The map covers every pass sold for flights leaving the same airport on
+        the same day, so wrong-flight scans are answered from memory too.
+        """
+        flight = db.session.get(Flight, int(flight_id))
+        if not flight:
+            raise ValueError("Vol introuvable")
+
+        day_start = datetime.combine(flight.departure_time.date(), datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+
+        rows = db.session.query(
+            GoPass.token,
+            GoPass.id,
+            GoPass.status,
+            GoPass.flight_id,
+            Flight.flight_number,
+            Flight.departure_time
+        ).join(
+            Flight, GoPass.flight_id == Flight.id
+        ).filter(
+            Flight.departure_airport == flight.departure_airport,
+            Flight.departure_time >= day_start,
+            Flight.departure_time < day_end
+        ).all()
+
+        entries = {
+            token: (pass_id, status, pass_flight_id, flight_number, departure_time.date())
+            for token, pass_id, status, pass_flight_id, flight_number, departure_time in rows
+        }
+
+        ttl = timedelta(seconds=current_app.config.get('GATE_SESSION_TTL', GateSessionService.DEFAULT_TTL))
+        gate = GateSession(flight, entries, ttl)
+
+        with GateSessionService._registry_lock():
+            GateSessionService._registry()[flight.id] = gate
+
+        return gate
+
+    @staticmethod
+    def get_session(flight_id, auto_open=False):
+        """
+        Returns the live session for a flight, or None when there is none
+        (or gate session mode is disabled). auto_open opens a missing one.
+        """
+        if not GateSessionService.is_enabled():
+            return None
+
+        try:
+            flight_id = int(flight_id)
+        except (TypeError, ValueError):
+            return None
+
+        gate = GateSessionService._registry().get(flight_id)
+        if gate is not None and not gate.is_expired():
+            GateSessionService._check_status(gate)
+            return gate
+
+        if gate is not None:
+            GateSessionService.invalidate(flight_id)
+
+        if not auto_open:
+            return None
+
+        try:
+            return GateSessionService.open_session(flight_id)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _check_status(gate):
+        """Picks up a closure made in another worker, at most every check interval."""
+        interval = current_app.config.get('GATE_SESSION_CHECK_INTERVAL', GateSessionService.DEFAULT_CHECK_INTERVAL)
+        now = time.monotonic()
+        if now - gate.checked_at < interval:
+            return
+        status = db.session.query(Flight.status).filter(Flight.id == gate.flight_id).scalar()
+        gate.closed = status == 'closed'
+        gate.checked_at = now
+
+    @staticmethod
+    def invalidate(flight_id):
+        with GateSessionService._registry_lock():
+            GateSessionService._registry().pop(int(flight_id), None)
+
+    @staticmethod
+    def invalidate_all():
+        with GateSessionService._registry_lock():
+            GateSessionService._registry().clear()
@@ -6,14 +6,24 @@
  * Auditer par : La CyberConfiance, www.cyberconfiance.com
 """
 
-from models import db, GoPass, Flight, User, AccessLog, AppConfig, Transaction
-from datetime import datetime
+from models import db, GoPass, Flight, User, AccessLog, Transaction
+from datetime import datetime, timedelta
 import json
 import hashlib
 import uuid
 from services.qr_service import QRService
+from services.pdf_render_pool import PdfRenderPool
+from services.pdf_stream_writer import PdfStreamWriter
+from services.pdf_cache import PdfCache
+from services.branding_service import BrandingService
+from services.gate_session_service import GateSessionService
+from services.access_log_journal import AccessLogJournal
+from services.token_signing_service import TokenSigningService
+from services.flight_counter_service import FlightCounterService
+from services.scan_index_service import ScanIndexService
+from services.scan_metrics import ScanMetrics
+from services.pass_number_service import PassNumberService
 import io
-import qrcode
 import tempfile
 import os
 from reportlab.pdfgen import canvas
@@ -21,71 +31,221 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.units import cm, mm
 from reportlab.lib.utils import ImageReader
+from pypdf import PdfReader, PdfWriter
 from flask import current_app
-from utils.i18n import get_text
+from sqlalchemy import select, or_, text, update
+from utils.i18n import get_text, section_digest
+
+# Part of the cached PDF keys (ETags): bump it with any change to the drawing
+# of tickets, so that PDFs rendered with the old layout are never served
+TICKET_LAYOUT_VERSION = 1
+
+# PostgreSQL scan in one round trip: the data-modifying CTEs consume a valid
+# pass (guarded against closed flights), write the VALID access log, bump
+# the flight counter and upsert the pass into scan_index; the SELECT
+# returns the pre-scan snapshot the response needs for every other outcome.
+SINGLE_STATEMENT_SCAN = text("""
+WITH target AS (
+    SELECT id, status, departure_time FROM flights WHERE id = :flight_id
+),
+consumed AS (
+    UPDATE gopasses
+    SET status = 'consumed', scanned_by = :agent_id, scan_date = :scan_time, scan_location = :location,
+        updated_at = :scan_time
+    WHERE token = :token
+      AND status = 'valid'
+      AND flight_id = :flight_id
+      AND EXISTS (
+          SELECT 1 FROM flights
+          WHERE id = :flight_id AND (status IS NULL OR status <> 'closed')
+      )
+    RETURNING id, flight_id
+),
+logged AS (
+    INSERT INTO access_logs (pass_id, validator_id, validation_time, status, is_offline, flight_id)
+    SELECT id, :agent_id, :scan_time, 'VALID', false, flight_id FROM consumed
+),
+counted AS (
+    INSERT INTO flight_counters (flight_id, sold, revenue, scanned, rejected_invalid,
+                                 rejected_already_scanned, rejected_wrong_flight, rejected_expired)
+    SELECT flight_id, 0, 0, 1, 0, 0, 0, 0 FROM consumed
+    ON CONFLICT (flight_id) DO UPDATE SET scanned = flight_counters.scanned + 1
+),
+indexed AS (
+    INSERT INTO scan_index (token_digest, pass_id, flight_id, flight_date, departure_airport, status)
+    SELECT :digest, consumed.id, consumed.flight_id, CAST(f.departure_time AS DATE), f.departure_airport, 'consumed'
+    FROM consumed JOIN flights f ON f.id = consumed.flight_id
+    ON CONFLICT (token_digest) DO UPDATE SET status = 'consumed'
+)
+SELECT
+    target.id AS target_id,
+    target.status AS target_status,
+    target.departure_time AS target_departure,
+    g.id AS pass_id,
+    g.status,
+    g.flight_id,
+    g.passenger_name,
+    g.passenger_passport,
+    g.passenger_document_type,
+    g.scan_date,
+    g.scan_location,
+    scanner.username AS scanner_username,
+    f.flight_number,
+    f.departure_time,
+    consumed.id AS consumed_id
+FROM (SELECT 1) AS one
+LEFT JOIN target ON true
+LEFT JOIN gopasses g ON g.token = :token
+LEFT JOIN flights f ON f.id = g.flight_id
+LEFT JOIN users scanner ON scanner.id = g.scanned_by
+LEFT JOIN consumed ON true
+""")
 
 class GoPassService:
     @staticmethod
     def create_gopass(flight_id, passenger_name, passenger_passport, passenger_document_type='Passeport', price=50.0, currency='USD', payment_ref=None, payment_method='Cash', sold_by=None, sales_channel='counter', verification_source='manual', flight_details=None, commit=True, transaction_id=None, payment_reference=None, source_metadata=None):
-        flight = Flight.query.get(flight_id)
+        return GoPassService.create_gopasses_bulk(
+            flight_id,
+            [{
+                'passenger_name': passenger_name,
+                'passenger_passport': passenger_passport,
+                'passenger_document_type': passenger_document_type
+            }],
+            price=price,
+            currency=currency,
+            payment_ref=payment_ref,
+            payment_method=payment_method,
+            sold_by=sold_by,
+            sales_channel=sales_channel,
+            verification_source=verification_source,
+            flight_details=flight_details,
+            commit=commit,
+            transaction_id=transaction_id,
+            payment_reference=payment_reference,
+            source_metadata=source_metadata
+        )[0]
+
+    @staticmethod
+    def create_gopasses_bulk(flight_id, passengers, price=50.0, currency='USD', payment_ref=None, payment_method='Cash', sold_by=None, sales_channel='counter', verification_source='manual', flight_details=None, commit=True, transaction_id=None, payment_reference=None, source_metadata=None, idempotency_key=None):
+        """
+        Issues one pass per passenger on the same flight and payment.
+        passengers: [{'passenger_name', 'passenger_passport', 'passenger_document_type'?}]
+
+        The sale is one basket: a single Transaction for the payment, with
+        the passes as its line items (unless transaction_id attaches them to
+        an existing one). The flight is checked once, then the transaction
+        and the passes go out in a single flush, followed by one scan index
+        insert and one flight counter upsert. Returns the passes in
+        passenger order.
+
+        idempotency_key is stored on the new transaction so that a retried
+        request can be answered with find_sale() instead of selling again.
+        """
+        flight = db.session.get(Flight, flight_id)
         if not flight:
             raise ValueError("Vol invalide")
+        if not passengers:
+            raise ValueError("Aucun passager spécifié")
 
-        # Generate unique token
-        token_data = {
-            'flight_id': flight_id,
-            'passport': passenger_passport,
-            'timestamp': datetime.utcnow().isoformat(),
-            'nonce': str(uuid.uuid4())
-        }
-        token_string = json.dumps(token_data, sort_keys=True)
-        token_hash = hashlib.sha256(token_string.encode()).hexdigest()
+        # Tickets of one basket share its payment reference
+        payment_ref = payment_ref or f"PAY-{uuid.uuid4().hex[:8].upper()}"
 
         # Create Transaction Record for Audit
         # Always create transaction (even for Web/Self-Service where sold_by is None)
+        transaction = None
         if not transaction_id:
             transaction = Transaction(
                 agent_id=sold_by,
-                amount_collected=price,
+                amount_collected=price * len(passengers),
+                ticket_count=len(passengers),
                 currency=currency,
                 payment_method=payment_method,
-                provider_ref=payment_ref or f"PAY-{uuid.uuid4().hex[:8].upper()}",
+                provider_ref=payment_ref,
                 status='completed',
                 verification_source=verification_source,
                 flight_details=flight_details,
                 sales_channel=sales_channel,
                 payment_reference=payment_reference or payment_ref, # Use specific ref or fallback to generic
-                source_metadata=source_metadata
+                source_metadata=source_metadata,
+                idempotency_key=idempotency_key
             )
-            db.session.add(transaction)
-            db.session.flush() # Generate ID
-            transaction_id = transaction.id
-
-        # In a real system, we would sign this with a private key.
-        # For now, the hash acts as the secure token stored in DB.
-
-        gopass = GoPass(
-            token=token_hash,
-            flight_id=flight_id,
-            passenger_name=passenger_name,
-            passenger_passport=passenger_passport,
-            passenger_document_type=passenger_document_type,
-            price=price,
-            currency=currency,
-            payment_status='paid', # Assuming payment success for now
-            payment_ref=payment_ref or f"PAY-{uuid.uuid4().hex[:8].upper()}",
-            payment_method=payment_method,
-            sold_by=sold_by,
-            sales_channel=sales_channel,
-            status='valid',
-            transaction_id=transaction_id
-        )
 
-        db.session.add(gopass)
+        gopasses = []
+        for passenger in passengers:
+            passenger_name = passenger.get('passenger_name')
+            passenger_passport = passenger.get('passenger_passport')
+            if not passenger_name or not passenger_passport:
+                raise ValueError("Données passager incomplètes")
+
+            # Generate unique token
+            token_data = {
+                'flight_id': flight.id,
+                'passport': passenger_passport,
+                'timestamp': datetime.utcnow().isoformat(),
+                'nonce': str(uuid.uuid4())
+            }
+            token_string = json.dumps(token_data, sort_keys=True)
+            token_hash = hashlib.sha256(token_string.encode()).hexdigest()
+
+            # In a real system, we would sign this with a private key.
+            # For now, the hash acts as the secure token stored in DB.
+
+            gopass = GoPass(
+                token=token_hash,
+                flight_id=flight.id,
+                passenger_name=passenger_name,
+                passenger_passport=passenger_passport,
+                passenger_document_type=passenger.get('passenger_document_type') or 'Passeport',
+                price=price,
+                currency=currency,
+                payment_status='paid', # Assuming payment success for now
+                payment_ref=payment_ref,
+                payment_method=payment_method,
+                sold_by=sold_by,
+                sales_channel=sales_channel,
+                status='valid',
+                transaction_id=transaction_id
+            )
+            if transaction is not None:
+                gopass.transaction = transaction
+
+            gopasses.append(gopass)
+
+        numbers = PassNumberService.get().allocate(PassNumberService.prefix_for(flight), len(gopasses))
+        for gopass, number in zip(gopasses, numbers):
+            gopass.pass_number = number
+
+        db.session.add_all(gopasses)
+        db.session.flush() # Generate IDs for the scan index
+        ScanIndexService.add_many(gopasses, flight)
+        FlightCounterService.record_sale(flight.id, price, count=len(gopasses), payment_status=gopasses[0].payment_status)
         if commit:
             db.session.commit()
 
-        return gopass
+        return gopasses
+
+    @staticmethod
+    def find_sale(idempotency_key):
+        """(transaction, passes) of the sale recorded under idempotency_key, or (None, [])."""
+        transaction = Transaction.query.filter_by(idempotency_key=idempotency_key).first()
+        if not transaction:
+            return None, []
+        tickets = GoPass.query.filter_by(transaction_id=transaction.id).order_by(GoPass.id).all()
+        return transaction, tickets
+
+    @staticmethod
+    def expire_idempotency_keys(max_age_hours=None):
+        """Clears the idempotency keys of sales older than max_age_hours. Returns the number cleared."""
+        if max_age_hours is None:
+            max_age_hours = current_app.config.get('IDEMPOTENCY_KEY_TTL_HOURS', 24)
+        cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+        result = db.session.execute(
+            update(Transaction)
+            .where(Transaction.idempotency_key.isnot(None), Transaction.created_at < cutoff)
+            .values(idempotency_key=None)
+        )
+        db.session.commit()
+        return result.rowcount
 
     @staticmethod
     def get_gopass(gopass_id):
@@ -96,59 +256,47 @@ class GoPassService:
         return GoPass.query.filter_by(token=token).first()
 
     @staticmethod
-    def _get_logo_paths():
+    def token_digest(token):
+        """16-byte digest of a GoPass token, the key used by offline token packs."""
+        return ScanIndexService.digest(token)
+
+    @staticmethod
+    def resolve_token(token):
         """
-        Resolves the paths for RVA and GoPass logos.
-        Returns a tuple (logo_rva_path, logo_gopass_path).
-        Paths are verified to exist; returns None if not found.
+        Extracts the GoPass.token hash from scanned QR content.
+        Returns (lookup_token, token_data, signed); lookup_token is None when
+        a signed token fails verification.
         """
-        # Logo RVA
-        rva_conf = AppConfig.query.get('logo_rva_url')
-        logo_rva = None
-        if rva_conf and rva_conf.value and rva_conf.value.startswith('/static/'):
-            logo_rva = os.path.join(current_app.static_folder, rva_conf.value.replace('/static/', '', 1))
-
-        if not logo_rva or not os.path.exists(logo_rva):
-            logo_rva = os.path.join(current_app.static_folder, 'img/logo_rva.png')
-
-        if not os.path.exists(logo_rva):
-            logo_rva = None
-
-        # Logo GoPass
-        gopass_conf = AppConfig.query.get('logo_gopass_ticket_url')
-        if not gopass_conf or not gopass_conf.value:
-            gopass_conf = AppConfig.query.get('logo_gopass_url')
-
-        logo_gopass = None
-        if gopass_conf and gopass_conf.value and gopass_conf.value.startswith('/static/'):
-            logo_gopass = os.path.join(current_app.static_folder, gopass_conf.value.replace('/static/', '', 1))
-
-        if not logo_gopass or not os.path.exists(logo_gopass):
-            logo_gopass = os.path.join(current_app.static_folder, 'img/logo_gopass.png')
+        # Try to parse token as JSON if it matches the new format
+        lookup_token = token
+        token_data = {}
+        try:
+            if token and token.strip().startswith('{'):
+                token_data = json.loads(token)
+                if 'hash_signature' in token_data:
+                    lookup_token = token_data['hash_signature']
+        except Exception:
+            pass # Use original token string
 
-        if not os.path.exists(logo_gopass):
-            logo_gopass = None
+        signed = None
+        if TokenSigningService.is_signed(lookup_token):
+            signed = TokenSigningService.verify(lookup_token)
+            lookup_token = signed.token_hash if signed else None
 
-        return logo_rva, logo_gopass
+        return lookup_token, token_data, signed
 
     @staticmethod
-    def _load_image_resource(path):
+    def validate_gopass(token, flight_id, agent_id, location):
         """
-        Helper to load an image resource into memory (ImageReader) to avoid repeated I/O.
-        Returns the ImageReader object or the original path if loading fails.
+        Logic for validation (Cas A, B, C, D), timed per outcome by ScanMetrics
         """
-        if path:
-            try:
-                return ImageReader(path)
-            except Exception:
-                pass
-        return path
+        with ScanMetrics.measure(flight_id, location) as scan:
+            result = GoPassService._validate_gopass(token, flight_id, agent_id, location)
+            scan.outcome = result.get('code')
+        return result
 
     @staticmethod
-    def validate_gopass(token, flight_id, agent_id, location):
-        """
-        Logic for validation (Cas A, B, C, D)
-        """
+    def _validate_gopass(token, flight_id, agent_id, location):
         if not token or len(token) > 4096:
             return {
                 'status': 'error',
@@ -158,147 +306,93 @@ class GoPassService:
                 'data': None
             }
 
-        # Try to parse token as JSON if it matches the new format
-        lookup_token = token
-        try:
-            if token and token.strip().startswith('{'):
-                token_data = json.loads(token)
-                if 'hash_signature' in token_data:
-                    lookup_token = token_data['hash_signature']
-        except Exception:
-            pass # Use original token string
+        # Gate session: answer from the in-memory flight snapshot when the
+        # scanner has opened one; otherwise the normal lookup decides
+        gate = GateSessionService.get_session(flight_id, auto_open=False)
+
+        # Signed token: forged and retired-key tokens are rejected without a lookup
+        lookup_token, token_data, signed = GoPassService.resolve_token(token)
+        ScanMetrics.lap('resolve')
+        if lookup_token is None:
+            GoPassService._log_access(None, agent_id, 'INVALID', gate.flight_id if gate else None)
+            return GoPassService._invalid_response()
+
+        if signed is not None and str(signed.flight_id) != str(flight_id):
+            result = GoPassService._validate_signed_flight_mismatch(signed, token_data, gate, flight_id, agent_id)
+            if result is not None:
+                return result
+
+        if gate is not None:
+            result = GoPassService._validate_with_gate_session(gate, lookup_token, agent_id, location)
+            if result is not None:
+                return result
+
+        if db.session.get_bind().dialect.name == 'postgresql':
+            result = GoPassService._validate_single_statement(gate, lookup_token, flight_id, agent_id, location)
+            if result is not None:
+                return result
 
         # Check if flight is closed
         target_flight = Flight.query.get(flight_id)
         if target_flight and target_flight.status == 'closed':
-             return {
-                'status': 'error',
-                'code': 'FLIGHT_CLOSED',
-                'message': 'VOL CLÔTURÉ',
-                'color': 'red',
-                'data': None
-            }
+            return GoPassService._flight_closed_response()
+        gate_flight_id = target_flight.id if target_flight else None
 
-        try:
-            # Locking row to prevent race conditions (double scan)
-            gopass = GoPass.query.filter_by(token=lookup_token).with_for_update().first()
-        except Exception:
-            # Fallback for databases not supporting row-level locking (e.g. older SQLite)
+        # The narrow scan index classifies the scan; passes it does not hold
+        # yet (sold before it existed) are read from gopasses and indexed.
+        entry = ScanIndexService.lookup(lookup_token)
+        if entry is None:
             gopass = GoPass.query.filter_by(token=lookup_token).first()
+            if gopass:
+                entry = ScanIndexService.add(gopass, gopass.flight)
 
-        # Cas D: Invalide (Document non reconnu)
-        if not gopass:
-            # Log attempt even if invalid doc (if possible to track, but pass_id is null)
-            # We might want to track who tried to scan it.
-            # But AccessLog expects pass_id. If we want to log invalid docs, AccessLog might need to be nullable or use a dummy.
-            # For now, let's assume we can't log "INVALID" easily in AccessLog if pass_id is FK.
-            # Or we can create a record without pass_id if the model allows.
-            # AccessLog.pass_id is nullable (default SQLAlchemy behavior unless nullable=False).
-            # models/__init__.py: pass_id = db.Column(db.Integer, db.ForeignKey('gopasses.id'))
-            # It is nullable by default.
+        pass_flight = db.session.get(Flight, entry.flight_id) if entry else None
+        ScanMetrics.lap('lookup')
 
-            log = AccessLog(
-                pass_id=None,
-                validator_id=agent_id,
-                validation_time=datetime.utcnow(),
-                status='INVALID'
-            )
-            db.session.add(log)
-            db.session.commit()
+        if gate is not None:
+            gate.remember(lookup_token, None if entry is None else (
+                entry.pass_id, entry.status, entry.flight_id,
+                pass_flight.flight_number, entry.flight_date
+            ))
 
-            return {
-                'status': 'error',
-                'code': 'INVALID',
-                'message': 'DOCUMENT NON RECONNU',
-                'color': 'red',
-                'data': None
-            }
-
-        # Cas B: Déjà utilisé
-        if gopass.status == 'consumed':
-            log = AccessLog(
-                pass_id=gopass.id,
-                validator_id=agent_id,
-                validation_time=datetime.utcnow(),
-                status='ALREADY_SCANNED'
-            )
-            db.session.add(log)
-            db.session.commit()
-
-            original_scan = {
-                'scan_date': gopass.scan_date.strftime('%Y-%m-%d %H:%M:%S') if gopass.scan_date else 'N/A',
-                'scanned_by': gopass.scanner.username if gopass.scanner else 'Inconnu',
-                'location': gopass.scan_location
-            }
-            return {
-                'status': 'error',
-                'code': 'ALREADY_SCANNED',
-                'message': 'DÉJÀ SCANNÉ',
-                'color': 'red',
-                'data': {
-                    'passenger': gopass.passenger_name,
-                    'flight': gopass.flight.flight_number,
-                    'original_scan': original_scan
-                }
-            }
+        # Cas D: Invalide (Document non reconnu)
+        if not entry:
+            # AccessLog.pass_id is nullable, so unknown documents are logged without a pass.
+            GoPassService._log_access(None, agent_id, 'INVALID', gate_flight_id)
+            return GoPassService._invalid_response()
+
+        # Cas B: Déjà utilisé - the response needs the original scan details
+        if entry.status == 'consumed':
+            gopass = db.session.get(GoPass, entry.pass_id)
+            ScanMetrics.lap('lookup')
+            GoPassService._log_access(gopass.id, agent_id, 'ALREADY_SCANNED', gate_flight_id)
+            return GoPassService._already_scanned_response(gopass)
 
         # Cas C: Mauvais Vol
-        if str(gopass.flight_id) != str(flight_id):
-            gopass_date = gopass.flight.departure_time.date()
+        if str(entry.flight_id) != str(flight_id):
             target_date = target_flight.departure_time.date() if target_flight else datetime.now().date()
 
             # Sous-Cas: Date Différente -> ROUGE (Expiré)
-            if gopass_date != target_date:
-                log = AccessLog(
-                    pass_id=gopass.id,
-                    validator_id=agent_id,
-                    validation_time=datetime.utcnow(),
-                    status='EXPIRED'
+            if entry.flight_date != target_date:
+                GoPassService._log_access(entry.pass_id, agent_id, 'EXPIRED', gate_flight_id)
+                return GoPassService._expired_response(
+                    entry.flight_date,
+                    target_flight.departure_time if target_flight else None,
+                    pass_flight.flight_number
                 )
-                db.session.add(log)
-                db.session.commit()
-
-                return {
-                    'status': 'error',
-                    'code': 'EXPIRED',
-                    'message': 'BILLET EXPIRÉ',
-                    'color': 'red',
-                    'data': {
-                        'valid_for_date': gopass.flight.departure_time.strftime('%d/%m/%Y'),
-                        'expected_date': target_flight.departure_time.strftime('%d/%m/%Y') if target_flight else 'N/A',
-                        'flight': gopass.flight.flight_number
-                    }
-                }
 
             # Sous-Cas: Même Date, Mauvais Vol -> ORANGE
-            log = AccessLog(
-                pass_id=gopass.id,
-                validator_id=agent_id,
-                validation_time=datetime.utcnow(),
-                status='WRONG_FLIGHT'
-            )
-            db.session.add(log)
-            db.session.commit()
-
-            return {
-                'status': 'warning',
-                'code': 'WRONG_FLIGHT',
-                'message': 'MAUVAIS VOL',
-                'color': 'orange',
-                'data': {
-                    'valid_for': gopass.flight.flight_number,
-                    'date': gopass.flight.departure_time.strftime('%Y-%m-%d')
-                }
-            }
+            GoPassService._log_access(entry.pass_id, agent_id, 'WRONG_FLIGHT', gate_flight_id)
+            return GoPassService._wrong_flight_response(pass_flight.flight_number, entry.flight_date)
 
         # Cas A: Succès
-        if gopass.status == 'valid':
+        if entry.status == 'valid':
             # Mark as consumed - Atomic Update
             scan_time = datetime.utcnow()
 
-            # Atomic update to prevent race conditions (especially on DBs without row locking)
+            # The status guard keeps a concurrent scan from consuming the pass twice
             rows_updated = GoPass.query.filter(
-                GoPass.id == gopass.id,
+                GoPass.id == entry.pass_id,
                 GoPass.status == 'valid'
             ).update({
                 'status': 'consumed',
@@ -306,68 +400,341 @@ class GoPassService:
                 'scan_date': scan_time,
                 'scan_location': location
             }, synchronize_session=False)
+            ScanMetrics.lap('update')
 
             if rows_updated == 0:
                 # Race condition: Status changed since we read it
                 db.session.rollback()
                 # Re-fetch the updated object
-                gopass = GoPass.query.get(gopass.id)
+                gopass = GoPass.query.get(entry.pass_id)
 
                 # Check new status and return appropriate error
                 if gopass.status == 'consumed':
-                    original_scan = {
-                        'scan_date': gopass.scan_date.strftime('%Y-%m-%d %H:%M:%S') if gopass.scan_date else 'N/A',
-                        'scanned_by': gopass.scanner.username if gopass.scanner else 'Inconnu',
-                        'location': gopass.scan_location
-                    }
-                    return {
-                        'status': 'error',
-                        'code': 'ALREADY_SCANNED',
-                        'message': 'DÉJÀ SCANNÉ',
-                        'color': 'red',
-                        'data': {
-                            'passenger': gopass.passenger_name,
-                            'flight': gopass.flight.flight_number,
-                            'original_scan': original_scan
-                        }
-                    }
-                else:
-                    return {
-                        'status': 'error',
-                        'code': 'STATUS_CHANGED',
-                        'message': 'ÉTAT MODIFIÉ',
-                        'color': 'red',
-                        'data': None
-                    }
-
-            # Update successful - Sync local object for response
-            gopass.status = 'consumed'
-            gopass.scanned_by = agent_id
-            gopass.scan_date = scan_time
-            gopass.scan_location = location
+                    return GoPassService._already_scanned_response(gopass)
+                return GoPassService._status_changed_response()
+
+            ScanIndexService.set_status([entry.pass_id], 'consumed')
+
+            passenger = db.session.query(
+                GoPass.passenger_name,
+                GoPass.passenger_passport,
+                GoPass.passenger_document_type
+            ).filter(GoPass.id == entry.pass_id).one()
 
             log = AccessLog(
-                pass_id=gopass.id,
+                pass_id=entry.pass_id,
                 validator_id=agent_id,
                 validation_time=scan_time,
-                status='VALID'
+                status='VALID',
+                flight_id=entry.flight_id
             )
             db.session.add(log)
+            FlightCounterService.record_scan(entry.flight_id, 'VALID')
+            ScanMetrics.lap('log')
 
             db.session.commit()
+            ScanMetrics.lap('commit')
 
-            return {
-                'status': 'success',
-                'code': 'VALID',
-                'message': 'VALIDE',
-                'color': 'green',
-                'data': {
-                    'passenger': gopass.passenger_name,
-                    'passport': gopass.passenger_passport,
-                    'document_type': gopass.passenger_document_type
-                }
+            if gate is not None:
+                gate.set_status(lookup_token, 'consumed')
+
+            return GoPassService._valid_response(*passenger)
+
+        return GoPassService._unknown_response()
+
+    @staticmethod
+    def _validate_single_statement(gate, token, flight_id, agent_id, location):
+        """
+        PostgreSQL path: one statement consumes the pass and returns everything
+        the response needs. Outcomes match the generic path below. Returns None
+        when the flight id is not numeric, to let the generic path answer.
+        """
+        try:
+            target_id = int(flight_id)
+        except (TypeError, ValueError):
+            return None
+
+        scan_time = datetime.utcnow()
+        row = db.session.execute(SINGLE_STATEMENT_SCAN, {
+            'token': token,
+            'digest': ScanIndexService.digest(token),
+            'flight_id': target_id,
+            'agent_id': agent_id,
+            'scan_time': scan_time,
+            'location': location
+        }).mappings().one()
+        ScanMetrics.lap('update')
+
+        if row['consumed_id'] is not None:
+            db.session.commit()
+            ScanMetrics.lap('commit')
+            if gate is not None:
+                gate.remember(token, (
+                    row['pass_id'], 'consumed', row['flight_id'],
+                    row['flight_number'], row['departure_time'].date()
+                ))
+            return GoPassService._valid_response(
+                row['passenger_name'], row['passenger_passport'], row['passenger_document_type']
+            )
+
+        # Check if flight is closed
+        if row['target_status'] == 'closed':
+            return GoPassService._flight_closed_response()
+
+        if gate is not None:
+            gate.remember(token, None if row['pass_id'] is None else (
+                row['pass_id'], row['status'], row['flight_id'],
+                row['flight_number'], row['departure_time'].date()
+            ))
+
+        # Cas D: Invalide (Document non reconnu)
+        if row['pass_id'] is None:
+            GoPassService._log_access(None, agent_id, 'INVALID', row['target_id'])
+            return GoPassService._invalid_response()
+
+        # Cas B: Déjà utilisé
+        if row['status'] == 'consumed':
+            GoPassService._log_access(row['pass_id'], agent_id, 'ALREADY_SCANNED', row['target_id'])
+            return GoPassService._already_scanned_data(
+                row['passenger_name'], row['flight_number'], row['scan_date'],
+                row['scanner_username'], row['scan_location']
+            )
+
+        # Cas C: Mauvais Vol
+        if row['flight_id'] != target_id:
+            target_departure = row['target_departure']
+            target_date = target_departure.date() if target_departure else datetime.now().date()
+
+            # Sous-Cas: Date Différente -> ROUGE (Expiré)
+            if row['departure_time'].date() != target_date:
+                GoPassService._log_access(row['pass_id'], agent_id, 'EXPIRED', row['target_id'])
+                return GoPassService._expired_response(row['departure_time'], target_departure, row['flight_number'])
+
+            # Sous-Cas: Même Date, Mauvais Vol -> ORANGE
+            GoPassService._log_access(row['pass_id'], agent_id, 'WRONG_FLIGHT', row['target_id'])
+            return GoPassService._wrong_flight_response(row['flight_number'], row['departure_time'])
+
+        # Cas A lost a race: the pass was consumed (or the flight closed) concurrently
+        if row['status'] == 'valid':
+            db.session.rollback()
+            gopass = db.session.get(GoPass, row['pass_id'])
+            if gopass.status == 'consumed':
+                return GoPassService._already_scanned_response(gopass)
+            return GoPassService._status_changed_response()
+
+        return GoPassService._unknown_response()
+
+    @staticmethod
+    def _validate_signed_flight_mismatch(signed, token_data, gate, flight_id, agent_id):
+        """
+        Cas C for a signed token: the flight and date bound in the token are
+        trusted, so EXPIRED and WRONG_FLIGHT need no pass lookup. The gate
+        flight date comes from the gate session when one is open.
+        """
+        if gate is not None:
+            if gate.closed:
+                return GoPassService._flight_closed_response()
+            target_date = gate.flight_date
+            gate_flight_id = gate.flight_id
+        else:
+            target_flight = Flight.query.get(flight_id)
+            if target_flight is None:
+                return None
+            if target_flight.status == 'closed':
+                return GoPassService._flight_closed_response()
+            target_date = target_flight.departure_time.date()
+            gate_flight_id = target_flight.id
+
+        # The flight number is display only, taken from the QR envelope when present
+        flight_number = token_data.get('vol') if isinstance(token_data, dict) else None
+        if not flight_number:
+            pass_flight = db.session.get(Flight, signed.flight_id)
+            flight_number = pass_flight.flight_number if pass_flight else 'N/A'
+
+        # Sous-Cas: Date Différente -> ROUGE (Expiré)
+        if signed.flight_date != target_date:
+            GoPassService._log_access(signed.pass_id, agent_id, 'EXPIRED', gate_flight_id)
+            return GoPassService._expired_response(signed.flight_date, target_date, flight_number)
+
+        # Sous-Cas: Même Date, Mauvais Vol -> ORANGE
+        GoPassService._log_access(signed.pass_id, agent_id, 'WRONG_FLIGHT', gate_flight_id)
+        return GoPassService._wrong_flight_response(flight_number, signed.flight_date)
+
+    @staticmethod
+    def _validate_with_gate_session(gate, token, agent_id, location):
+        """
+        Gate session path. INVALID, WRONG_FLIGHT and EXPIRED are answered from
+        memory; consumption is a single conditional UPDATE keyed by pass id.
+        Returns None when the database path must decide (token never seen by
+        this session, or a status the cache cannot settle).
+        """
+        if gate.closed:
+            return GoPassService._flight_closed_response()
+
+        found, entry = gate.lookup(token)
+        ScanMetrics.lap('lookup')
+        if not found:
+            return None
+
+        # Cas D: Invalide (already confirmed absent from the database)
+        if entry is None:
+            GoPassService._log_access(None, agent_id, 'INVALID', gate.flight_id)
+            return GoPassService._invalid_response()
+
+        pass_id, status, pass_flight_id, flight_number, flight_date = entry
+
+        # Cas B: Déjà utilisé - the response needs the original scan details
+        if status == 'consumed':
+            gopass = db.session.get(GoPass, pass_id)
+            ScanMetrics.lap('lookup')
+            if not gopass or gopass.status != 'consumed':
+                return None
+            GoPassService._log_access(gopass.id, agent_id, 'ALREADY_SCANNED', gate.flight_id)
+            return GoPassService._already_scanned_response(gopass)
+
+        # Cas C: Mauvais Vol
+        if pass_flight_id != gate.flight_id:
+            if flight_date != gate.flight_date:
+                GoPassService._log_access(pass_id, agent_id, 'EXPIRED', gate.flight_id)
+                return GoPassService._expired_response(flight_date, gate.flight_date, flight_number)
+
+            GoPassService._log_access(pass_id, agent_id, 'WRONG_FLIGHT', gate.flight_id)
+            return GoPassService._wrong_flight_response(flight_number, flight_date)
+
+        if status != 'valid':
+            return None
+
+        # Cas A: Succès - the flight guard keeps stale sessions in other workers
+        # from boarding a flight that has been closed in the meantime.
+        scan_time = datetime.utcnow()
+        open_flight = select(Flight.id).where(
+            Flight.id == gate.flight_id,
+            or_(Flight.status.is_(None), Flight.status != 'closed')
+        )
+
+        rows_updated = GoPass.query.filter(
+            GoPass.id == pass_id,
+            GoPass.status == 'valid',
+            GoPass.flight_id.in_(open_flight)
+        ).update({
+            'status': 'consumed',
+            'scanned_by': agent_id,
+            'scan_date': scan_time,
+            'scan_location': location
+        }, synchronize_session=False)
+        ScanMetrics.lap('update')
+
+        if rows_updated == 0:
+            db.session.rollback()
+            gopass = db.session.get(GoPass, pass_id)
+            if gopass and gopass.status == 'consumed':
+                gate.set_status(token, 'consumed')
+                return GoPassService._already_scanned_response(gopass)
+
+            flight = db.session.get(Flight, gate.flight_id)
+            if flight and flight.status == 'closed':
+                GateSessionService.invalidate(gate.flight_id)
+                return GoPassService._flight_closed_response()
+
+            return GoPassService._status_changed_response()
+
+        ScanIndexService.set_status([pass_id], 'consumed')
+
+        passenger = db.session.query(
+            GoPass.passenger_name,
+            GoPass.passenger_passport,
+            GoPass.passenger_document_type
+        ).filter(GoPass.id == pass_id).one()
+
+        db.session.add(AccessLog(
+            pass_id=pass_id,
+            validator_id=agent_id,
+            validation_time=scan_time,
+            status='VALID',
+            flight_id=gate.flight_id
+        ))
+        FlightCounterService.record_scan(gate.flight_id, 'VALID')
+        ScanMetrics.lap('log')
+        db.session.commit()
+        ScanMetrics.lap('commit')
+
+        gate.set_status(token, 'consumed')
+
+        return GoPassService._valid_response(*passenger)
+
+    @staticmethod
+    def _log_access(pass_id, agent_id, status, flight_id=None, validation_time=None):
+        """
+        Records a scan outcome that changes no pass state. With write-behind
+        enabled the row goes to the AccessLog journal and the scan response
+        does not wait on the insert; otherwise, or when the journal cannot
+        spool it, it is committed inline.
+        """
+        journal = AccessLogJournal.get()
+        if journal is not None and journal.is_enabled():
+            if journal.record(pass_id, agent_id, status, flight_id, validation_time):
+                ScanMetrics.lap('log')
+                return
+
+        log = AccessLog(
+            pass_id=pass_id,
+            validator_id=agent_id,
+            validation_time=validation_time or datetime.utcnow(),
+            status=status,
+            flight_id=flight_id
+        )
+        db.session.add(log)
+        FlightCounterService.record_scan(flight_id, status)
+        ScanMetrics.lap('log')
+        db.session.commit()
+        ScanMetrics.lap('commit')
+
+    @staticmethod
+    def _valid_response(passenger_name, passport, document_type):
+        return {
+            'status': 'success',
+            'code': 'VALID',
+            'message': 'VALIDE',
+            'color': 'green',
+            'data': {
+                'passenger': passenger_name,
+                'passport': passport,
+                'document_type': document_type
             }
+        }
 
+    @staticmethod
+    def _invalid_response():
+        return {
+            'status': 'error',
+            'code': 'INVALID',
+            'message': 'DOCUMENT NON RECONNU',
+            'color': 'red',
+            'data': None
+        }
+
+    @staticmethod
+    def _flight_closed_response():
+        return {
+            'status': 'error',
+            'code': 'FLIGHT_CLOSED',
+            'message': 'VOL CLÔTURÉ',
+            'color': 'red',
+            'data': None
+        }
+
+    @staticmethod
+    def _status_changed_response():
+        return {
+            'status': 'error',
+            'code': 'STATUS_CHANGED',
+            'message': 'ÉTAT MODIFIÉ',
+            'color': 'red',
+            'data': None
+        }
+
+    @staticmethod
+    def _unknown_response():
         return {
             'status': 'error',
             'code': 'UNKNOWN',
@@ -376,12 +743,124 @@ class GoPassService:
         }
 
     @staticmethod
-    def _draw_gopass_on_canvas(p, gopass, width, height, qr_image, fmt, lang='fr', logo_rva_path=False, logo_gopass_path=False):
-        t = lambda k: get_text(k, lang)
+    def _already_scanned_response(gopass):
+        return GoPassService._already_scanned_data(
+            gopass.passenger_name,
+            gopass.flight.flight_number,
+            gopass.scan_date,
+            gopass.scanner.username if gopass.scanner else None,
+            gopass.scan_location
+        )
 
+    @staticmethod
+    def _already_scanned_data(passenger_name, flight_number, scan_date, scanner_username, scan_location):
+        original_scan = {
+            'scan_date': scan_date.strftime('%Y-%m-%d %H:%M:%S') if scan_date else 'N/A',
+            'scanned_by': scanner_username or 'Inconnu',
+            'location': scan_location
+        }
+        return {
+            'status': 'error',
+            'code': 'ALREADY_SCANNED',
+            'message': 'DÉJÀ SCANNÉ',
+            'color': 'red',
+            'data': {
+                'passenger': passenger_name,
+                'flight': flight_number,
+                'original_scan': original_scan
+            }
+        }
+
+    @staticmethod
+    def _expired_response(valid_for_date, expected_date, flight_number):
+        return {
+            'status': 'error',
+            'code': 'EXPIRED',
+            'message': 'BILLET EXPIRÉ',
+            'color': 'red',
+            'data': {
+                'valid_for_date': valid_for_date.strftime('%d/%m/%Y'),
+                'expected_date': expected_date.strftime('%d/%m/%Y') if expected_date else 'N/A',
+                'flight': flight_number
+            }
+        }
+
+    @staticmethod
+    def _wrong_flight_response(flight_number, flight_date):
+        return {
+            'status': 'warning',
+            'code': 'WRONG_FLIGHT',
+            'message': 'MAUVAIS VOL',
+            'color': 'orange',
+            'data': {
+                'valid_for': flight_number,
+                'date': flight_date.strftime('%Y-%m-%d')
+            }
+        }
+
+    @staticmethod
+    def _ticket_template(p, templates, width, height, fmt, lang, logo_rva_path, logo_gopass_path):
+        """
+        Name of the form XObject holding the static layout of a ticket page
+        (logos, titles, labels, box, footer) for this format, language and
+        logos. It is drawn once per document and stamped on every page:
+        templates is the {key: name} registry of the canvas p, kept by the
+        function rendering the document.
+        """
+        key = (
+            fmt, lang, width, height,
+            logo_rva_path if isinstance(logo_rva_path, str) else id(logo_rva_path),
+            logo_gopass_path if isinstance(logo_gopass_path, str) else id(logo_gopass_path)
+        )
+        name = templates.get(key)
+        if name is None:
+            name = templates[key] = f"gopass_{fmt}_{lang}_{len(templates)}"
+            p.beginForm(name)
+            GoPassService._draw_ticket_layout(p, None, width, height, None, fmt, lang, logo_rva_path, logo_gopass_path)
+            p.endForm()
+        return name
+
+    @staticmethod
+    def ticket_fields(gopass):
+        """Plain dict of the values printed on a ticket page (picklable, no ORM access)."""
+        return {
+            'passenger_name': gopass.passenger_name,
+            'flight_number': gopass.flight.flight_number,
+            'departure_date': gopass.flight.departure_time.strftime('%d/%m/%Y'),
+            'departure_airport': gopass.flight.departure_airport,
+            'arrival_airport': gopass.flight.arrival_airport,
+            'agent_name': gopass.seller.username if gopass.seller else None,
+            'issue_time': gopass.issue_date.strftime('%H:%M:%S') if gopass.issue_date else None,
+            'payment_ref': gopass.payment_ref,
+            'payment_method': gopass.payment_method,
+            'price': gopass.price,
+            'currency': gopass.currency
+        }
+
+    @staticmethod
+    def _draw_gopass_on_canvas(p, gopass, width, height, qr_image, fmt, lang='fr', logo_rva_path=False, logo_gopass_path=False, templates=None):
+        """
+        Draws one ticket page. gopass is a GoPass or its ticket_fields() dict.
+        templates: the _ticket_template() registry shared by the pages of the
+        document (a new one per call when omitted).
+        """
         # Resolve logos if not provided (backward compatibility / fallback)
         if logo_rva_path is False and logo_gopass_path is False:
-            logo_rva_path, logo_gopass_path = GoPassService._get_logo_paths()
+            logo_rva_path, logo_gopass_path = BrandingService.get()['images']
+
+        ticket = gopass if isinstance(gopass, dict) else GoPassService.ticket_fields(gopass)
+        templates = {} if templates is None else templates
+        p.doForm(GoPassService._ticket_template(p, templates, width, height, fmt, lang, logo_rva_path, logo_gopass_path))
+        GoPassService._draw_ticket_layout(p, ticket, width, height, qr_image, fmt, lang, logo_rva_path, logo_gopass_path)
+
+    @staticmethod
+    def _draw_ticket_layout(p, ticket, width, height, qr_image, fmt, lang, logo_rva_path, logo_gopass_path):
+        """
+        Walks the ticket layout. Without ticket, draws the static elements
+        (template); with the ticket_fields() of a pass, only its values and QR code.
+        """
+        t = lambda k: get_text(k, lang)
+        static = ticket is None
 
         if fmt == 'thermal':
             # MODULE B: THERMAL TICKET (80mm)
@@ -397,64 +876,76 @@ class GoPassService:
             # Logo RVA (Monochrome)
             if logo_rva_path:
                 img_w, img_h = 20*mm, 20*mm
-                p.drawImage(logo_rva_path, (width - img_w)/2, y - img_h, width=img_w, height=img_h)
+                if static:
+                    p.drawImage(logo_rva_path, (width - img_w)/2, y - img_h, width=img_w, height=img_h)
                 y -= (img_h + 2*mm)
 
-            draw_centered("RVA - GO PASS", y, "Helvetica-Bold", 12)
+            if static:
+                draw_centered("RVA - GO PASS", y, "Helvetica-Bold", 12)
             y -= 4 * mm
-            draw_centered(t('ticket_pdf.receipt_title'), y, "Helvetica", 8)
+            if static:
+                draw_centered(t('ticket_pdf.receipt_title'), y, "Helvetica", 8)
             y -= 6 * mm
 
             # Separator
-            p.setLineWidth(1)
-            p.line(2*mm, y, width - 2*mm, y)
+            if static:
+                p.setLineWidth(1)
+                p.line(2*mm, y, width - 2*mm, y)
             y -= 6 * mm
 
             # 2. Détails du Vol
-            draw_centered(f"{t('ticket_pdf.flight_label')} : {gopass.flight.flight_number}", y, "Helvetica-Bold", 16)
+            if not static:
+                draw_centered(f"{t('ticket_pdf.flight_label')} : {ticket['flight_number']}", y, "Helvetica-Bold", 16)
             y -= 6 * mm
-            draw_centered(f"{t('ticket_pdf.date_label')} : {gopass.flight.departure_time.strftime('%d/%m/%Y')}", y, "Helvetica-Bold", 10)
+            if not static:
+                draw_centered(f"{t('ticket_pdf.date_label')} : {ticket['departure_date']}", y, "Helvetica-Bold", 10)
             y -= 5 * mm
-            draw_centered(f"DEP : {gopass.flight.departure_airport}", y, "Helvetica-Bold", 10)
+            if not static:
+                draw_centered(f"DEP : {ticket['departure_airport']}", y, "Helvetica-Bold", 10)
             y -= 8 * mm
 
             # 3. Détails Passager
-            passenger_name = gopass.passenger_name.upper() if gopass.passenger_name else t('ticket_pdf.passenger_label')
-            draw_centered(passenger_name, y, "Helvetica", 10)
+            if not static:
+                passenger_name = ticket['passenger_name'].upper() if ticket['passenger_name'] else t('ticket_pdf.passenger_label')
+                draw_centered(passenger_name, y, "Helvetica", 10)
             y -= 8 * mm
 
             # 4. QR Code
             qr_size = 40 * mm
-            p.drawImage(qr_image, (width - qr_size)/2, y - qr_size, width=qr_size, height=qr_size)
+            if not static:
+                GoPassService._draw_qr(p, qr_image, (width - qr_size)/2, y - qr_size, qr_size)
             y -= (qr_size + 5 * mm)
 
-            # 5. Audit & Traçabilité
+            # 5. Audit & Traçabilité: labels in the template, values after them
             p.setFont("Helvetica", 8)
             left_margin = 5 * mm
             line_height = 4 * mm
 
-            agent_name = gopass.seller.username if gopass.seller else "Automate"
-            terminal_id = "POS-001" # Placeholder
-            issue_time = gopass.issue_date.strftime('%H:%M:%S') if gopass.issue_date else "N/A"
-
-            p.drawString(left_margin, y, f"{t('ticket_pdf.agent_id')} : {agent_name}")
-            y -= line_height
-            p.drawString(left_margin, y, f"{t('ticket_pdf.terminal')} : {terminal_id}")
-            y -= line_height
-            p.drawString(left_margin, y, f"{t('ticket_pdf.time')} : {issue_time}")
-            y -= line_height
-            p.drawString(left_margin, y, f"{t('ticket_pdf.trans')} : {gopass.payment_ref or 'N/A'}")
-            y -= line_height
-            p.drawString(left_margin, y, f"{t('ticket_pdf.payment')} : {gopass.payment_method or 'CASH'}")
-            y -= 8 * mm
+            audit_labels = ['ticket_pdf.agent_id', 'ticket_pdf.terminal', 'ticket_pdf.time', 'ticket_pdf.trans', 'ticket_pdf.payment']
+            values = [None] * len(audit_labels)
+            if not static:
+                agent_name = ticket['agent_name'] or "Automate"
+                terminal_id = "POS-001" # Placeholder
+                issue_time = ticket['issue_time'] or "N/A"
+                values = [agent_name, terminal_id, issue_time, ticket['payment_ref'] or 'N/A', ticket['payment_method'] or 'CASH']
+
+            for key, value in zip(audit_labels, values):
+                label = f"{t(key)} : "
+                if static:
+                    p.drawString(left_margin, y, label)
+                else:
+                    p.drawString(left_margin + p.stringWidth(label, "Helvetica", 8), y, str(value))
+                y -= line_height
+            y += line_height - 8 * mm
 
             # 6. Pied de Ticket
-            draw_centered(t('ticket_pdf.keep_ticket'), y, "Helvetica-Oblique", 7)
-            y -= 4 * mm
-            draw_centered("www.rva.cd", y, "Helvetica", 8)
+            if static:
+                draw_centered(t('ticket_pdf.keep_ticket'), y, "Helvetica-Oblique", 7)
+                y -= 4 * mm
+                draw_centered("www.rva.cd", y, "Helvetica", 8)
 
-        else:
-            # MODULE A: A4 PDF (E-GoPass)
+        elif static:
+            # MODULE A: A4 PDF (E-GoPass) - static layout
 
             # 1. En-tête (Header)
 
@@ -470,9 +961,6 @@ class GoPassService:
             title_y = height - 2*cm
             p.setFont("Helvetica-Bold", 14)
             p.drawCentredString(width/2, title_y, t('ticket_pdf.header_title'))
-            # p.drawCentredString(width/2, title_y - 0.6*cm, "INFRASTRUCTURES AÉROPORTUAIRES (IDEF)") # Included in header_title key usually or split if needed.
-            # I merged it in JSON as one line, but PDF draws 2 lines. I should probably split it or use wrap.
-            # For simplicity, assuming one line or short title. "Infrastructure Development Fee (IDEF)" fits.
 
             p.setFont("Helvetica", 10)
             p.drawCentredString(width/2, title_y - 1.5*cm, t('ticket_pdf.subtitle_a4'))
@@ -487,97 +975,131 @@ class GoPassService:
             p.rect(2*cm, box_top - box_height, box_width, box_height, fill=1)
             p.setFillColor(colors.black)
 
+            # Labels: PASSAGER, VOL, DATE, ITINÉRAIRE
             text_x = 3*cm
             current_y = box_top - 1.5*cm
+            p.setFont("Helvetica-Bold", 10)
+            for key in ('ticket_pdf.passenger_label', 'ticket_pdf.flight_label', 'ticket_pdf.date_label', 'ticket_pdf.itin_label'):
+                p.drawString(text_x, current_y, t(key))
+                current_y -= 1.5*cm
+
+            # 3. Zone de Sécurité (QR Code)
+            qr_y = box_top - box_height - 5*cm
+            p.setFont("Helvetica", 8)
+            p.drawCentredString(width/2, qr_y - 0.5*cm, t('ticket_pdf.security_warning'))
+
+            # 4. Pied de page (Footer)
+            footer_y = 3*cm
+
+            # Disclaimer
+            p.setFont("Helvetica-Oblique", 8)
+            p.drawCentredString(width/2, footer_y - 0.5*cm, t('ticket_pdf.disclaimer'))
+
+            # Branding
+            p.setFont("Helvetica", 6)
+            p.drawCentredString(width/2, 1*cm, t('ticket_pdf.powered_by'))
+
+        else:
+            # MODULE A: A4 PDF (E-GoPass) - ticket fields
+            box_top = height - 5*cm
+            box_height = 8*cm
+            p.setFillColor(colors.black)
+
+            value_x = 3*cm + 3*cm
+            current_y = box_top - 1.5*cm
 
             # PASSAGER
-            p.setFont("Helvetica-Bold", 10)
-            p.drawString(text_x, current_y, t('ticket_pdf.passenger_label'))
             p.setFont("Helvetica", 14)
-            p.drawString(text_x + 3*cm, current_y, gopass.passenger_name.upper())
-
+            p.drawString(value_x, current_y, ticket['passenger_name'].upper())
             current_y -= 1.5*cm
 
             # VOL
-            p.setFont("Helvetica-Bold", 10)
-            p.drawString(text_x, current_y, t('ticket_pdf.flight_label'))
             p.setFont("Helvetica-Bold", 24)
-            p.drawString(text_x + 3*cm, current_y, gopass.flight.flight_number)
-
+            p.drawString(value_x, current_y, ticket['flight_number'])
             current_y -= 1.5*cm
 
             # DATE
-            p.setFont("Helvetica-Bold", 10)
-            p.drawString(text_x, current_y, t('ticket_pdf.date_label'))
             p.setFont("Helvetica", 14)
-            date_str = gopass.flight.departure_time.strftime('%d/%m/%Y')
-            p.drawString(text_x + 3*cm, current_y, date_str)
-
+            p.drawString(value_x, current_y, ticket['departure_date'])
             current_y -= 1.5*cm
 
             # ITINÉRAIRE
-            p.setFont("Helvetica-Bold", 10)
-            p.drawString(text_x, current_y, t('ticket_pdf.itin_label'))
-            p.setFont("Helvetica", 14)
-            itin = f"{gopass.flight.departure_airport}  ➔  {gopass.flight.arrival_airport}"
-            p.drawString(text_x + 3*cm, current_y, itin)
+            itin = f"{ticket['departure_airport']}  ➔  {ticket['arrival_airport']}"
+            p.drawString(value_x, current_y, itin)
 
             # 3. Zone de Sécurité (QR Code)
             qr_y = box_top - box_height - 5*cm
             qr_size = 4*cm
-            p.drawImage(qr_image, (width - qr_size)/2, qr_y, width=qr_size, height=qr_size)
-
-            p.setFont("Helvetica", 8)
-            p.drawCentredString(width/2, qr_y - 0.5*cm, t('ticket_pdf.security_warning'))
+            GoPassService._draw_qr(p, qr_image, (width - qr_size)/2, qr_y, qr_size)
 
             # 4. Pied de page (Footer)
             footer_y = 3*cm
 
             # Prix & Paiement
             p.setFont("Helvetica-Bold", 12)
-            price_text = f"{gopass.price} {gopass.currency}"
+            price_text = f"{ticket['price']} {ticket['currency']}"
             p.drawCentredString(width/2, footer_y + 1*cm, f"{t('ticket_pdf.price_label')} : {price_text}")
 
             p.setFont("Helvetica", 10)
-            payment_mode = gopass.payment_method or "Mobile Money / Carte Bancaire"
+            payment_mode = ticket['payment_method'] or "Mobile Money / Carte Bancaire"
             p.drawCentredString(width/2, footer_y + 0.5*cm, f"{t('ticket_pdf.payment_mode_label')} : {payment_mode}")
 
-            # Disclaimer
-            p.setFont("Helvetica-Oblique", 8)
-            p.drawCentredString(width/2, footer_y - 0.5*cm, t('ticket_pdf.disclaimer'))
-
-            # Branding
-            p.setFont("Helvetica", 6)
-            p.drawCentredString(width/2, 1*cm, t('ticket_pdf.powered_by'))
-
 
     @staticmethod
-    def _create_qr_image(gopass):
+    def qr_payload(gopass):
+        """
+        JSON content of the pass QR code. hash_signature carries the signed
+        compact token when a SecurityKey is available, the raw hash otherwise.
+        """
         qr_payload = {
             "id_billet": gopass.id,
             "vol": gopass.flight.flight_number,
             "date": gopass.flight.departure_time.strftime('%Y-%m-%d'),
-            "hash_signature": gopass.token
+            "hash_signature": TokenSigningService.sign(gopass) or gopass.token
         }
-        qr_data = json.dumps(qr_payload)
+        return json.dumps(qr_payload)
 
-        # Generate QR Code
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
+    @staticmethod
+    def qr_png(gopass, qr_data=None):
+        """PNG bytes of the pass QR code (cached, see QRCache)."""
+        return QRService.render_png(qr_data or GoPassService.qr_payload(gopass))
 
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        return ImageReader(buffer)
+    @staticmethod
+    def qr_version(qr_data):
+        """
+        Short digest of a QR payload, for the URL of its image: it changes
+        with the QR content (key rotation, flight change) and, being derived
+        from the signature, cannot be guessed from the pass id.
+        """
+        return hashlib.sha256(qr_data.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _create_qr(gopass):
+        """
+        QR code for _draw_gopass_on_canvas: the module matrix, drawn as
+        vectors (TICKET_QR_MODE='vector'), or a PNG image ('bitmap').
+        """
+        return GoPassService._qr_drawable(GoPassService.qr_payload(gopass), current_app.config.get('TICKET_QR_MODE', 'vector'))
+
+    @staticmethod
+    def _qr_drawable(qr_data, qr_mode):
+        if qr_mode == 'bitmap':
+            return ImageReader(io.BytesIO(QRService.render_png(qr_data)))
+        return QRService.matrix(qr_data)
+
+    @staticmethod
+    def _draw_qr(p, qr, x, y, size):
+        if isinstance(qr, list):
+            QRService.draw_matrix(p, qr, x, y, size)
+        else:
+            p.drawImage(qr, x, y, width=size, height=size)
 
     @staticmethod
     def generate_pdf_bytes(gopass, fmt='a4', lang='fr'):
         """
         Generates PDF for a GoPass. Returns bytes.
         """
-        qr_image = GoPassService._create_qr_image(gopass)
+        qr_image = GoPassService._create_qr(gopass)
         buffer = io.BytesIO()
 
         if fmt == 'thermal':
@@ -586,14 +1108,11 @@ class GoPassService:
         else:
             width, height = A4
 
-        # Pre-fetch logos
-        logo_rva, logo_gopass = GoPassService._get_logo_paths()
-
-        # Optimize by loading images into memory
-        logo_rva = GoPassService._load_image_resource(logo_rva)
-        logo_gopass = GoPassService._load_image_resource(logo_gopass)
+        # Logos decoded once per process (BrandingService)
+        logo_rva, logo_gopass = BrandingService.get()['images']
 
-        p = canvas.Canvas(buffer, pagesize=(width, height))
+        # invariant: no timestamp or random id, the same ticket gives the same bytes (strong ETag)
+        p = canvas.Canvas(buffer, pagesize=(width, height), invariant=1)
         GoPassService._draw_gopass_on_canvas(p, gopass, width, height, qr_image, fmt, lang, logo_rva, logo_gopass)
 
         p.showPage()
@@ -602,28 +1121,138 @@ class GoPassService:
         buffer.seek(0)
         return buffer.getvalue()
 
+    @staticmethod
+    def _pdf_key(gopass, fmt, lang, logo_version, qr_mode):
+        ticket = [
+            TICKET_LAYOUT_VERSION, section_digest('ticket_pdf', lang),
+            gopass.id, fmt, lang, qr_mode, gopass.status, GoPassService._bulk_ticket(gopass), logo_version
+        ]
+        return hashlib.sha256(json.dumps(ticket, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def pdf_etag(gopass, fmt='a4', lang='fr'):
+        """
+        Version of the ticket PDF (see PdfCache), computed without rendering:
+        layout version, ticket texts of the language, pass, printed fields
+        and QR content, status, format, language and logo files.
+        """
+        logo_version = BrandingService.get()['logo_version']
+        qr_mode = current_app.config.get('TICKET_QR_MODE', 'vector')
+        return GoPassService._pdf_key(gopass, fmt, lang, logo_version, qr_mode)
+
+    @staticmethod
+    def batch_pdf_etag(gopass_list, lang='fr'):
+        """Version of the generate_bulk_pdf / stream_bulk_pdf document of gopass_list."""
+        logo_version = BrandingService.get()['logo_version']
+        qr_mode = current_app.config.get('TICKET_QR_MODE', 'vector')
+        digest = hashlib.sha256(f"batch|{lang}".encode('utf-8'))
+        for gopass in gopass_list:
+            digest.update(GoPassService._pdf_key(gopass, 'a4', lang, logo_version, qr_mode).encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def cached_pdf_bytes(gopass, fmt='a4', lang='fr', etag=None):
+        """generate_pdf_bytes through PdfCache. Returns (pdf_bytes, etag)."""
+        etag = etag or GoPassService.pdf_etag(gopass, fmt, lang)
+        cache = PdfCache.get()
+        if cache is None:
+            return GoPassService.generate_pdf_bytes(gopass, fmt=fmt, lang=lang), etag
+        return cache.fetch(etag, lambda: GoPassService.generate_pdf_bytes(gopass, fmt=fmt, lang=lang)), etag
+
     @staticmethod
     def generate_bulk_pdf(gopass_list, lang='fr'):
         """
         Generates a single PDF containing all GoPasses in the list (one per page).
+        Large lists are rendered in chunks by PdfRenderPool, then merged.
+        """
+        tickets, logos, qr_mode = GoPassService._bulk_pdf_input(gopass_list)
+
+        pool = PdfRenderPool.get()
+        if pool is not None and pool.should_split(len(tickets)):
+            parts = pool.map_chunks(GoPassService.render_ticket_pages, tickets, lang, logos, qr_mode)
+            return GoPassService._merge_pdfs(parts)
+        return GoPassService.render_ticket_pages(tickets, lang, logos, qr_mode)
+
+    @staticmethod
+    def stream_bulk_pdf(gopass_list, lang='fr'):
+        """
+        Same document as generate_bulk_pdf, as an iterator of bytes: tickets
+        are read and rendered BULK_PDF_STREAM_CHUNK_SIZE at a time and each
+        part is sent before the next one is rendered, so memory and time to
+        first byte do not grow with the number of tickets. Iterate it inside
+        the request (stream_with_context).
+        """
+        logos = GoPassService._bulk_logos()
+        qr_mode = current_app.config.get('TICKET_QR_MODE', 'vector')
+        chunk_size = current_app.config.get('BULK_PDF_STREAM_CHUNK_SIZE', 20)
+        chunks = (
+            [GoPassService._bulk_ticket(gopass) for gopass in gopass_list[i:i + chunk_size]]
+            for i in range(0, len(gopass_list), chunk_size)
+        )
+
+        pool = PdfRenderPool.get()
+        if pool is not None and pool.should_split(len(gopass_list)):
+            parts = pool.imap(GoPassService.render_ticket_pages, chunks, lang, logos, qr_mode)
+        else:
+            parts = (GoPassService.render_ticket_pages(chunk, lang, logos, qr_mode) for chunk in chunks)
+
+        def generate():
+            writer = PdfStreamWriter()
+            yield writer.begin()
+            for part in parts:
+                yield writer.add_part(part)
+            yield writer.end()
+
+        return generate()
+
+    @staticmethod
+    def _bulk_pdf_input(gopass_list):
+        """Everything the pages need, read once from the database: (tickets, logos, qr_mode)."""
+        qr_mode = current_app.config.get('TICKET_QR_MODE', 'vector')
+        tickets = [GoPassService._bulk_ticket(gopass) for gopass in gopass_list]
+        return tickets, GoPassService._bulk_logos(), qr_mode
+
+    @staticmethod
+    def _bulk_logos():
+        """Picklable reference to the cached logos: (logo_paths, logo_version)."""
+        branding = BrandingService.get()
+        return branding['logo_paths'], branding['logo_version']
+
+    @staticmethod
+    def _bulk_ticket(gopass):
+        return dict(GoPassService.ticket_fields(gopass), qr_data=GoPassService.qr_payload(gopass))
+
+    @staticmethod
+    def render_ticket_pages(tickets, lang, logos, qr_mode='vector'):
+        """
+        A4 PDF with one page per ticket_fields() dict carrying its 'qr_data'.
+        logos is the (logo_paths, logo_version) of _bulk_logos().
+        Needs no application context: it also runs in PdfRenderPool workers.
         """
         buffer = io.BytesIO()
         width, height = A4 # Bulk PDF assumes A4 for now
-        p = canvas.Canvas(buffer, pagesize=(width, height))
-
-        # Pre-fetch logos once
-        logo_rva, logo_gopass = GoPassService._get_logo_paths()
+        p = canvas.Canvas(buffer, pagesize=(width, height), invariant=1)
 
-        # Optimize by loading images into memory once
-        logo_rva = GoPassService._load_image_resource(logo_rva)
-        logo_gopass = GoPassService._load_image_resource(logo_gopass)
+        # Decoded once per process and logo version
+        logo_rva, logo_gopass = BrandingService.logo_images(*logos)
 
-        for gopass in gopass_list:
-            qr_image = GoPassService._create_qr_image(gopass)
-            GoPassService._draw_gopass_on_canvas(p, gopass, width, height, qr_image, 'a4', lang, logo_rva, logo_gopass)
+        templates = {}
+        for ticket in tickets:
+            qr_image = GoPassService._qr_drawable(ticket['qr_data'], qr_mode)
+            GoPassService._draw_gopass_on_canvas(p, ticket, width, height, qr_image, 'a4', lang, logo_rva, logo_gopass, templates)
             p.showPage()
 
         p.save()
 
         buffer.seek(0)
         return buffer.getvalue()
+
+    @staticmethod
+    def _merge_pdfs(parts):
+        writer = PdfWriter()
+        for part in parts:
+            writer.append(PdfReader(io.BytesIO(part)))
+
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
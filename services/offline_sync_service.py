@@ -0,0 +1,296 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for offline_sync_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from models import db, GoPass, Flight, AccessLog, OfflineSyncLog
+from services.gopass_service import GoPassService
+from services.flight_counter_service import FlightCounterService
+from services.scan_index_service import ScanIndexService
+from sqlalchemy import select, update, insert, bindparam, and_
+from datetime import datetime, timedelta, timezone
+import json
+
+# Bound parameters per IN (...) query, below the SQLite variable limit
+CHUNK_SIZE = 500
+
+
+class OfflineSyncService:
+    """
+    Set-based upload of scans made while a gate was offline.
+
+    A batch is resolved with a handful of chunked queries whatever its size:
+    one read of the passes and flights involved, two conditional UPDATEs
+    executed for every candidate scan (each followed by a re-read to learn
+    which scans won), then bulk inserts of the AccessLog rows, the flight
+    counters and a single OfflineSyncLog.
+
+    Conflicts are settled first-scan-wins on the scan time recorded by the
+    device: the earliest scan of a pass, in this batch or already stored,
+    owns the consumption and every other scan is logged ALREADY_SCANNED.
+    A device clock is trusted only between the pass issue date and the
+    upload (plus MAX_CLOCK_SKEW): a scan dated outside is clamped, so a
+    wrong clock cannot win a pass it did not scan first.
+
+    Scans are classified in the order of the online path: unknown token,
+    already consumed, wrong flight or date, then consumption.
+
+    A batch retried after a timeout is idempotent: a scan already logged
+    offline for the same agent, pass and scan time is answered with its
+    logged outcome, without a new AccessLog row or counter increment.
+
+    A malformed event is answered INVALID with an error and the rest of the
+    batch is applied; only an empty or oversized batch is rejected.
+    """
+
+    MAX_BATCH = 5000
+
+    # Seconds a device clock may run ahead of the server
+    MAX_CLOCK_SKEW = 60
+
+    @staticmethod
+    def _chunks(values):
+        values = list(values)
+        for i in range(0, len(values), CHUNK_SIZE):
+            yield values[i:i + CHUNK_SIZE]
+
+    @staticmethod
+    def _parse_time(value, default):
+        if not value:
+            return default
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return default
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+
+    @staticmethod
+    def _clamp_time(scanned_at, issue_date, received_at):
+        """Device scan time bounded by [issue_date, received_at + MAX_CLOCK_SKEW]."""
+        latest = received_at + timedelta(seconds=OfflineSyncService.MAX_CLOCK_SKEW)
+        if scanned_at > latest:
+            return latest
+        if issue_date is not None and scanned_at < issue_date:
+            return issue_date
+        return scanned_at
+
+    @staticmethod
+    def _consume(candidates, condition, agent_id):
+        """
+        Runs one executemany conditional UPDATE over the candidate scans and
+        returns the ids of the passes this agent now owns. executemany gives
+        no per-row count, so ownership is read back in chunks.
+        """
+        if not candidates:
+            return set()
+
+        table = GoPass.__table__
+        stmt = update(table).where(and_(table.c.id == bindparam('b_id'), condition)).values(
+            status='consumed',
+            scanned_by=bindparam('b_agent'),
+            scan_date=bindparam('b_scan_date'),
+            scan_location=bindparam('b_location')
+        )
+        db.session.execute(stmt, [
+            {
+                'b_id': pass_id,
+                'b_agent': agent_id,
+                'b_scan_date': scan['scanned_at'],
+                'b_location': scan['location']
+            }
+            for pass_id, scan in candidates.items()
+        ])
+
+        owned = set()
+        for chunk in OfflineSyncService._chunks(candidates):
+            rows = db.session.execute(
+                select(GoPass.id, GoPass.scanned_by, GoPass.scan_date).where(GoPass.id.in_(chunk))
+            ).all()
+            owned.update(
+                pass_id for pass_id, scanned_by, scan_date in rows
+                if (scanned_by, scan_date) == (agent_id, candidates[pass_id]['scanned_at'])
+            )
+        return owned
+
+    @staticmethod
+    def _logged(scans, agent_id):
+        """
+        Outcomes already logged offline by agent_id for these scans:
+        {(pass_id, scan time): status}, pass_id None for unknown tokens.
+        """
+        logged = {}
+        for chunk in OfflineSyncService._chunks({scan['scanned_at'] for scan in scans}):
+            rows = db.session.execute(
+                select(AccessLog.pass_id, AccessLog.validation_time, AccessLog.status).where(
+                    AccessLog.validator_id == agent_id,
+                    AccessLog.is_offline.is_(True),
+                    AccessLog.validation_time.in_(chunk)
+                )
+            ).all()
+            logged.update({(pass_id, validation_time): status for pass_id, validation_time, status in rows})
+        return logged
+
+    @staticmethod
+    def sync_batch(events, agent_id, location=None, device_id=None):
+        """
+        events: [{'token', 'flight_id', 'timestamp', 'location'?}, ...]
+        Returns {'results': [{'index', 'code', 'error'?}, ...], 'summary': {code: count}};
+        a malformed event gets code INVALID and an error message.
+        Raises ValueError for an empty or oversized batch.
+        """
+        if not isinstance(events, list) or not events:
+            raise ValueError("Aucun scan à synchroniser")
+        if len(events) > OfflineSyncService.MAX_BATCH:
+            raise ValueError(f"Lot trop volumineux (max {OfflineSyncService.MAX_BATCH})")
+
+        received_at = datetime.utcnow()
+
+        # 1. Normalise events (no database access)
+        scans = []
+        rejected = []
+        for index, event in enumerate(events):
+            if not isinstance(event, dict):
+                rejected.append({'index': index, 'code': 'INVALID', 'error': "Scan invalide"})
+                continue
+            try:
+                flight_id = int(event.get('flight_id'))
+            except (TypeError, ValueError):
+                rejected.append({'index': index, 'code': 'INVALID', 'error': "Vol manquant"})
+                continue
+
+            token = event.get('token')
+            lookup_token = None
+            if isinstance(token, str) and token and len(token) <= 4096:
+                lookup_token, _, _ = GoPassService.resolve_token(token)
+
+            scans.append({
+                'index': index,
+                'token': lookup_token,
+                'flight_id': flight_id,
+                'scanned_at': OfflineSyncService._parse_time(event.get('timestamp'), received_at),
+                'location': event.get('location') or location,
+                'pass_id': None,
+                'code': None
+            })
+
+        # 2. Load the passes and flights involved, in chunked IN queries
+        passes = {}
+        tokens = {scan['token'] for scan in scans if scan['token']}
+        for chunk in OfflineSyncService._chunks(tokens):
+            rows = db.session.execute(
+                select(GoPass.token, GoPass.id, GoPass.flight_id, GoPass.status, GoPass.scan_date, GoPass.issue_date)
+                .where(GoPass.token.in_(chunk))
+            ).all()
+            for token, pass_id, pass_flight_id, status, scan_date, issue_date in rows:
+                passes[token] = (pass_id, pass_flight_id, status, scan_date, issue_date)
+
+        flight_ids = {scan['flight_id'] for scan in scans} | {p[1] for p in passes.values()}
+        flights = {}
+        for chunk in OfflineSyncService._chunks(flight_ids):
+            rows = db.session.execute(
+                select(Flight.id, Flight.departure_time).where(Flight.id.in_(chunk))
+            ).all()
+            flights.update({flight_id: departure_time.date() for flight_id, departure_time in rows})
+
+        # 3. Classify in memory; the earliest scan of each pass is its candidate
+        for scan in scans:
+            known = passes.get(scan['token']) if scan['token'] else None
+            scan['pass_id'] = known[0] if known else None
+            scan['scanned_at'] = OfflineSyncService._clamp_time(
+                scan['scanned_at'], known[4] if known else None, received_at
+            )
+
+        # A retried batch: scans already logged keep their outcome
+        logged = OfflineSyncService._logged(scans, agent_id)
+        for scan in scans:
+            scan['logged'] = logged.get((scan['pass_id'], scan['scanned_at']))
+
+        candidates = {}
+        for scan in sorted(scans, key=lambda s: s['scanned_at']):
+            if scan['logged']:
+                scan['code'] = scan['logged']
+                continue
+
+            known = passes.get(scan['token']) if scan['token'] else None
+            if known is None:
+                scan['code'] = 'INVALID'
+                continue
+
+            pass_id, pass_flight_id, status, scan_date, _ = known
+
+            # Same order as the online scan: consumed first, then the flight
+            if pass_id in candidates or (status == 'consumed' and scan_date is not None and scan_date <= scan['scanned_at']):
+                scan['code'] = 'ALREADY_SCANNED'
+                continue
+
+            if pass_flight_id != scan['flight_id']:
+                same_day = flights.get(pass_flight_id) == flights.get(scan['flight_id'])
+                scan['code'] = 'WRONG_FLIGHT' if same_day else 'EXPIRED'
+                continue
+
+            if status not in ('valid', 'consumed'):
+                scan['code'] = 'STATUS_CHANGED'
+                continue
+
+            candidates[pass_id] = scan
+
+        # 4. Consume in two set-based passes. Claims take passes still valid;
+        # takeovers replace a consumption recorded after this scan. The WHERE
+        # clauses keep both first-scan-wins under concurrent uploads.
+        table = GoPass.__table__
+        claimed = OfflineSyncService._consume(candidates, table.c.status == 'valid', agent_id)
+        remaining = {pass_id: scan for pass_id, scan in candidates.items() if pass_id not in claimed}
+        taken_over = OfflineSyncService._consume(remaining, and_(
+            table.c.status == 'consumed',
+            table.c.scan_date > bindparam('b_scan_date')
+        ), agent_id)
+
+        ScanIndexService.set_status(claimed, 'consumed')
+
+        for pass_id, scan in candidates.items():
+            scan['code'] = 'VALID' if pass_id in claimed or pass_id in taken_over else 'ALREADY_SCANNED'
+
+        # 5. Bulk audit trail and counters (a takeover boards no extra passenger)
+        log_rows = [
+            {
+                'pass_id': scan['pass_id'],
+                'validator_id': agent_id,
+                'validation_time': scan['scanned_at'],
+                'status': scan['code'],
+                'is_offline': True,
+                'flight_id': scan['flight_id'] if scan['flight_id'] in flights else None
+            }
+            for scan in scans
+            if not scan['logged']
+        ]
+        if log_rows:
+            db.session.execute(insert(AccessLog), log_rows)
+            FlightCounterService.record_scans(
+                row for row in log_rows if row['status'] != 'VALID' or row['pass_id'] in claimed
+            )
+
+        results = sorted(
+            [{'index': scan['index'], 'code': scan['code']} for scan in scans] + rejected,
+            key=lambda result: result['index']
+        )
+        summary = {}
+        for result in results:
+            summary[result['code']] = summary.get(result['code'], 0) + 1
+
+        conflicts = summary.get('ALREADY_SCANNED', 0)
+        db.session.add(OfflineSyncLog(
+            agent_id=agent_id,
+            sync_time=received_at,
+            record_count=len(results),
+            status='conflicts' if conflicts else 'success',
+            details=json.dumps({'device_id': device_id, 'summary': summary})
+        ))
+
+        db.session.commit()
+
+        return {'results': results, 'summary': summary}
@@ -0,0 +1,157 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for pass_number_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from flask import current_app
+from models import db, GoPass, Flight, PassNumberSequence
+from sqlalchemy import event, update, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+import os
+import threading
+
+# Prefix of passes without flight
+DEFAULT_PREFIX = 'GP'
+
+
+class PassNumberService:
+    """
+    Human-readable pass numbers, e.g. FIH-0001234.
+
+    Each worker process reserves a block of numbers per prefix (the
+    departure airport) from pass_number_sequences, then hands them out from
+    memory: issuing a number costs no round trip and takes no lock on a
+    shared counter. A reservation commits on its own connection, so numbers
+    are never reused; a block left unused when the worker stops is a gap.
+
+    SQLite has a single writer, so a separate connection would wait on the
+    sale's own write lock: the reservation joins the session's transaction
+    there, and blocks reserved by a transaction that rolls back are dropped.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._blocks = {} # prefix -> [next, end)
+        self._pid = os.getpid()
+
+    @staticmethod
+    def init_app(app):
+        service = PassNumberService(app)
+        app.extensions['pass_numbers'] = service
+        return service
+
+    @staticmethod
+    def get():
+        return current_app.extensions.get('pass_numbers')
+
+    @staticmethod
+    def format_number(prefix, number):
+        return f"{prefix}-{number:07d}"
+
+    @staticmethod
+    def prefix_for(flight):
+        return (flight.departure_airport if flight else None) or DEFAULT_PREFIX
+
+    @staticmethod
+    def reserve(connection, prefix, size):
+        """Moves the prefix sequence forward by size. Returns the first number of the block."""
+        table = PassNumberSequence.__table__
+        dialect = connection.dialect.name
+
+        if dialect in ('postgresql', 'sqlite'):
+            dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            connection.execute(dialect_insert(table).values(prefix=prefix, next_value=1).on_conflict_do_nothing())
+        elif connection.execute(select(table.c.prefix).where(table.c.prefix == prefix)).first() is None:
+            connection.execute(insert(table).values(prefix=prefix, next_value=1))
+
+        connection.execute(
+            update(table).where(table.c.prefix == prefix).values(next_value=table.c.next_value + size)
+        )
+        end = connection.execute(select(table.c.next_value).where(table.c.prefix == prefix)).scalar_one()
+        return end - size
+
+    def _reserve_block(self, prefix, size):
+        if db.engine.dialect.name == 'sqlite':
+            start = PassNumberService.reserve(db.session.connection(), prefix, size)
+            block = [start, start + size]
+            db.session.info.setdefault('pass_number_blocks', []).append((self, prefix, block))
+            return block
+
+        with db.engine.begin() as connection:
+            start = PassNumberService.reserve(connection, prefix, size)
+        return [start, start + size]
+
+    def _drop_block(self, prefix, block):
+        with self._lock:
+            if self._blocks.get(prefix) is block:
+                del self._blocks[prefix]
+
+    def allocate(self, prefix, count=1):
+        """Returns count formatted pass numbers for prefix, refilling the block when it runs out."""
+        numbers = []
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: blocks of the parent are not ours
+                self._blocks = {}
+                self._pid = os.getpid()
+
+            while len(numbers) < count:
+                block = self._blocks.get(prefix)
+                if block is None or block[0] >= block[1]:
+                    size = max(self.app.config.get('PASS_NUMBER_BLOCK_SIZE', 1000), count - len(numbers))
+                    block = self._blocks[prefix] = self._reserve_block(prefix, size)
+
+                take = min(count - len(numbers), block[1] - block[0])
+                numbers.extend(range(block[0], block[0] + take))
+                block[0] += take
+
+        return [PassNumberService.format_number(prefix, number) for number in numbers]
+
+    @staticmethod
+    def backfill(batch_size=1000):
+        """
+        Numbers the passes issued before the allocator existed, oldest first,
+        one committed batch at a time. Returns the number of passes updated.
+        """
+        service = PassNumberService.get()
+        total = 0
+        while True:
+            rows = db.session.query(GoPass.id, Flight.departure_airport)\
+                .outerjoin(Flight, Flight.id == GoPass.flight_id)\
+                .filter(GoPass.pass_number.is_(None))\
+                .order_by(GoPass.id)\
+                .limit(batch_size)\
+                .all()
+            if not rows:
+                return total
+
+            by_prefix = {}
+            for pass_id, airport in rows:
+                by_prefix.setdefault(airport or DEFAULT_PREFIX, []).append(pass_id)
+
+            values = []
+            for prefix, pass_ids in by_prefix.items():
+                values.extend(
+                    {'id': pass_id, 'pass_number': number}
+                    for pass_id, number in zip(pass_ids, service.allocate(prefix, len(pass_ids)))
+                )
+
+            db.session.execute(update(GoPass), values)
+            db.session.commit()
+            total += len(values)
+
+
+@event.listens_for(Session, 'after_commit')
+def _keep_reserved_blocks(session):
+    session.info.pop('pass_number_blocks', None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_reserved_blocks(session):
+    for service, prefix, block in session.info.pop('pass_number_blocks', []):
+        service._drop_block(prefix, block)
@@ -0,0 +1,113 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for pdf_cache.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from services.qr_cache import QRCache
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PdfCache(QRCache):
+    """
+    Cache of rendered ticket PDFs, keyed like QRCache.
+
+    The key (see GoPassService.pdf_etag) is a digest of everything printed
+    on the ticket, the pass status, the format, the language and the logo
+    files, and is sent as the strong ETag of the download: a status change
+    or a new logo gives a new key, so a stale PDF is never served. Single
+    tickets are kept in a bounded LRU (PDF_CACHE_SIZE entries per worker)
+    and in PDF_CACHE_DIR; batch documents only on disk, written while they
+    are streamed.
+
+    As for QR codes, a disk hit refreshes the file's mtime and prune() bounds
+    the directory (PDF_CACHE_MAX_AGE_DAYS, PDF_CACHE_MAX_MB).
+    """
+
+    suffix = '.pdf'
+
+    def __init__(self, app):
+        self.max_entries = app.config.get('PDF_CACHE_SIZE', 256)
+        self.disk_enabled = app.config.get('PDF_CACHE_DISK', True)
+        self.cache_dir = app.config.get('PDF_CACHE_DIR') or os.path.join(app.instance_path, 'pdf_cache')
+        self.max_age_days = app.config.get('PDF_CACHE_MAX_AGE_DAYS', 30)
+        self.max_mb = app.config.get('PDF_CACHE_MAX_MB', 2048)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.reset_stats()
+
+    @staticmethod
+    def init_app(app):
+        cache = PdfCache(app)
+        app.extensions['pdf_cache'] = cache
+        return cache
+
+    @staticmethod
+    def get():
+        if not has_app_context():
+            return None
+        return current_app.extensions.get('pdf_cache')
+
+    def cached_path(self, key):
+        """Path of the cached file for key, or None (counted as a disk hit or a miss)."""
+        path = self._path(key)
+        found = self.disk_enabled and os.path.isfile(path)
+        if found:
+            self._touch(path)
+        with self._lock:
+            if found:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+        return path if found else None
+
+    def store_stream(self, key, parts):
+        """
+        Yields the parts of a streamed document while writing them to the
+        disk cache. The file is published only once the whole document has
+        been produced: an interrupted download leaves nothing behind.
+        """
+        if not self.disk_enabled:
+            yield from parts
+            return
+
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = open(tmp_path, 'wb')
+        except OSError as e:
+            logger.warning(f"PDF cache write failed ({path}): {e}")
+            yield from parts
+            return
+
+        complete = False
+        try:
+            for part in parts:
+                if f is not None:
+                    try:
+                        f.write(part)
+                    except OSError as e:
+                        logger.warning(f"PDF cache write failed ({path}): {e}")
+                        f.close()
+                        f = None
+                yield part
+            complete = f is not None
+        finally:
+            if f is not None:
+                f.close()
+            try:
+                if complete:
+                    os.replace(tmp_path, path)
+                else:
+                    os.remove(tmp_path)
+            except OSError:
+                pass
@@ -0,0 +1,90 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for pdf_render_pool.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+import multiprocessing
+import os
+import threading
+
+
+class PdfRenderPool:
+    """
+    Process pool for bulk PDF rendering.
+
+    Ticket pages are independent: a large order is cut into chunks of
+    BULK_PDF_CHUNK_SIZE items rendered in BULK_PDF_WORKERS processes, and
+    the results come back in order for merging. Workers only get plain,
+    picklable data and need neither the database nor an application
+    context. The pool starts on first use with the 'spawn' method, so no
+    thread or database connection of the web worker is inherited, and is
+    then reused by the requests of this process.
+    """
+
+    def __init__(self, app):
+        self.workers = app.config.get('BULK_PDF_WORKERS') or os.cpu_count() or 1
+        self.chunk_size = max(1, app.config.get('BULK_PDF_CHUNK_SIZE', 100))
+        self.min_items = app.config.get('BULK_PDF_PARALLEL_MIN', 200)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    @staticmethod
+    def init_app(app):
+        pool = PdfRenderPool(app)
+        app.extensions['pdf_render_pool'] = pool
+        return pool
+
+    @staticmethod
+    def get():
+        return current_app.extensions.get('pdf_render_pool')
+
+    def should_split(self, count):
+        """Below min_items, or with a single worker, the pool costs more than it saves."""
+        return self.workers > 1 and count >= max(self.min_items, 2)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def map_chunks(self, func, items, *args):
+        """Calls func(chunk, *args) for each chunk of items in the pool. Returns the results in order."""
+        executor = self._get_executor()
+        futures = [
+            executor.submit(func, items[i:i + self.chunk_size], *args)
+            for i in range(0, len(items), self.chunk_size)
+        ]
+        return [future.result() for future in futures]
+
+    def imap(self, func, chunks, *args):
+        """
+        Calls func(chunk, *args) for each chunk of an iterable in the pool and
+        yields the results in order, with at most two chunks per worker
+        rendered ahead of the consumer.
+        """
+        executor = self._get_executor()
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(func, chunk, *args))
+            if len(pending) >= 2 * self.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,123 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for pdf_stream_writer.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject
+import io
+
+
+class PdfStreamWriter:
+    """
+    Writes one PDF document out of a sequence of PDF parts, part by part.
+
+    Each part (a complete PDF, e.g. a chunk of tickets rendered by
+    ReportLab) is parsed, the objects reachable from its pages are
+    renumbered and returned as bytes at once. Only the object offsets and
+    page numbers are kept; end() writes the page tree, the catalog and the
+    cross-reference table. Resources shared by the pages of a part (fonts,
+    ticket template, logos) are written once per part.
+
+        writer = PdfStreamWriter()
+        yield writer.begin()
+        for part in parts:
+            yield writer.add_part(part)
+        yield writer.end()
+    """
+
+    CATALOG = 1
+    PAGES = 2
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {} # object number -> byte offset in the output
+        self.next_number = PdfStreamWriter.PAGES + 1
+        self.pages = []
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def begin(self):
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    @staticmethod
+    def _references(value):
+        if isinstance(value, IndirectObject):
+            yield value
+        elif isinstance(value, DictionaryObject):
+            for key, item in value.items():
+                if key != '/Parent':
+                    yield from PdfStreamWriter._references(item)
+        elif isinstance(value, ArrayObject):
+            for item in value:
+                yield from PdfStreamWriter._references(item)
+
+    @staticmethod
+    def _renumber(value, numbers):
+        """Points the references inside value to their output numbers, in place."""
+        if isinstance(value, IndirectObject):
+            return IndirectObject(numbers[value.idnum], 0, None)
+        if isinstance(value, DictionaryObject):
+            for key in list(value.keys()):
+                if key != '/Parent':
+                    value[key] = PdfStreamWriter._renumber(value.raw_get(key), numbers)
+        elif isinstance(value, ArrayObject):
+            for i, item in enumerate(value):
+                value[i] = PdfStreamWriter._renumber(item, numbers)
+        return value
+
+    def add_part(self, pdf_bytes):
+        """Bytes of the pages of pdf_bytes and of the objects they use."""
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        numbers = {} # object number in the part -> number in the output
+        order = []
+        page_ids = []
+
+        for page in reader.pages:
+            page_ids.append(page.indirect_reference.idnum)
+            stack = [page.indirect_reference]
+            while stack:
+                ref = stack.pop()
+                if ref.idnum in numbers:
+                    continue
+                numbers[ref.idnum] = self.next_number
+                self.next_number += 1
+                order.append(ref.idnum)
+                stack.extend(PdfStreamWriter._references(ref.get_object()))
+
+        out = io.BytesIO()
+        for idnum in order:
+            obj = PdfStreamWriter._renumber(reader.get_object(idnum), numbers)
+            if idnum in page_ids:
+                obj[NameObject('/Parent')] = IndirectObject(PdfStreamWriter.PAGES, 0, None)
+
+            number = numbers[idnum]
+            self.offsets[number] = self.offset + out.tell()
+            out.write(f"{number} 0 obj\n".encode())
+            obj.write_to_stream(out)
+            out.write(b"\nendobj\n")
+
+        self.pages.extend(numbers[idnum] for idnum in page_ids)
+        return self._emit(out.getvalue())
+
+    def end(self):
+        out = io.BytesIO()
+        kids = ' '.join(f"{number} 0 R" for number in self.pages)
+
+        self.offsets[PdfStreamWriter.PAGES] = self.offset + out.tell()
+        out.write(f"{PdfStreamWriter.PAGES} 0 obj\n<< /Type /Pages /Kids [ {kids} ] /Count {len(self.pages)} >>\nendobj\n".encode())
+        self.offsets[PdfStreamWriter.CATALOG] = self.offset + out.tell()
+        out.write(f"{PdfStreamWriter.CATALOG} 0 obj\n<< /Type /Catalog /Pages {PdfStreamWriter.PAGES} 0 R >>\nendobj\n".encode())
+
+        xref_offset = self.offset + out.tell()
+        size = self.next_number
+        out.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+        for number in range(1, size):
+            out.write(f"{self.offsets[number]:010d} 00000 n \n".encode())
+        out.write(f"trailer\n<< /Size {size} /Root {PdfStreamWriter.CATALOG} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+        return self._emit(out.getvalue())
@@ -0,0 +1,239 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for print_spooler_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from models import db, PrintJob, Printer
+from services.escpos_service import EscPosService
+from services.gopass_service import GoPassService
+from sqlalchemy import update, or_, and_, exists
+from sqlalchemy.orm import aliased
+from datetime import datetime, timedelta
+from flask import current_app
+import logging
+import os
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Delay before the n-th retry: 5 s, 10 s, 20 s, ... capped at 1 min
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 60
+
+
+class PrintSpoolerService:
+    """
+    Queue of raw ESC/POS jobs for the network printers of the counters.
+
+    A sale stores one PrintJob per ticket and returns at once; worker
+    threads (PRINT_SPOOLER_WORKERS per web worker, or scripts/print_spooler.py)
+    claim queued jobs with a conditional UPDATE, like FulfilmentService, and
+    send their bytes to Printer.ip_address on the raw port (9100). A printer
+    gets one job at a time, oldest first: a job waiting for a retry holds
+    back the later jobs of its printer, so tickets come out whole and in
+    order.
+
+    A send error marks the printer offline and the job is retried with
+    backoff up to PRINT_MAX_ATTEMPTS; the next success marks it connected.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    @staticmethod
+    def init_app(app):
+        service = PrintSpoolerService(app)
+        app.extensions['print_spooler'] = service
+        if app.config.get('WORKERS_AUTOSTART'):
+            # As FulfilmentService: jobs left queued by a restart are sent
+            # without waiting for the next sale
+            app.before_request(service.start)
+        return service
+
+    @staticmethod
+    def get():
+        return current_app.extensions.get('print_spooler')
+
+    @staticmethod
+    def printer_for(user):
+        """Network printer assigned to the user (workstation), or None."""
+        return Printer.query.filter(Printer.assigned_to == user.id, Printer.ip_address.isnot(None))\
+            .order_by(Printer.id).first()
+
+    @staticmethod
+    def enqueue(printer, payload, gopass_id=None, created_by=None, commit=True):
+        """
+        Stores the job and wakes the local workers. Returns the job.
+        With commit=False the caller commits, then calls notify().
+        """
+        job = PrintJob(printer_id=printer.id, payload=payload, gopass_id=gopass_id, created_by=created_by)
+        db.session.add(job)
+        if commit:
+            db.session.commit()
+            PrintSpoolerService.notify()
+        else:
+            db.session.flush()
+        return job
+
+    @staticmethod
+    def enqueue_tickets(printer, gopasses, lang='fr', created_by=None):
+        """One ESC/POS job per pass, in order. Returns the jobs."""
+        jobs = [
+            PrintSpoolerService.enqueue(
+                printer,
+                EscPosService.render_ticket(GoPassService._bulk_ticket(gopass), lang),
+                gopass_id=gopass.id, created_by=created_by, commit=False
+            )
+            for gopass in gopasses
+        ]
+        db.session.commit()
+        PrintSpoolerService.notify()
+        return jobs
+
+    @staticmethod
+    def notify():
+        """Wakes the workers of this process, starting them if needed."""
+        service = PrintSpoolerService.get()
+        if service is not None:
+            service.start()
+            service.wake()
+
+    # --- Workers ---
+
+    def start(self, workers=None):
+        """Starts the worker threads of this process (once per process)."""
+        workers = self.app.config.get('PRINT_SPOOLER_WORKERS', 1) if workers is None else workers
+        if workers <= 0 or (self._threads and self._pid == os.getpid()):
+            return
+
+        with self._lock:
+            if self._threads and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'print-spooler-{i}', daemon=True)
+                for i in range(workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        poll_interval = float(self.app.config.get('PRINT_POLL_INTERVAL', 2.0))
+        with self.app.app_context():
+            while True:
+                try:
+                    processed = self.run_pending()
+                except Exception as e:
+                    logger.error(f"Print spooler error: {e}")
+                    db.session.rollback()
+                    processed = 0
+                finally:
+                    db.session.remove()
+
+                if not processed:
+                    self._wakeup.wait(poll_interval)
+                    self._wakeup.clear()
+
+    def run_pending(self, max_jobs=None):
+        """Claims and sends due jobs until none is left. Returns the number processed."""
+        processed = 0
+        while max_jobs is None or processed < max_jobs:
+            job_id = self.claim()
+            if job_id is None:
+                break
+            self.process(job_id)
+            processed += 1
+        return processed
+
+    def _claimable(self, now):
+        lease = timedelta(seconds=self.app.config.get('PRINT_LEASE_SECONDS', 60))
+        return or_(
+            and_(PrintJob.status == 'queued', PrintJob.run_after <= now),
+            and_(PrintJob.status == 'sending', PrintJob.started_at < now - lease)
+        )
+
+    def _printer_busy(self, now):
+        """Another job of the same printer is being sent, or an earlier one is still pending."""
+        lease = timedelta(seconds=self.app.config.get('PRINT_LEASE_SECONDS', 60))
+        other = aliased(PrintJob)
+        return exists().where(
+            other.printer_id == PrintJob.printer_id,
+            other.id != PrintJob.id,
+            or_(
+                and_(other.status == 'sending', other.started_at >= now - lease),
+                and_(other.id < PrintJob.id, other.status.in_(('queued', 'sending')))
+            )
+        )
+
+    def claim(self):
+        """Marks one due job as sending for this worker. Returns its id, or None."""
+        now = datetime.utcnow()
+        candidates = db.session.query(PrintJob.id, PrintJob.printer_id)\
+            .filter(self._claimable(now), ~self._printer_busy(now))\
+            .order_by(PrintJob.id)\
+            .limit(10)\
+            .all()
+
+        for job_id, printer_id in candidates:
+            # The printer row lock orders the claims of its jobs; the
+            # conditional UPDATE then lets one worker win a given job
+            db.session.query(Printer.id).filter(Printer.id == printer_id).with_for_update().first()
+            result = db.session.execute(
+                update(PrintJob)
+                .where(PrintJob.id == job_id, self._claimable(now), ~self._printer_busy(now))
+                .values(status='sending', started_at=now, attempts=PrintJob.attempts + 1)
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                return job_id
+        return None
+
+    def process(self, job_id):
+        job = db.session.get(PrintJob, job_id)
+        try:
+            self.send(job.printer, job.payload)
+            job.status = 'done'
+            job.last_error = None
+            job.finished_at = datetime.utcnow()
+            job.printer.status = 'connected'
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            # A printer without address will not fix itself: no retry
+            self._fail(job_id, e, permanent=isinstance(e, ValueError))
+
+    def send(self, printer, payload):
+        """Writes payload to the raw port of printer."""
+        if not printer.ip_address:
+            raise ValueError(f"Imprimante {printer.name} sans adresse réseau")
+        timeout = self.app.config.get('PRINT_SOCKET_TIMEOUT', 10.0)
+        with socket.create_connection((printer.ip_address, printer.port or 9100), timeout=timeout) as sock:
+            sock.sendall(payload)
+
+    def _fail(self, job_id, error, permanent=False):
+        job = db.session.get(PrintJob, job_id)
+        job.last_error = f"{error.__class__.__name__}: {error}"
+        if isinstance(error, OSError):
+            job.printer.status = 'offline'
+        max_attempts = self.app.config.get('PRINT_MAX_ATTEMPTS', 5)
+
+        if permanent or job.attempts >= max_attempts:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            logger.error(f"Print job {job.id} failed after {job.attempts} attempt(s): {job.last_error}")
+        else:
+            delay = min(RETRY_BASE_SECONDS * 2 ** (job.attempts - 1), RETRY_MAX_SECONDS)
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        db.session.commit()
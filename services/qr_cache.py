@@ -0,0 +1,214 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for qr_cache.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app, has_app_context
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QRCache:
+    """
+    Cache of rendered QR code PNGs.
+
+    Renders are content-addressed: the key is a SHA-256 of the style, the
+    module size and the encoded data (which carries the pass token and its
+    signature), so a key rotation or a flight change gives a new key and a
+    stale image is never served. Recent renders are kept in a bounded LRU
+    (QR_CACHE_SIZE entries per worker); every render is also written to
+    QR_CACHE_DIR, shared by the workers and kept across restarts. Other
+    renders of the same data (QRService.matrix) pass their own file suffix.
+
+    A disk hit refreshes the file's mtime; prune() (scripts/prune_caches.py,
+    from cron) deletes the files unused for QR_CACHE_MAX_AGE_DAYS, then the
+    least recently used ones above QR_CACHE_MAX_MB.
+    """
+
+    suffix = '.png'
+
+    def __init__(self, app):
+        self.max_entries = app.config.get('QR_CACHE_SIZE', 1024)
+        self.disk_enabled = app.config.get('QR_CACHE_DISK', True)
+        self.cache_dir = app.config.get('QR_CACHE_DIR') or os.path.join(app.instance_path, 'qr_cache')
+        self.max_age_days = app.config.get('QR_CACHE_MAX_AGE_DAYS', 30)
+        self.max_mb = app.config.get('QR_CACHE_MAX_MB', 512)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.reset_stats()
+
+    @staticmethod
+    def init_app(app):
+        cache = QRCache(app)
+        app.extensions['qr_cache'] = cache
+        return cache
+
+    @staticmethod
+    def get():
+        if not has_app_context():
+            return None
+        return current_app.extensions.get('qr_cache')
+
+    @staticmethod
+    def make_key(data, style, box_size):
+        return hashlib.sha256(f"{style}|{box_size}|{data}".encode('utf-8')).hexdigest()
+
+    def reset_stats(self):
+        with self._lock:
+            self.since = datetime.utcnow()
+            self.memory_hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def clear(self):
+        """Drops the in-memory entries (the disk cache is kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def fetch(self, key, render, suffix=None):
+        """
+        PNG bytes for key, calling render() only when neither cache has them.
+        suffix overrides the file suffix of the disk entry (default: self.suffix).
+        """
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return png
+
+        png = self._read(key, suffix)
+        if png is not None:
+            hit = 'disk'
+        else:
+            png = render()
+            self._write(key, png, suffix)
+            hit = None
+
+        with self._lock:
+            if hit:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return png
+
+    def _path(self, key, suffix=None):
+        return os.path.join(self.cache_dir, key[:2], f"{key}{suffix or self.suffix}")
+
+    def _read(self, key, suffix=None):
+        if not self.disk_enabled:
+            return None
+        path = self._path(key, suffix)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._touch(path)
+        return data
+
+    @staticmethod
+    def _touch(path):
+        """Marks the file as recently used for prune()."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _write(self, key, png, suffix=None):
+        if not self.disk_enabled:
+            return
+        path = self._path(key, suffix)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(png)
+            # Atomic: a concurrent reader sees the whole file or none
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"QR cache write failed ({path}): {e}")
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'pid': os.getpid(),
+                'since': self.since.isoformat(),
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'disk_enabled': self.disk_enabled,
+                'lookups': lookups,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+                'memory_hit_ratio': round(self.memory_hits / lookups, 4) if lookups else None
+            }
+
+    def prune(self, max_age_days=None, max_mb=None):
+        """
+        Deletes the disk entries unused for max_age_days, then the least
+        recently used ones until the directory fits in max_mb, and the
+        temporary files of interrupted writes. Returns (files, bytes) removed.
+        """
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        max_mb = self.max_mb if max_mb is None else max_mb
+        now = time.time()
+
+        entries = []
+        removed_files = removed_bytes = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                tmp = name.endswith('.tmp')
+                stale_tmp = tmp and now - stat.st_mtime > 3600
+                expired = not tmp and max_age_days and now - stat.st_mtime > max_age_days * 86400
+                if stale_tmp or expired:
+                    if self._unlink(path):
+                        removed_files += 1
+                        removed_bytes += stat.st_size
+                elif not tmp:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        if max_mb:
+            total = sum(size for _, size, _ in entries)
+            limit = max_mb * 1024 * 1024
+            for _, size, path in sorted(entries):
+                if total <= limit:
+                    break
+                if self._unlink(path):
+                    removed_files += 1
+                    removed_bytes += size
+                total -= size
+
+        return removed_files, removed_bytes
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
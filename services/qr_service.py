@@ -7,56 +7,89 @@
 """
 
 import qrcode
-from qrcode.image.styledpil import StyledPilImage
-from qrcode.image.styles.moduledrawers import RoundedModuleDrawer
-import os
-from datetime import datetime
+from services.qr_cache import QRCache
+import io
 
 class QRService:
-    UPLOAD_FOLDER = 'statics/uploads/qrcodes'
-    
+    # Module size (pixels) of each render style; part of the cache key
+    DEFAULT_BOX_SIZE = {'ticket': 10}
+
+    # Quiet zone around ticket QR codes, in modules
+    TICKET_BORDER = 5
+
+    # Disk cache suffix of module matrices (ASCII rows, not PNGs)
+    MATRIX_SUFFIX = '.txt'
+
     @staticmethod
-    def ensure_upload_folder():
-        if not os.path.exists(QRService.UPLOAD_FOLDER):
-            os.makedirs(QRService.UPLOAD_FOLDER)
-    
+    def _render(data, style, box_size):
+        # Ticket QR: plain black on white, read by the gate scanners
+        qr = qrcode.QRCode(version=1, box_size=box_size, border=5)
+        qr.add_data(data)
+        qr.make(fit=True)
+        img = qr.make_image(fill_color="black", back_color="white")
+
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue()
+
     @staticmethod
-    def generate_qr_code(data, filename=None):
-        QRService.ensure_upload_folder()
-        
-        if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            filename = f"qr_{data}_{timestamp}.png"
-        
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
-        )
+    def render_png(data, style='ticket', box_size=None):
+        """
+        PNG bytes of the QR code of data. Served from QRCache when the same
+        data, style and size were rendered before.
+        """
+        box_size = box_size or QRService.DEFAULT_BOX_SIZE[style]
+        cache = QRCache.get()
+        if cache is None:
+            return QRService._render(data, style, box_size)
+        return cache.fetch(QRCache.make_key(data, style, box_size), lambda: QRService._render(data, style, box_size))
+
+    @staticmethod
+    def _encode(data):
+        qr = qrcode.QRCode(version=1, border=0)
         qr.add_data(data)
         qr.make(fit=True)
-        
-        img = qr.make_image(
-            image_factory=StyledPilImage,
-            module_drawer=RoundedModuleDrawer(),
-            fill_color="#1E3A8A",
-            back_color="white"
-        )
-        
-        filepath = os.path.join(QRService.UPLOAD_FOLDER, filename)
-        img.save(filepath)
-        
-        return filename
-    
+        return '\n'.join(''.join('1' if module else '0' for module in row) for row in qr.get_matrix()).encode('ascii')
+
     @staticmethod
-    def get_qr_path(filename):
-        return os.path.join(QRService.UPLOAD_FOLDER, filename)
-    
+    def matrix(data):
+        """
+        Module matrix of the ticket QR code of data, without quiet zone:
+        one string of '0'/'1' per row, top row first. Cached like the PNGs,
+        in MATRIX_SUFFIX files.
+        """
+        cache = QRCache.get()
+        if cache is None:
+            encoded = QRService._encode(data)
+        else:
+            encoded = cache.fetch(QRCache.make_key(data, 'matrix', 1), lambda: QRService._encode(data), suffix=QRService.MATRIX_SUFFIX)
+        return encoded.decode('ascii').split('\n')
+
     @staticmethod
-    def delete_qr_code(filename):
-        filepath = os.path.join(QRService.UPLOAD_FOLDER, filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            return True
-        return False
+    def draw_matrix(canvas, matrix, x, y, size, border=None):
+        """
+        Draws a QR matrix as filled vector rectangles in the size x size square
+        whose lower-left corner is (x, y). Dark modules of a row are merged
+        into one rectangle per run; the whole code is a single path.
+        """
+        border = QRService.TICKET_BORDER if border is None else border
+        count = len(matrix)
+        module = size / (count + 2 * border)
+
+        canvas.saveState()
+        canvas.setFillColorRGB(1, 1, 1)
+        canvas.rect(x, y, size, size, stroke=0, fill=1)
+        canvas.setFillColorRGB(0, 0, 0)
+
+        path = canvas.beginPath()
+        for r, row in enumerate(matrix):
+            row_y = y + size - (border + r + 1) * module
+            c = row.find('1')
+            while c != -1:
+                end = row.find('0', c)
+                if end == -1:
+                    end = count
+                path.rect(x + (border + c) * module, row_y, (end - c) * module, module)
+                c = row.find('1', end)
+        canvas.drawPath(path, stroke=0, fill=1)
+        canvas.restoreState()
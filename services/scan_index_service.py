@@ -0,0 +1,147 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for scan_index_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from models import db, ScanIndex, GoPass, Flight
+from sqlalchemy import select, update, insert, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from collections import namedtuple
+import hashlib
+
+# Bound parameters per IN (...) query, below the SQLite variable limit
+CHUNK_SIZE = 500
+
+ScanEntry = namedtuple('ScanEntry', ['pass_id', 'flight_id', 'flight_date', 'departure_airport', 'status'])
+
+
+class ScanIndexService:
+    """
+    Narrow projection of gopasses for the scan path (table scan_index).
+
+    One short row per pass, keyed by the 16-byte token digest, holds what a
+    gate needs to classify a scan: pass id, flight id, flight date, departure
+    airport and status. Passenger and payment columns stay in gopasses and
+    are only read for the VALID and ALREADY_SCANNED responses.
+
+    Rows are written inside the caller's transaction by every path that
+    creates or consumes a pass, so they commit or roll back with it.
+    rebuild() backfills passes sold before the index existed and repairs
+    drift from out-of-band writes.
+    """
+
+    @staticmethod
+    def digest(token):
+        """16-byte digest of a GoPass token (also the offline token pack key)."""
+        return hashlib.sha256(token.encode()).digest()[:16]
+
+    @staticmethod
+    def _row(token, pass_id, status, flight_id, departure_time, departure_airport):
+        return {
+            'token_digest': ScanIndexService.digest(token),
+            'pass_id': pass_id,
+            'flight_id': flight_id,
+            'flight_date': departure_time.date(),
+            'departure_airport': departure_airport,
+            'status': status or 'valid'
+        }
+
+    @staticmethod
+    def _insert(rows):
+        """Inserts index rows, ignoring passes another worker indexed first."""
+        table = ScanIndex.__table__
+        dialect = db.session.get_bind().dialect.name
+
+        if dialect in ('postgresql', 'sqlite'):
+            dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            db.session.execute(dialect_insert(table).on_conflict_do_nothing(), rows)
+            return
+
+        db.session.execute(insert(table), rows)
+
+    @staticmethod
+    def add(gopass, flight):
+        """Indexes a new pass. gopass.id must be assigned (flush first)."""
+        return ScanIndexService.add_many([gopass], flight)[0]
+
+    @staticmethod
+    def add_many(gopasses, flight):
+        """Indexes new passes of one flight in a single insert. Returns their ScanEntry."""
+        rows = [
+            ScanIndexService._row(
+                gopass.token, gopass.id, gopass.status,
+                flight.id, flight.departure_time, flight.departure_airport
+            )
+            for gopass in gopasses
+        ]
+        ScanIndexService._insert(rows)
+        return [
+            ScanEntry(row['pass_id'], row['flight_id'], row['flight_date'], row['departure_airport'], row['status'])
+            for row in rows
+        ]
+
+    @staticmethod
+    def lookup(token):
+        """Returns the ScanEntry for a token, or None when it is not indexed."""
+        row = db.session.execute(
+            select(
+                ScanIndex.pass_id,
+                ScanIndex.flight_id,
+                ScanIndex.flight_date,
+                ScanIndex.departure_airport,
+                ScanIndex.status
+            ).where(ScanIndex.token_digest == ScanIndexService.digest(token))
+        ).first()
+        return ScanEntry(*row) if row else None
+
+    @staticmethod
+    def set_status(pass_ids, status):
+        """Mirrors a GoPass status change, in the caller's transaction."""
+        pass_ids = list(pass_ids)
+        for i in range(0, len(pass_ids), CHUNK_SIZE):
+            db.session.execute(
+                update(ScanIndex)
+                .where(ScanIndex.pass_id.in_(pass_ids[i:i + CHUNK_SIZE]))
+                .values(status=status)
+            )
+
+    @staticmethod
+    def rebuild(batch_size=CHUNK_SIZE):
+        """
+        Rewrites the index from gopasses and flights in pass id order, one
+        committed batch at a time. Returns the number of rows written.
+        """
+        table = ScanIndex.__table__
+        written = 0
+        last_id = 0
+
+        while True:
+            rows = db.session.execute(
+                select(
+                    GoPass.token,
+                    GoPass.id,
+                    GoPass.status,
+                    GoPass.flight_id,
+                    Flight.departure_time,
+                    Flight.departure_airport
+                ).join(
+                    Flight, GoPass.flight_id == Flight.id
+                ).where(
+                    GoPass.id > last_id
+                ).order_by(GoPass.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            pass_ids = [row.id for row in rows]
+            db.session.execute(delete(table).where(table.c.pass_id.in_(pass_ids)))
+            db.session.execute(insert(table), [ScanIndexService._row(*row) for row in rows])
+            db.session.commit()
+
+            written += len(rows)
+            last_id = pass_ids[-1]
+
+        return written
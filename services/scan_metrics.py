@@ -0,0 +1,252 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for scan_metrics.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from datetime import datetime
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import current_app
+import os
+import threading
+import time
+import weakref
+
+# Histogram bucket upper bounds in milliseconds: four buckets per doubling
+# from 0.05 ms to ~52 s, so a percentile is read within about 19%.
+BUCKET_BOUNDS = [0.05 * 2 ** (i / 4) for i in range(81)]
+
+# Scan phases, in the order the scan path goes through them
+PHASES = ('resolve', 'lookup', 'update', 'log', 'commit')
+
+GROUP_KEYS = ('outcome', 'airport', 'flight_id')
+
+# Distinct (outcome, airport, flight) series kept per thread and in the base
+# shard of exited threads; scans beyond are folded into a series without
+# flight so memory stays bounded.
+MAX_SERIES = 4096
+
+_active = threading.local()
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, ms):
+        self.counts[bisect_left(BUCKET_BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += ms
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th sample (0 < q <= 1)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return round(BUCKET_BOUNDS[min(i, len(BUCKET_BOUNDS) - 1)], 3)
+        return round(BUCKET_BOUNDS[-1], 3)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count, 3) if self.count else None,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99)
+        }
+
+
+class ScanTimer:
+    """Timing of one scan in progress; phases accumulate between laps."""
+    __slots__ = ('started', 'last', 'phases', 'outcome')
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.phases = {}
+        self.outcome = None
+
+
+class ScanMetrics:
+    """
+    Latency histograms for GoPassService.validate_gopass.
+
+    Every scan is timed end to end and split into phases (token resolution,
+    lookup, conditional update, access log, commit) by ScanMetrics.lap()
+    calls along the scan path. Samples are kept per (outcome, airport,
+    flight) in log-scale histograms.
+
+    Recording takes no lock: each thread writes to its own shard, and
+    snapshot() merges the shards when the admin endpoint is read. The shard
+    of a thread that has exited is folded into a base shard, so memory stays
+    bounded under servers that start a thread per request. Figures cover
+    the current worker process since it started.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.started_at = datetime.utcnow()
+        self._local = threading.local()
+        self._base = {}
+        self._shards = []  # [(weakref to the owning thread, shard)]
+        self._shards_lock = threading.Lock()
+
+    @staticmethod
+    def init_app(app):
+        metrics = ScanMetrics(app)
+        app.extensions['scan_metrics'] = metrics
+        return metrics
+
+    @staticmethod
+    def get():
+        return current_app.extensions.get('scan_metrics')
+
+    def is_enabled(self):
+        return self.app.config.get('SCAN_METRICS_ENABLED', True)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._fold_dead_shards()
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+        return shard
+
+    def _fold_dead_shards(self):
+        """Merges the shards of exited threads into the base. Caller holds _shards_lock."""
+        live = []
+        for thread_ref, shard in self._shards:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                live.append((thread_ref, shard))
+                continue
+            for key, (total, phase_histograms) in shard.items():
+                base_total, base_phases = self._series(self._base, key)
+                base_total.merge(total)
+                for phase, histogram in phase_histograms.items():
+                    base_phases.setdefault(phase, Histogram()).merge(histogram)
+        self._shards = live
+
+    @staticmethod
+    def _series(shard, key):
+        series = shard.get(key)
+        if series is None:
+            if len(shard) >= MAX_SERIES:
+                key = key[:2] + (None,)
+                series = shard.get(key)
+            if series is None:
+                series = shard[key] = (Histogram(), {})
+        return series
+
+    def record(self, outcome, airport, flight_id, total_ms, phases):
+        total, phase_histograms = self._series(self._shard(), (outcome, airport, flight_id))
+        total.add(total_ms)
+        for phase, ms in phases.items():
+            histogram = phase_histograms.get(phase)
+            if histogram is None:
+                histogram = phase_histograms[phase] = Histogram()
+            histogram.add(ms)
+
+    @staticmethod
+    @contextmanager
+    def measure(flight_id, airport):
+        """
+        Times the scan run inside the block. The caller sets .outcome on the
+        yielded timer; a scan that raises is recorded as ERROR.
+        """
+        metrics = ScanMetrics.get()
+        if metrics is None or not metrics.is_enabled():
+            yield ScanTimer()
+            return
+
+        try:
+            flight_id = int(flight_id)
+        except (TypeError, ValueError):
+            flight_id = None
+
+        timer = _active.timer = ScanTimer()
+        try:
+            yield timer
+        except Exception:
+            timer.outcome = 'ERROR'
+            raise
+        finally:
+            _active.timer = None
+            total_ms = (time.perf_counter() - timer.started) * 1000.0
+            metrics.record(
+                timer.outcome or 'UNKNOWN', airport or None, flight_id,
+                total_ms, {phase: s * 1000.0 for phase, s in timer.phases.items()}
+            )
+
+    @staticmethod
+    def lap(phase):
+        """Charges the time since the previous lap to phase. No-op outside a scan."""
+        timer = getattr(_active, 'timer', None)
+        if timer is None:
+            return
+        now = time.perf_counter()
+        timer.phases[phase] = timer.phases.get(phase, 0.0) + (now - timer.last)
+        timer.last = now
+
+    def snapshot(self, group_by=('outcome',), airport=None, flight_id=None):
+        """
+        Merges every shard and returns one summary per group, busiest first.
+        group_by is a subset of GROUP_KEYS; airport and flight_id filter.
+        """
+        group_by = [key for key in GROUP_KEYS if key in group_by]
+        groups = {}
+        # The lock keeps a concurrent fold from moving a shard into the base
+        # while it is being merged; recording itself does not take it.
+        with self._shards_lock:
+            self._fold_dead_shards()
+            for shard in [self._base] + [shard for _, shard in self._shards]:
+                for key, (total, phase_histograms) in list(shard.items()):
+                    labels = dict(zip(GROUP_KEYS, key))
+                    if airport is not None and labels['airport'] != airport:
+                        continue
+                    if flight_id is not None and labels['flight_id'] != flight_id:
+                        continue
+
+                    group_key = tuple(labels[name] for name in group_by)
+                    group = groups.get(group_key)
+                    if group is None:
+                        group = groups[group_key] = (Histogram(), {phase: Histogram() for phase in PHASES})
+                    group[0].merge(total)
+                    for phase, histogram in list(phase_histograms.items()):
+                        group[1].setdefault(phase, Histogram()).merge(histogram)
+
+        result = []
+        for group_key, (total, phase_histograms) in groups.items():
+            entry = dict(zip(group_by, group_key))
+            entry.update(total.summary())
+            entry['phases'] = {
+                phase: histogram.summary()
+                for phase, histogram in phase_histograms.items() if histogram.count
+            }
+            result.append(entry)
+
+        result.sort(key=lambda entry: entry['count'], reverse=True)
+        return {
+            'pid': os.getpid(),
+            'since': self.started_at.isoformat(),
+            'group_by': group_by,
+            'series': result
+        }
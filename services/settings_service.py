@@ -7,6 +7,7 @@
 """
 
 from models import db, Airport, Airline, Tariff, AppConfig
+from services.branding_service import BrandingService
 from sqlalchemy.exc import IntegrityError
 import os
 import json
@@ -37,6 +38,7 @@ class SettingsService:
             config.description = description
 
         db.session.commit()
+        BrandingService.invalidate() # Ticket logos come from AppConfig
         return config
 
     @staticmethod
@@ -0,0 +1,123 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for stripe_event_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from models import db, StripeEvent
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+
+# Event types that get a fulfilment job; the others are stored as 'ignored'
+HANDLED_TYPES = ('payment_intent.succeeded',)
+
+# received -> processing -> processed | failed (-> received on replay); ignored is final
+STATUSES = ('received', 'processing', 'processed', 'failed', 'ignored')
+FINAL_STATUSES = ('processed', 'failed', 'ignored')
+
+
+class StripeEventService:
+    """
+    Store of Stripe webhook events, keyed by Stripe event id.
+
+    Stripe delivers each event at least once. The first delivery inserts
+    the event with its fulfilment job in one transaction; a redelivery
+    conflicts on the primary key and is answered without any other read
+    or write, whatever the size of the order. The event status follows its
+    job (see FulfilmentService) and failed events can be replayed.
+    """
+
+    @staticmethod
+    def record(event):
+        """
+        Stores a verified webhook event (parsed JSON) once.
+        Returns (StripeEvent, job) for a new event, (None, None) for a redelivery.
+        """
+        from services.fulfilment_service import FulfilmentService
+
+        handled = event['type'] in HANDLED_TYPES
+        now = datetime.utcnow()
+        values = {
+            'id': event['id'],
+            'event_type': event['type'],
+            'status': 'received' if handled else 'ignored',
+            'received_at': now,
+            'processed_at': None if handled else now,
+            'replay_count': 0
+        }
+
+        table = StripeEvent.__table__
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = dialect_insert(table).values(values).on_conflict_do_nothing(index_elements=[table.c.id])
+            created = db.session.execute(stmt).rowcount == 1
+        else:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(table).values(values))
+                created = True
+            except IntegrityError:
+                created = False
+
+        if not created:
+            db.session.rollback()
+            return None, None
+
+        job = None
+        if handled:
+            job = FulfilmentService.enqueue(event['id'], event['type'], event['data']['object'], commit=False)
+        db.session.commit()
+
+        if job is not None:
+            FulfilmentService.notify()
+        return db.session.get(StripeEvent, event['id']), job
+
+    @staticmethod
+    def mark(event_id, status):
+        """Moves an event to status inside the caller's transaction."""
+        if event_id is None:
+            return
+        values = {'status': status}
+        if status in FINAL_STATUSES:
+            values['processed_at'] = datetime.utcnow()
+        db.session.execute(update(StripeEvent).where(StripeEvent.id == event_id).values(values))
+
+    @staticmethod
+    def get_events(status=None, limit=50):
+        query = StripeEvent.query
+        if status:
+            query = query.filter(StripeEvent.status == status)
+        return query.order_by(StripeEvent.received_at.desc()).limit(limit).all()
+
+    @staticmethod
+    def replay(event_id):
+        """
+        Queues a failed event again. Its job keeps the tickets already issued
+        and delivered, so the replay only finishes the remaining steps.
+        """
+        from services.fulfilment_service import FulfilmentService
+
+        event = db.session.get(StripeEvent, event_id)
+        if not event:
+            raise LookupError("Événement introuvable")
+        if event.status != 'failed' or event.job is None:
+            raise ValueError(f"Seul un événement en échec peut être rejoué (statut : {event.status})")
+
+        job = event.job
+        job.status = 'queued'
+        job.attempts = 0
+        job.run_after = datetime.utcnow()
+        job.finished_at = None
+
+        event.status = 'received'
+        event.processed_at = None
+        event.replay_count += 1
+        db.session.commit()
+
+        FulfilmentService.notify()
+        return event
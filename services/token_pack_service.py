@@ -0,0 +1,163 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for token_pack_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from models import db, GoPass, Flight
+from services.gopass_service import GoPassService
+from sqlalchemy import or_
+from datetime import datetime, timedelta, timezone
+from collections import namedtuple
+import struct
+import time
+
+PACK_MAGIC = b'GPTK'
+PACK_FORMAT = 1
+FLAG_DELTA = 0x01
+
+# magic, format, flags, entry size, flight id, flight date (yyyymmdd),
+# max pass id, generated at (epoch seconds, UTC), entry count
+HEADER = struct.Struct('>4sBBHIIIII')
+# token digest, pass id, flight id, status, 3 reserved bytes
+ENTRY = struct.Struct('>16sIIB3x')
+
+STATUS_CODES = {'valid': 0, 'consumed': 1, 'cancelled': 2, 'expired': 3}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+PackHeader = namedtuple('PackHeader', [
+    'magic', 'format', 'flags', 'entry_size', 'flight_id', 'flight_date',
+    'max_pass_id', 'generated_at', 'count'
+])
+PackEntry = namedtuple('PackEntry', ['pass_id', 'flight_id', 'status'])
+
+
+class TokenPackService:
+    """
+    Offline token packs for scanner devices.
+
+    A pack is a fixed header followed by fixed-size entries sorted by token
+    digest (GoPassService.token_digest), so a device can memory-map the file
+    and binary-search it. Like a gate session, a pack covers every pass for
+    flights leaving the same airport on the same day; an entry whose flight
+    id differs from the header flight is a wrong-flight pass.
+
+    The pack version is "<max_pass_id>-<generated_at>". Passing it back as
+    `since` returns a delta with the passes sold or changed since then
+    (GoPass.updated_at, set by the server on every write: an offline scan
+    uploaded late carries the device's old scan_date but a new updated_at),
+    which the device merges over its copy (entries are upserts).
+    """
+
+    # Delta overlap covering transactions that committed after a pack was
+    # generated but were timestamped before it.
+    SAFETY_WINDOW = 120
+
+    @staticmethod
+    def format_version(max_pass_id, generated_at):
+        return f"{max_pass_id}-{generated_at}"
+
+    @staticmethod
+    def parse_version(version):
+        try:
+            max_pass_id, generated_at = (int(part) for part in version.split('-'))
+        except (AttributeError, ValueError):
+            raise ValueError("Version de pack invalide")
+        return max_pass_id, generated_at
+
+    @staticmethod
+    def build_pack(flight_id, since=None):
+        """Returns (pack_bytes, version). Raises ValueError for an unknown flight or version."""
+        flight = db.session.get(Flight, int(flight_id))
+        if not flight:
+            raise ValueError("Vol introuvable")
+
+        day_start = datetime.combine(flight.departure_time.date(), datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+
+        query = db.session.query(
+            GoPass.token,
+            GoPass.id,
+            GoPass.flight_id,
+            GoPass.status
+        ).join(
+            Flight, GoPass.flight_id == Flight.id
+        ).filter(
+            Flight.departure_airport == flight.departure_airport,
+            Flight.departure_time >= day_start,
+            Flight.departure_time < day_end
+        )
+
+        flags = 0
+        max_pass_id = 0
+        if since:
+            since_max_id, since_generated_at = TokenPackService.parse_version(since)
+            watermark = datetime.fromtimestamp(
+                since_generated_at - TokenPackService.SAFETY_WINDOW, timezone.utc
+            ).replace(tzinfo=None)
+            query = query.filter(or_(
+                GoPass.id > since_max_id,
+                GoPass.updated_at >= watermark
+            ))
+            flags |= FLAG_DELTA
+            max_pass_id = since_max_id
+
+        generated_at = int(time.time())
+        entries = []
+        for token, pass_id, pass_flight_id, status in query.all():
+            entries.append((
+                GoPassService.token_digest(token),
+                pass_id,
+                pass_flight_id,
+                STATUS_CODES.get(status, STATUS_CODES['cancelled'])
+            ))
+            max_pass_id = max(max_pass_id, pass_id)
+
+        entries.sort(key=lambda entry: entry[0])
+
+        buffer = bytearray(HEADER.size + ENTRY.size * len(entries))
+        HEADER.pack_into(
+            buffer, 0,
+            PACK_MAGIC, PACK_FORMAT, flags, ENTRY.size,
+            flight.id, int(flight.departure_time.strftime('%Y%m%d')),
+            max_pass_id, generated_at, len(entries)
+        )
+        offset = HEADER.size
+        for entry in entries:
+            ENTRY.pack_into(buffer, offset, *entry)
+            offset += ENTRY.size
+
+        return bytes(buffer), TokenPackService.format_version(max_pass_id, generated_at)
+
+    @staticmethod
+    def read_header(pack):
+        header = PackHeader(*HEADER.unpack_from(pack, 0))
+        if header.magic != PACK_MAGIC or header.format != PACK_FORMAT:
+            raise ValueError("Format de pack inconnu")
+        return header
+
+    @staticmethod
+    def lookup(pack, token):
+        """
+        Reference lookup, as a device would do it: binary search of the token
+        digest over the sorted entries. Returns a PackEntry or None.
+        """
+        header = TokenPackService.read_header(pack)
+        view = memoryview(pack)
+        digest = GoPassService.token_digest(token)
+
+        low, high = 0, header.count
+        while low < high:
+            mid = (low + high) // 2
+            offset = HEADER.size + mid * header.entry_size
+            key = bytes(view[offset:offset + 16])
+            if key < digest:
+                low = mid + 1
+            elif key > digest:
+                high = mid
+            else:
+                _, pass_id, pass_flight_id, status = ENTRY.unpack_from(pack, offset)
+                return PackEntry(pass_id, pass_flight_id, STATUS_NAMES.get(status, 'cancelled'))
+        return None
@@ -0,0 +1,180 @@
+"""
+* Nom de l'application : GoPass SGI-GP
+ * Description : Logic and implementation for token_signing_service.py
+ * Produit de : MOA Digital Agency, www.myoneart.com
+ * Fait par : Aisance KALONJI, www.aisancekalonji.com
+ * Auditer par : La CyberConfiance, www.cyberconfiance.com
+"""
+
+from models import SecurityKey
+from datetime import datetime, timezone, timedelta
+from collections import namedtuple
+from flask import current_app
+import base64
+import hashlib
+import hmac
+import threading
+
+TOKEN_PREFIX = 'GP1'
+
+# Parsed, signature-checked content of a compact token
+SignedToken = namedtuple('SignedToken', ['kid', 'pass_id', 'flight_id', 'flight_date', 'token_hash'])
+
+
+class Keyring:
+    """Snapshot of the SecurityKey table. keys: kid -> (secret, expires_at)"""
+
+    def __init__(self, keys, ttl):
+        self.keys = keys
+        self.loaded_at = datetime.utcnow()
+        self.expires_at = self.loaded_at + ttl
+
+    def is_stale(self):
+        return datetime.utcnow() >= self.expires_at
+
+    def usable(self, kid):
+        entry = self.keys.get(kid)
+        if entry is None:
+            return None
+        secret, expires_at = entry
+        if expires_at is not None and expires_at <= datetime.utcnow():
+            return None
+        return secret
+
+    def signing_key(self):
+        """Newest usable key: (kid, secret), or None when there is none."""
+        for kid in sorted(self.keys, reverse=True):
+            secret = self.usable(kid)
+            if secret is not None:
+                return kid, secret
+        return None
+
+
+class TokenSigningService:
+    """
+    Signed compact QR tokens:
+
+        GP1.<kid>.<pass_id>.<flight_id>.<yyyymmdd>.<hash>.<signature>
+
+    The signature is an HMAC-SHA256 (truncated to 128 bits) computed with the
+    SecurityKey identified by kid. Because the flight and its date are bound
+    in the token, a scanner can reject forged, wrong-flight and wrong-date
+    passes with only the cached keyring. The hash is still the GoPass.token
+    column, used to look the pass up for consumption.
+
+    Rotation: new tokens are signed with the newest active key. A key that is
+    deactivated or past expires_at no longer verifies, which revokes every
+    token it signed. Workers see SecurityKey changes after TOKEN_KEYRING_TTL.
+    """
+
+    DEFAULT_TTL = 300
+    # Minimum delay between keyring reloads triggered by an unknown kid
+    MISS_RELOAD_INTERVAL = 30
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def is_enabled():
+        return current_app.config.get('TOKEN_SIGNING_ENABLED', True)
+
+    @staticmethod
+    def is_signed(token):
+        return isinstance(token, str) and token.startswith(TOKEN_PREFIX + '.')
+
+    @staticmethod
+    def _load_keyring():
+        keys = {}
+        for key in SecurityKey.query.filter_by(is_active=True).all():
+            expires_at = key.expires_at
+            if expires_at is not None and expires_at.tzinfo is not None:
+                expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
+            keys[key.id] = (TokenSigningService._key_bytes(key.key_value), expires_at)
+
+        ttl = timedelta(seconds=current_app.config.get('TOKEN_KEYRING_TTL', TokenSigningService.DEFAULT_TTL))
+        return Keyring(keys, ttl)
+
+    @staticmethod
+    def _key_bytes(key_value):
+        try:
+            return bytes.fromhex(key_value)
+        except ValueError:
+            return key_value.encode()
+
+    @staticmethod
+    def get_keyring(force_reload=False):
+        keyring = current_app.extensions.get('token_keyring')
+        if keyring is not None and not force_reload and not keyring.is_stale():
+            return keyring
+
+        with TokenSigningService._lock:
+            keyring = current_app.extensions.get('token_keyring')
+            if keyring is None or force_reload or keyring.is_stale():
+                keyring = TokenSigningService._load_keyring()
+                current_app.extensions['token_keyring'] = keyring
+        return keyring
+
+    @staticmethod
+    def invalidate_keyring():
+        current_app.extensions.pop('token_keyring', None)
+
+    @staticmethod
+    def _signature(secret, body):
+        digest = hmac.new(secret, body.encode(), hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+    @staticmethod
+    def sign(gopass):
+        """
+        Returns the compact signed token for a pass, or None when signing is
+        disabled or no usable SecurityKey exists (the raw hash is used then).
+        """
+        if not TokenSigningService.is_enabled():
+            return None
+
+        signing_key = TokenSigningService.get_keyring().signing_key()
+        if signing_key is None:
+            return None
+
+        kid, secret = signing_key
+        body = '.'.join([
+            TOKEN_PREFIX,
+            str(kid),
+            str(gopass.id),
+            str(gopass.flight_id),
+            gopass.flight.departure_time.strftime('%Y%m%d'),
+            gopass.token
+        ])
+        return f"{body}.{TokenSigningService._signature(secret, body)}"
+
+    @staticmethod
+    def verify(token):
+        """
+        Checks a compact token against the keyring. Returns a SignedToken, or
+        None for anything malformed, forged, or signed by a retired key.
+        """
+        parts = token.split('.')
+        if len(parts) != 7 or parts[0] != TOKEN_PREFIX:
+            return None
+
+        try:
+            kid = int(parts[1])
+            pass_id = int(parts[2])
+            flight_id = int(parts[3])
+            flight_date = datetime.strptime(parts[4], '%Y%m%d').date()
+        except ValueError:
+            return None
+
+        keyring = TokenSigningService.get_keyring()
+        secret = keyring.usable(kid)
+        if secret is None and kid not in keyring.keys:
+            # Possibly a key created after this worker loaded its keyring
+            if (datetime.utcnow() - keyring.loaded_at).total_seconds() >= TokenSigningService.MISS_RELOAD_INTERVAL:
+                secret = TokenSigningService.get_keyring(force_reload=True).usable(kid)
+        if secret is None:
+            return None
+
+        body = '.'.join(parts[:6])
+        if not hmac.compare_digest(parts[6], TokenSigningService._signature(secret, body)):
+            return None
+
+        return SignedToken(kid, pass_id, flight_id, flight_date, parts[5])
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# Read by config/__init__.py on import: tests render QR codes and PDFs in
+# memory only and leave instance/ alone (caches, branding marker). The
+# cache tests point QR_CACHE_DIR / PDF_CACHE_DIR at a temporary directory.
+os.environ.setdefault('QR_CACHE_DISK', 'False')
+os.environ.setdefault('PDF_CACHE_DISK', 'False')
+os.environ.setdefault('BRANDING_MARKER_FILE', os.path.join(tempfile.mkdtemp(), 'branding.version'))
@@ -0,0 +1,151 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from app import create_app
+from models import db, Flight, GoPass, User, AccessLog, FlightCounter
+from services.gopass_service import GoPassService
+from services.access_log_journal import AccessLogJournal
+from datetime import datetime
+
+class TestAccessLogJournal(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['ACCESS_LOG_WRITE_BEHIND'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.spool_dir = tempfile.mkdtemp()
+        self.journal = self.app.extensions['access_log_journal']
+        self.journal.spool_dir = self.spool_dir
+        # Flushes are driven by the tests
+        self.journal.flush_size = 10000
+        self.journal.flush_interval = 3600
+
+        self.agent = User(
+            username='controller', email='controller@test.com', role='controller',
+            first_name='Agent', last_name='Gate'
+        )
+        self.agent.set_password('password')
+        db.session.add(self.agent)
+
+        self.flight = Flight(
+            flight_number='FL-J', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='boarding'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def spool_files(self):
+        return os.listdir(self.spool_dir)
+
+    def test_rejected_scan_is_spooled_then_flushed(self):
+        result = GoPassService.validate_gopass('0' * 64, self.flight.id, self.agent.id, 'FIH')
+        self.assertEqual(result['code'], 'INVALID')
+
+        self.assertEqual(AccessLog.query.count(), 0)
+        self.assertEqual(self.journal.pending_count(), 1)
+        self.assertEqual(len(self.spool_files()), 1)
+
+        self.assertEqual(self.journal.flush(), 1)
+
+        db.session.expire_all()
+        log = AccessLog.query.one()
+        self.assertEqual(log.status, 'INVALID')
+        self.assertIsNone(log.pass_id)
+        self.assertEqual(self.spool_files(), [])
+        self.assertEqual(db.session.get(FlightCounter, self.flight.id).rejected_invalid, 1)
+
+    def test_valid_scan_stays_synchronous(self):
+        gp = GoPassService.create_gopass(
+            flight_id=self.flight.id, passenger_name='Jane Doe',
+            passenger_passport='B7654321', sold_by=self.agent.id
+        )
+
+        first = GoPassService.validate_gopass(gp.token, self.flight.id, self.agent.id, 'FIH')
+        second = GoPassService.validate_gopass(gp.token, self.flight.id, self.agent.id, 'FIH')
+        self.assertEqual(first['code'], 'VALID')
+        self.assertEqual(second['code'], 'ALREADY_SCANNED')
+
+        statuses = [log.status for log in AccessLog.query.all()]
+        self.assertEqual(statuses, ['VALID'])
+
+        self.journal.flush()
+        db.session.expire_all()
+        statuses = sorted(log.status for log in AccessLog.query.all())
+        self.assertEqual(statuses, ['ALREADY_SCANNED', 'VALID'])
+
+    def test_orphaned_spool_is_replayed(self):
+        # A pid that has certainly exited
+        proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+        proc.wait()
+
+        path = os.path.join(self.spool_dir, f'access_log.{proc.pid}.0123456789ab.1.spool')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'pass_id': None, 'validator_id': self.agent.id,
+                'validation_time': datetime.utcnow().isoformat(),
+                'status': 'INVALID', 'is_offline': False
+            }) + '\n')
+            f.write('{"pass_id": nu')  # torn final write
+
+        self.assertEqual(self.journal.recover(), 1)
+        self.assertEqual(AccessLog.query.count(), 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_spool_of_reused_pid_is_replayed_before_first_record(self):
+        # Left by a dead worker whose pid this process now has
+        stale = os.path.join(self.spool_dir, f'access_log.{os.getpid()}.0123456789ab.1.spool')
+        with open(stale, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'pass_id': None, 'validator_id': self.agent.id,
+                'validation_time': datetime.utcnow().isoformat(),
+                'status': 'INVALID', 'is_offline': False
+            }) + '\n')
+
+        self.journal.record(None, self.agent.id, 'INVALID')
+
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(AccessLog.query.count(), 1)
+        spools = os.listdir(self.spool_dir)
+        self.assertEqual(len(spools), 1)
+        self.assertTrue(spools[0].startswith(f'access_log.{AccessLogJournal._identity()}.'))
+
+        self.journal.flush()
+        db.session.expire_all()
+        self.assertEqual(AccessLog.query.count(), 2)
+
+    def test_live_worker_spool_is_left_alone(self):
+        path = os.path.join(self.spool_dir, f'access_log.{os.getppid()}.0123456789ab.1.spool')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('')
+
+        self.assertEqual(self.journal.recover(), 0)
+        self.assertTrue(os.path.exists(path))
+
+    def test_unwritable_spool_falls_back_to_synchronous_insert(self):
+        # The spool directory cannot be created: a file is in the way
+        self.journal.spool_dir = os.path.join(self.spool_dir, 'blocked')
+        with open(self.journal.spool_dir, 'w') as f:
+            f.write('')
+
+        result = GoPassService.validate_gopass('0' * 64, self.flight.id, self.agent.id, 'FIH')
+
+        self.assertEqual(result['code'], 'INVALID')
+        self.assertEqual(self.journal.pending_count(), 0)
+        self.assertEqual(AccessLog.query.one().status, 'INVALID')
+        self.assertEqual(db.session.get(FlightCounter, self.flight.id).rejected_invalid, 1)
+
+if __name__ == '__main__':
+    unittest.main()
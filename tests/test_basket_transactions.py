@@ -0,0 +1,127 @@
+import unittest
+from app import create_app
+from models import db, Flight, GoPass, User, Transaction, MobileMoneyLog
+from services.gopass_service import GoPassService
+from services.finance_service import FinanceService
+from datetime import datetime, timedelta
+
+class TestBasketTransactions(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.agent = User(
+            username='agent', email='agent@test.com', role='agent',
+            first_name='Agent', last_name='Desk'
+        )
+        self.agent.set_password('password')
+        db.session.add(self.agent)
+
+        self.flight = Flight(
+            flight_number='FL-T', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def sell(self, count, **kwargs):
+        passengers = [
+            {'passenger_name': f'Passenger {i}', 'passenger_passport': f'P{i:07d}'}
+            for i in range(count)
+        ]
+        return GoPassService.create_gopasses_bulk(self.flight.id, passengers, price=15.0, **kwargs)
+
+    def test_finance_views_aggregate_per_basket(self):
+        self.sell(8, sold_by=self.agent.id, payment_ref='POS-01-SES-1')
+        self.sell(2, payment_method='M-Pesa', payment_ref='MP-42', sales_channel='WEB')
+        db.session.add(MobileMoneyLog(transaction_ref='MP-42', amount=30.0, provider='M-Pesa', status='success'))
+        db.session.commit()
+        FinanceService.record_deposit(self.agent.id, self.agent.id, 100.0)
+
+        journal = FinanceService.get_transactions(agent_id=self.agent.id)
+        self.assertEqual([(t.ticket_count, t.amount_collected) for t in journal], [(8, 120.0)])
+
+        balance = FinanceService.get_agent_balances()[0]
+        self.assertEqual((balance['sales_total'], balance['balance']), (120.0, 20.0))
+
+        reconciliation = FinanceService.get_reconciliation()
+        self.assertEqual([(r['ref'], r['status']) for r in reconciliation], [('MP-42', 'matched')])
+
+    def test_migration_groups_legacy_rows(self):
+        # Legacy layout: one transaction per ticket
+        for i in range(3):
+            gp = self.sell(1, sold_by=self.agent.id, payment_ref='POS-01-SES-7')[0]
+        self.sell(1, sold_by=self.agent.id, payment_ref='POS-01-SES-8')
+        for transaction in Transaction.query.all():
+            transaction.amount_collected = 15.0
+            transaction.ticket_count = 1
+        # Ticket sold before transactions existed
+        db.session.delete(gp.transaction)
+        gp.transaction_id = None
+        db.session.commit()
+        self.assertEqual(Transaction.query.count(), 3)
+
+        # A dry run reports the changes and writes nothing
+        self.assertEqual(FinanceService.migrate_basket_transactions(), (1, 1))
+        self.assertEqual(Transaction.query.filter_by(status='superseded').count(), 0)
+
+        written, superseded = FinanceService.migrate_basket_transactions(dry_run=False)
+        self.assertEqual((written, superseded), (1, 1))
+
+        baskets = {t.provider_ref: t for t in FinanceService.get_transactions()}
+        self.assertEqual(len(baskets), 2)
+        self.assertEqual((baskets['POS-01-SES-7'].ticket_count, baskets['POS-01-SES-7'].amount_collected), (3, 45.0))
+        self.assertEqual(GoPass.query.filter_by(transaction_id=baskets['POS-01-SES-7'].id).count(), 3)
+        self.assertEqual(baskets['POS-01-SES-8'].ticket_count, 1)
+
+        # The merged legacy transaction is kept, linked to its basket
+        legacy = Transaction.query.filter_by(status='superseded').one()
+        self.assertEqual(legacy.source_metadata['superseded_by'], baskets['POS-01-SES-7'].id)
+        self.assertEqual(FinanceService.get_agent_balances()[0]['sales_total'], 60.0)
+
+        # Running it again changes nothing
+        self.assertEqual(FinanceService.migrate_basket_transactions(dry_run=False), (0, 0))
+
+    def test_migration_keeps_sales_of_the_same_second_apart(self):
+        other_flight = Flight(
+            flight_number='FL-U', airline='TestAir', departure_airport='FIH', arrival_airport='GOM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(other_flight)
+        db.session.commit()
+
+        # Legacy rows sharing the reference of one second: two sales on FL-T
+        # 600 ms apart, one on FL-U, all with one transaction per ticket
+        second = datetime(2024, 5, 1, 9, 30, 0)
+        legacy = [
+            (self.flight.id, second), (self.flight.id, second + timedelta(milliseconds=20)),
+            (self.flight.id, second + timedelta(milliseconds=600)),
+            (other_flight.id, second + timedelta(milliseconds=300))
+        ]
+        for flight_id, issued in legacy:
+            gp = GoPassService.create_gopasses_bulk(
+                flight_id, [{'passenger_name': 'Passenger', 'passenger_passport': 'P0000001'}],
+                price=15.0, sold_by=self.agent.id, payment_ref='POS-01-SES-1714555800'
+            )[0]
+            gp.issue_date = issued
+            gp.transaction.amount_collected = 15.0
+            gp.transaction.ticket_count = 1
+        db.session.commit()
+
+        written, superseded = FinanceService.migrate_basket_transactions(batch_size=2, dry_run=False)
+        self.assertEqual((written, superseded), (1, 1))
+
+        counts = sorted(t.ticket_count for t in FinanceService.get_transactions())
+        self.assertEqual(counts, [1, 1, 2])
+        self.assertEqual(FinanceService.migrate_basket_transactions(batch_size=2, dry_run=False), (0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
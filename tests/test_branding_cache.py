@@ -0,0 +1,120 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from PIL import Image
+from sqlalchemy import event
+from app import create_app
+from models import db, User, Flight, AppConfig
+from services.branding_service import BrandingService
+from services.gopass_service import GoPassService
+from services.settings_service import SettingsService
+
+def png(size, color='blue'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class TestBrandingCache(unittest.TestCase):
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.static_dir, 'img'))
+        with open(os.path.join(self.static_dir, 'img', 'logo_rva.png'), 'wb') as f:
+            f.write(png((2000, 1000)))
+
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.static_folder = self.static_dir # Uploads land here, not in the repository
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        BrandingService.invalidate()
+
+        admin = User(username='admin', email='admin@test.com', role='admin', first_name='Admin', last_name='Root')
+        admin.set_password('password')
+        db.session.add(admin)
+        flight = Flight(
+            flight_number='FL-B', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(flight)
+        db.session.commit()
+        self.gopass = GoPassService.create_gopass(flight_id=flight.id, passenger_name='Jane Doe', passenger_passport='B7654321')
+
+    def tearDown(self):
+        BrandingService.invalidate()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.static_dir, ignore_errors=True)
+
+    def test_rendering_reads_no_branding_from_db_or_disk(self):
+        GoPassService.generate_pdf_bytes(self.gopass)
+
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            with patch('services.branding_service.Image.open') as image_open:
+                GoPassService.generate_pdf_bytes(self.gopass, fmt='thermal')
+                GoPassService.generate_bulk_pdf([self.gopass])
+                GoPassService.pdf_etag(self.gopass)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        image_open.assert_not_called()
+        self.assertFalse([s for s in statements if 'app_config' in s])
+
+    def test_logos_are_scaled_down_once(self):
+        logo_rva, logo_gopass = BrandingService.get()['images']
+
+        self.assertEqual(logo_rva.getSize(), (400, 200))
+        self.assertIsNone(logo_gopass)
+        self.assertIs(BrandingService.get()['images'][0], logo_rva)
+
+    def test_logo_upload_and_settings_invalidate(self):
+        etag = GoPassService.pdf_etag(self.gopass)
+        client = self.app.test_client()
+        client.post('/login', data=dict(username='admin', password='password'))
+
+        response = client.post('/api/settings/upload-logo', data={
+            'key': 'logo_gopass_url',
+            'logo': (io.BytesIO(png((300, 300), 'red')), 'gopass.png')
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+
+        branding = BrandingService.get()
+        self.assertTrue(branding['logo_paths'][1].endswith('uploaded_logo_gopass_url_gopass.png'))
+        self.assertEqual(branding['images'][1].getSize(), (300, 300))
+        self.assertNotEqual(GoPassService.pdf_etag(self.gopass), etag)
+
+        SettingsService.set_config('logo_gopass_url', '')
+        self.assertIsNone(BrandingService.get()['logo_paths'][1])
+
+    def test_logo_change_in_another_worker_is_seen_at_once(self):
+        etag = GoPassService.pdf_etag(self.gopass)
+        with open(os.path.join(self.static_dir, 'img', 'other.png'), 'wb') as f:
+            f.write(png((300, 300), 'red'))
+
+        # Another worker saves the new logo and rewrites the marker; this
+        # worker still holds its branding cache
+        db.session.add(AppConfig(key='logo_rva_url', value='/static/img/other.png'))
+        db.session.commit()
+        self.assertFalse(BrandingService.get()['logo_paths'][0].endswith('other.png'))
+        BrandingService._bump_marker()
+
+        self.assertTrue(BrandingService.get()['logo_paths'][0].endswith('other.png'))
+        self.assertNotEqual(GoPassService.pdf_etag(self.gopass), etag)
+
+    def test_batch_download_without_pdf_cache(self):
+        del self.app.extensions['pdf_cache']
+        response = self.app.test_client().get(f'/download/batch/{self.gopass.payment_ref}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_data().startswith(b'%PDF'))
+
+if __name__ == '__main__':
+    unittest.main()
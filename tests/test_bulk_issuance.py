@@ -0,0 +1,96 @@
+import unittest
+from sqlalchemy import event
+from app import create_app
+from models import db, Flight, GoPass, User, Transaction, FlightCounter, ScanIndex
+from services.gopass_service import GoPassService
+from datetime import datetime
+
+class TestBulkIssuance(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.agent = User(
+            username='agent', email='agent@test.com', role='agent',
+            first_name='Agent', last_name='Desk'
+        )
+        self.agent.set_password('password')
+        db.session.add(self.agent)
+
+        self.flight = Flight(
+            flight_number='FL-G', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def passengers(self, count):
+        return [
+            {'passenger_name': f'Passenger {i}', 'passenger_passport': f'P{i:07d}'}
+            for i in range(count)
+        ]
+
+    def test_group_booking_is_written_in_batched_inserts(self):
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            gopasses = GoPassService.create_gopasses_bulk(
+                self.flight.id, self.passengers(40), price=25.0, sold_by=self.agent.id
+            )
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        self.assertEqual([gp.passenger_name for gp in gopasses], [f'Passenger {i}' for i in range(40)])
+        self.assertEqual(len({gp.token for gp in gopasses}), 40)
+        self.assertEqual(GoPass.query.count(), 40)
+        self.assertEqual(ScanIndex.query.count(), 40)
+
+        # One basket for the payment, with the passes as line items
+        transaction = Transaction.query.one()
+        self.assertEqual((transaction.ticket_count, transaction.amount_collected), (40, 1000.0))
+        self.assertEqual({gp.transaction_id for gp in gopasses}, {transaction.id})
+        self.assertEqual({gp.payment_ref for gp in gopasses}, {transaction.provider_ref})
+
+        counter = db.session.get(FlightCounter, self.flight.id)
+        self.assertEqual((counter.sold, counter.revenue), (40, 1000.0))
+
+        # The pass number block reservation is not part of the sale's writes
+        inserts = [s for s in statements if s.lstrip().upper().startswith('INSERT') and 'pass_number_sequences' not in s]
+        self.assertLessEqual(len(inserts), 4)
+
+    def test_single_sale_delegates_to_bulk(self):
+        gp = GoPassService.create_gopass(
+            flight_id=self.flight.id, passenger_name='Jane Doe',
+            passenger_passport='B7654321', sold_by=self.agent.id
+        )
+
+        self.assertEqual(gp.passenger_document_type, 'Passeport')
+        self.assertEqual(gp.transaction.agent_id, self.agent.id)
+        self.assertEqual(db.session.get(FlightCounter, self.flight.id).sold, 1)
+
+    def test_incomplete_passenger_writes_nothing(self):
+        passengers = self.passengers(3) + [{'passenger_name': 'No Document'}]
+
+        with self.assertRaises(ValueError):
+            GoPassService.create_gopasses_bulk(self.flight.id, passengers)
+        with self.assertRaises(ValueError):
+            GoPassService.create_gopasses_bulk(9999, self.passengers(1))
+
+        db.session.rollback()
+        self.assertEqual(GoPass.query.count(), 0)
+        self.assertEqual(Transaction.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -78,3 +78,23 @@ def test_checkout_route_multi_pax(app):
         # Verify DB
         passes = GoPass.query.all()
         assert len(passes) == 2
+
+def test_checkout_double_submit_creates_one_basket(app):
+    with app.app_context():
+        flight = Flight.query.first()
+        client = app.test_client()
+
+        data = {
+            'passenger_name[]': ['Alice', 'Bob'],
+            'passport[]': ['A001', 'B002'],
+            'document_type[]': ['Passeport', 'Passeport'],
+            'payment_method': 'MOBILE_MONEY',
+            'idempotency_key': 'form-7f3a'
+        }
+
+        first = client.post(f'/checkout/{flight.id}', data=data)
+        second = client.post(f'/checkout/{flight.id}', data=data)
+
+        assert first.status_code == 302
+        assert second.headers['Location'] == first.headers['Location']
+        assert GoPass.query.count() == 2
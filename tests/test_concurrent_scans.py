@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from app import create_app
+from config import config
+from models import db
+from scripts.benchmark_concurrent_scans import run, parse_args
+
+class TestConcurrentScans(unittest.TestCase):
+    """Runs the concurrent gate benchmark on a small SQLite file as a race regression test."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        # Gates need a shared database, and the engine is bound in create_app
+        with patch.object(config['default'], 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{self.path}'):
+            self.app = create_app(config_name='default')
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        os.remove(self.path)
+
+    def test_every_pass_boards_once_with_gate_sessions(self):
+        problems = run(self.app, parse_args(['--gates', '4', '--passes', '40', '--duplicates', '0.5']))
+        self.assertEqual(problems, [])
+
+    def test_every_pass_boards_once_without_gate_sessions(self):
+        self.app.config['GATE_SESSION_ENABLED'] = False
+        problems = run(self.app, parse_args(['--gates', '4', '--passes', '40', '--duplicates', '0.5']))
+        self.assertEqual(problems, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+from app import create_app
+from models import db, Flight, User, FlightCounter
+from services.gopass_service import GoPassService
+from services.flight_counter_service import FlightCounterService
+from services.offline_sync_service import OfflineSyncService
+from datetime import datetime, timedelta
+
+class TestFlightCounters(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.agent = User(
+            username='controller', email='controller@test.com', role='controller',
+            first_name='Agent', last_name='Gate'
+        )
+        self.agent.set_password('password')
+        db.session.add(self.agent)
+
+        today = datetime.now()
+        self.flight = Flight(
+            flight_number='FL-C', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today, status='boarding', manifest_pax_count=1
+        )
+        self.sibling = Flight(
+            flight_number='FL-D', airline='TestAir', departure_airport='FIH', arrival_airport='GOM',
+            departure_time=today, status='boarding'
+        )
+        self.tomorrow = Flight(
+            flight_number='FL-E', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today + timedelta(days=1), status='scheduled'
+        )
+        db.session.add_all([self.flight, self.sibling, self.tomorrow])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_pass(self, flight, price=50.0):
+        return GoPassService.create_gopass(
+            flight_id=flight.id, passenger_name='Jane Doe',
+            passenger_passport='B7654321', price=price, sold_by=self.agent.id
+        )
+
+    def counter(self, flight):
+        db.session.expire_all()
+        return db.session.get(FlightCounter, flight.id)
+
+    def scan(self, gopass, flight):
+        return GoPassService.validate_gopass(gopass.token, flight.id, self.agent.id, 'FIH')
+
+    def test_sales_and_scans_are_counted(self):
+        first = self.create_pass(self.flight, price=50.0)
+        second = self.create_pass(self.flight, price=30.0)
+        sibling = self.create_pass(self.sibling)
+        other_day = self.create_pass(self.tomorrow)
+
+        self.scan(first, self.flight)
+        self.scan(first, self.flight)
+        self.scan(second, self.flight)
+        self.scan(sibling, self.flight)
+        self.scan(other_day, self.flight)
+        GoPassService.validate_gopass('0' * 64, self.flight.id, self.agent.id, 'FIH')
+
+        counter = self.counter(self.flight)
+        self.assertEqual(counter.sold, 2)
+        self.assertEqual(counter.revenue, 80.0)
+        self.assertEqual(counter.scanned, 2)
+        self.assertEqual(counter.rejected_already_scanned, 1)
+        self.assertEqual(counter.rejected_wrong_flight, 1)
+        self.assertEqual(counter.rejected_expired, 1)
+        self.assertEqual(counter.rejected_invalid, 1)
+
+        # The manifest gap check is a single-row read
+        self.assertGreater(counter.scanned, self.flight.manifest_pax_count)
+
+    def test_offline_takeover_boards_no_extra_passenger(self):
+        gp = self.create_pass(self.flight)
+        self.scan(gp, self.flight)
+
+        OfflineSyncService.sync_batch([{
+            'token': gp.token,
+            'flight_id': self.flight.id,
+            'timestamp': (datetime.utcnow() - timedelta(hours=1)).isoformat()
+        }], self.agent.id, 'FIH')
+
+        self.assertEqual(self.counter(self.flight).scanned, 1)
+
+    def test_rebuild_matches_incremental_counters(self):
+        passes = [self.create_pass(self.flight) for _ in range(3)]
+        self.create_pass(self.sibling)
+        self.scan(passes[0], self.flight)
+        self.scan(passes[0], self.flight)
+        self.scan(passes[1], self.flight)
+
+        expected = {c.flight_id: c.to_dict() for c in FlightCounter.query.all()}
+
+        # Simulate drift, then repair it
+        self.counter(self.flight).scanned = 42
+        db.session.commit()
+        FlightCounterService.rebuild()
+
+        rebuilt = {c.flight_id: c.to_dict() for c in FlightCounter.query.all()}
+        self.assertEqual(rebuilt, expected)
+
+    def test_backfill_builds_counters_of_an_upgraded_database(self):
+        gopass = self.create_pass(self.flight)
+        self.scan(gopass, self.flight)
+        expected = self.counter(self.flight).to_dict()
+
+        # Database upgraded from before the counters: the table is empty
+        FlightCounter.query.delete()
+        db.session.commit()
+
+        self.assertEqual(FlightCounterService.backfill(), 1)
+        self.assertEqual(self.counter(self.flight).to_dict(), expected)
+        self.assertEqual(FlightCounterService.backfill(), 0) # Populated: left alone
+
+    def test_unpaid_passes_count_as_sold_without_revenue(self):
+        self.create_pass(self.flight, price=50.0)
+        FlightCounterService.record_sale(self.flight.id, 30.0, payment_status='pending')
+        db.session.commit()
+        live = self.counter(self.flight).to_dict()
+        self.assertEqual((live['sold'], live['revenue']), (2, 50.0))
+
+        # Same sales in the source tables: the rebuild applies the same rule
+        pending = self.create_pass(self.flight, price=30.0)
+        pending.payment_status = 'pending'
+        db.session.commit()
+        FlightCounterService.rebuild([self.flight.id])
+        self.assertEqual(self.counter(self.flight).to_dict(), live)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+from unittest.mock import patch
+from app import create_app
+from models import db, Flight, GoPass, User
+from services.gopass_service import GoPassService
+from services.flight_service import FlightService
+from services.gate_session_service import GateSessionService
+from datetime import datetime, timedelta
+
+class TestGateSession(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.agent = User(
+            username='controller', email='controller@test.com', role='controller',
+            first_name='Agent', last_name='Gate'
+        )
+        self.agent.set_password('password')
+        db.session.add(self.agent)
+
+        today = datetime.now()
+        self.flight_a = Flight(
+            flight_number='FL-A', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today, status='boarding'
+        )
+        self.flight_b = Flight(
+            flight_number='FL-B', airline='TestAir', departure_airport='FIH', arrival_airport='GOM',
+            departure_time=today, status='boarding'
+        )
+        self.flight_c = Flight(
+            flight_number='FL-C', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today + timedelta(days=1), status='scheduled'
+        )
+        db.session.add_all([self.flight_a, self.flight_b, self.flight_c])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_pass(self, flight):
+        return GoPassService.create_gopass(
+            flight_id=flight.id,
+            passenger_name='Jane Doe',
+            passenger_passport='B7654321',
+            sold_by=self.agent.id
+        )
+
+    def test_preload_covers_same_day_flights(self):
+        own = self.create_pass(self.flight_a)
+        sibling = self.create_pass(self.flight_b)
+        other_day = self.create_pass(self.flight_c)
+
+        gate = GateSessionService.open_session(self.flight_a.id)
+
+        self.assertIn(own.token, gate.entries)
+        self.assertIn(sibling.token, gate.entries)
+        self.assertNotIn(other_day.token, gate.entries)
+
+    def test_wrong_flight_answered_from_memory(self):
+        gp = self.create_pass(self.flight_b)
+        GateSessionService.open_session(self.flight_a.id)
+
+        with patch.object(GoPass, 'query') as mock_query:
+            result = GoPassService.validate_gopass(gp.token, self.flight_a.id, self.agent.id, 'FIH')
+            mock_query.filter_by.assert_not_called()
+
+        self.assertEqual(result['code'], 'WRONG_FLIGHT')
+        self.assertEqual(result['data']['valid_for'], 'FL-B')
+
+    def test_invalid_token_cached_after_first_miss(self):
+        gate = GateSessionService.open_session(self.flight_a.id)
+
+        first = GoPassService.validate_gopass('f' * 64, self.flight_a.id, self.agent.id, 'FIH')
+        self.assertEqual(first['code'], 'INVALID')
+        self.assertIsNone(gate.entries['f' * 64])
+
+        second = GoPassService.validate_gopass('f' * 64, self.flight_a.id, self.agent.id, 'FIH')
+        self.assertEqual(second['code'], 'INVALID')
+
+    def test_consumption_is_single_use(self):
+        gp = self.create_pass(self.flight_a)
+        GateSessionService.open_session(self.flight_a.id)
+
+        first = GoPassService.validate_gopass(gp.token, self.flight_a.id, self.agent.id, 'FIH')
+        second = GoPassService.validate_gopass(gp.token, self.flight_a.id, self.agent.id, 'FIH')
+
+        self.assertEqual(first['code'], 'VALID')
+        self.assertEqual(first['data']['passenger'], 'Jane Doe')
+        self.assertEqual(second['code'], 'ALREADY_SCANNED')
+        self.assertEqual(db.session.get(GoPass, gp.id).status, 'consumed')
+
+    def test_pass_sold_after_preload_is_accepted(self):
+        GateSessionService.open_session(self.flight_a.id)
+        gp = self.create_pass(self.flight_a)
+
+        result = GoPassService.validate_gopass(gp.token, self.flight_a.id, self.agent.id, 'FIH')
+        self.assertEqual(result['code'], 'VALID')
+
+    def test_closing_flight_invalidates_session(self):
+        gp = self.create_pass(self.flight_a)
+        GateSessionService.open_session(self.flight_a.id)
+
+        FlightService.update_status(self.flight_a.id, 'closed')
+        self.assertNotIn(self.flight_a.id, self.app.extensions['gate_sessions'])
+
+        result = GoPassService.validate_gopass(gp.token, self.flight_a.id, self.agent.id, 'FIH')
+        self.assertEqual(result['code'], 'FLIGHT_CLOSED')
+
+    def test_stale_session_cannot_board_closed_flight(self):
+        gp = self.create_pass(self.flight_a)
+        GateSessionService.open_session(self.flight_a.id)
+
+        # Closed by another worker: this worker's session is not invalidated
+        self.flight_a.status = 'closed'
+        db.session.commit()
+
+        result = GoPassService.validate_gopass(gp.token, self.flight_a.id, self.agent.id, 'FIH')
+        self.assertEqual(result['code'], 'FLIGHT_CLOSED')
+        self.assertEqual(db.session.get(GoPass, gp.id).status, 'valid')
+
+    def test_scan_without_session_does_not_open_one(self):
+        gp = self.create_pass(self.flight_a)
+
+        result = GoPassService.validate_gopass(gp.token, self.flight_a.id, self.agent.id, 'FIH')
+        self.assertEqual(result['code'], 'VALID')
+        self.assertNotIn(self.flight_a.id, self.app.extensions.get('gate_sessions', {}))
+
+    def test_closure_by_another_worker_is_seen_after_check_interval(self):
+        gp = self.create_pass(self.flight_b)
+        GateSessionService.open_session(self.flight_a.id)
+
+        # Closed by another worker: this worker's session is not invalidated
+        self.flight_a.status = 'closed'
+        db.session.commit()
+
+        stale = GoPassService.validate_gopass(gp.token, self.flight_a.id, self.agent.id, 'FIH')
+        self.assertEqual(stale['code'], 'WRONG_FLIGHT')
+
+        self.app.config['GATE_SESSION_CHECK_INTERVAL'] = 0
+        result = GoPassService.validate_gopass(gp.token, self.flight_a.id, self.agent.id, 'FIH')
+        self.assertEqual(result['code'], 'FLIGHT_CLOSED')
+
+if __name__ == '__main__':
+    unittest.main()
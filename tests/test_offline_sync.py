@@ -0,0 +1,193 @@
+import json
+import unittest
+from app import create_app
+from models import db, Flight, GoPass, User, AccessLog, OfflineSyncLog, FlightCounter
+from services.gopass_service import GoPassService
+from services.offline_sync_service import OfflineSyncService
+from datetime import datetime, timedelta
+
+class TestOfflineSync(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['TESTING'] = True
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.gate_a = User(username='gate_a', email='a@test.com', role='controller', first_name='A', last_name='Gate')
+        self.gate_b = User(username='gate_b', email='b@test.com', role='controller', first_name='B', last_name='Gate')
+        for user in (self.gate_a, self.gate_b):
+            user.set_password('password')
+        db.session.add_all([self.gate_a, self.gate_b])
+
+        self.today = datetime.now()
+        # Device scan times: an hour and a half ago, after the passes were issued
+        self.scan_base = datetime.utcnow() - timedelta(minutes=90)
+        self.flight = Flight(
+            flight_number='FL-O', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=self.today, status='boarding'
+        )
+        self.sibling = Flight(
+            flight_number='FL-W', airline='TestAir', departure_airport='FIH', arrival_airport='GOM',
+            departure_time=self.today, status='boarding'
+        )
+        db.session.add_all([self.flight, self.sibling])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_pass(self, flight):
+        gopass = GoPassService.create_gopass(
+            flight_id=flight.id, passenger_name='Jane Doe',
+            passenger_passport='B7654321', sold_by=self.gate_a.id
+        )
+        gopass.issue_date = self.scan_base - timedelta(hours=1)
+        db.session.commit()
+        return gopass
+
+    def event(self, gopass, flight, minutes):
+        return {
+            'token': gopass.token if gopass else 'f' * 64,
+            'flight_id': flight.id,
+            'timestamp': (self.scan_base + timedelta(minutes=minutes)).isoformat()
+        }
+
+    def test_batch_outcomes(self):
+        gp = self.create_pass(self.flight)
+        wrong = self.create_pass(self.sibling)
+
+        result = OfflineSyncService.sync_batch([
+            self.event(gp, self.flight, 2),
+            self.event(gp, self.flight, 1),
+            self.event(wrong, self.flight, 3),
+            self.event(None, self.flight, 4)
+        ], self.gate_a.id, 'FIH')
+
+        codes = [r['code'] for r in result['results']]
+        self.assertEqual(codes, ['ALREADY_SCANNED', 'VALID', 'WRONG_FLIGHT', 'INVALID'])
+
+        gopass = db.session.get(GoPass, gp.id)
+        self.assertEqual(gopass.status, 'consumed')
+        self.assertEqual(gopass.scan_date, self.scan_base + timedelta(minutes=1))
+
+        self.assertEqual(AccessLog.query.filter_by(is_offline=True).count(), 4)
+        sync_log = OfflineSyncLog.query.one()
+        self.assertEqual(sync_log.record_count, 4)
+        self.assertEqual(sync_log.status, 'conflicts')
+
+    def test_retried_batch_is_not_logged_twice(self):
+        gp = self.create_pass(self.flight)
+        wrong = self.create_pass(self.sibling)
+        batch = [
+            self.event(gp, self.flight, 1),
+            self.event(wrong, self.flight, 2),
+            self.event(None, self.flight, 3)
+        ]
+
+        first = OfflineSyncService.sync_batch(batch, self.gate_a.id, 'FIH')
+        retry = OfflineSyncService.sync_batch(batch, self.gate_a.id, 'FIH')
+
+        self.assertEqual(retry['results'], first['results'])
+        self.assertEqual([r['code'] for r in retry['results']], ['VALID', 'WRONG_FLIGHT', 'INVALID'])
+        self.assertEqual(AccessLog.query.filter_by(is_offline=True).count(), 3)
+        counter = db.session.get(FlightCounter, self.flight.id)
+        self.assertEqual((counter.scanned, counter.rejected_wrong_flight, counter.rejected_invalid), (1, 1, 1))
+
+    def test_consumed_pass_on_wrong_flight_is_already_scanned(self):
+        gp = self.create_pass(self.sibling)
+        GoPassService.validate_gopass(gp.token, self.sibling.id, self.gate_b.id, 'FIH')
+
+        result = OfflineSyncService.sync_batch([
+            self.event(gp, self.flight, 91) # After the online boarding
+        ], self.gate_a.id, 'FIH')
+        online = GoPassService.validate_gopass(gp.token, self.flight.id, self.gate_a.id, 'FIH')
+
+        self.assertEqual(result['results'][0]['code'], 'ALREADY_SCANNED')
+        self.assertEqual(online['code'], 'ALREADY_SCANNED')
+
+    def test_earliest_scan_wins_across_devices(self):
+        gp = self.create_pass(self.flight)
+
+        later = OfflineSyncService.sync_batch([self.event(gp, self.flight, 10)], self.gate_a.id, 'GATE-A')
+        earlier = OfflineSyncService.sync_batch([self.event(gp, self.flight, 5)], self.gate_b.id, 'GATE-B')
+        latest = OfflineSyncService.sync_batch([self.event(gp, self.flight, 20)], self.gate_a.id, 'GATE-A')
+
+        self.assertEqual(later['results'][0]['code'], 'VALID')
+        self.assertEqual(earlier['results'][0]['code'], 'VALID')
+        self.assertEqual(latest['results'][0]['code'], 'ALREADY_SCANNED')
+
+        gopass = db.session.get(GoPass, gp.id)
+        self.assertEqual(gopass.scanned_by, self.gate_b.id)
+        self.assertEqual(gopass.scan_location, 'GATE-B')
+
+    def test_malformed_events_are_rejected_one_by_one(self):
+        gp = self.create_pass(self.flight)
+
+        result = OfflineSyncService.sync_batch([
+            'not-an-event',
+            self.event(gp, self.flight, 1),
+            {'token': gp.token, 'timestamp': self.scan_base.isoformat()}
+        ], self.gate_a.id, 'FIH')
+
+        self.assertEqual([r['index'] for r in result['results']], [0, 1, 2])
+        self.assertEqual([r['code'] for r in result['results']], ['INVALID', 'VALID', 'INVALID'])
+        self.assertIn('error', result['results'][2])
+        self.assertEqual(result['summary'], {'INVALID': 2, 'VALID': 1})
+        self.assertEqual(db.session.get(GoPass, gp.id).status, 'consumed')
+
+    def test_device_clock_is_clamped(self):
+        gp = self.create_pass(self.flight)
+        issued = db.session.get(GoPass, gp.id).issue_date
+
+        # A clock a day ahead would lose to any honest scan; a day behind would beat them all
+        ahead = OfflineSyncService.sync_batch([
+            dict(self.event(gp, self.flight, 0), timestamp=(datetime.utcnow() + timedelta(days=1)).isoformat())
+        ], self.gate_a.id, 'GATE-A')
+        self.assertEqual(ahead['results'][0]['code'], 'VALID')
+        self.assertLessEqual(
+            db.session.get(GoPass, gp.id).scan_date,
+            datetime.utcnow() + timedelta(seconds=OfflineSyncService.MAX_CLOCK_SKEW)
+        )
+
+        behind = OfflineSyncService.sync_batch([
+            dict(self.event(gp, self.flight, 0), timestamp=(issued - timedelta(days=1)).isoformat())
+        ], self.gate_b.id, 'GATE-B')
+        self.assertEqual(behind['results'][0]['code'], 'VALID')
+        db.session.expire_all()
+        self.assertEqual(db.session.get(GoPass, gp.id).scan_date, issued)
+
+    def test_large_batch_uses_chunked_queries(self):
+        passes = [self.create_pass(self.flight) for _ in range(600)]
+        events = [self.event(gp, self.flight, i % 60) for i, gp in enumerate(passes)]
+
+        result = OfflineSyncService.sync_batch(events, self.gate_a.id, 'FIH')
+
+        self.assertEqual(result['summary'], {'VALID': 600})
+        self.assertEqual(GoPass.query.filter_by(status='consumed').count(), 600)
+
+    def test_endpoint(self):
+        gp = self.create_pass(self.flight)
+        client = self.app.test_client()
+        client.post('/login', data=dict(username='gate_a', password='password'), follow_redirects=True)
+
+        response = client.post('/api/scan/offline-batch', json={
+            'location': 'FIH',
+            'scans': [dict(self.event(gp, self.flight, 1), token=json.dumps({'hash_signature': gp.token}))]
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['summary'], {'VALID': 1})
+
+        malformed = client.post('/api/scan/offline-batch', json={'scans': [{'token': gp.token}]})
+        self.assertEqual(malformed.status_code, 200)
+        self.assertEqual(malformed.get_json()['results'][0]['code'], 'INVALID')
+
+        empty = client.post('/api/scan/offline-batch', json={'scans': []})
+        self.assertEqual(empty.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import io
+import unittest
+from datetime import datetime
+from pypdf import PdfReader
+from app import create_app
+from models import db, Flight, User
+from services.gopass_service import GoPassService
+from services.pdf_render_pool import PdfRenderPool
+
+class TestParallelBulkPdf(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config.update(BULK_PDF_WORKERS=2, BULK_PDF_CHUNK_SIZE=2, BULK_PDF_PARALLEL_MIN=4)
+        self.pool = PdfRenderPool.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        agent = User(
+            username='agent', email='agent@test.com', role='agent',
+            first_name='Agent', last_name='Desk'
+        )
+        agent.set_password('password')
+        db.session.add(agent)
+
+        self.flight = Flight(
+            flight_number='FL-P', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+        self.gopasses = GoPassService.create_gopasses_bulk(
+            self.flight.id,
+            [{'passenger_name': f'Passenger {i}', 'passenger_passport': f'P{i:07d}'} for i in range(5)],
+            sold_by=agent.id
+        )
+
+    def tearDown(self):
+        self.pool.shutdown()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def page_texts(self, pdf):
+        return [page.extract_text() for page in PdfReader(io.BytesIO(pdf)).pages]
+
+    def test_parallel_output_matches_serial(self):
+        self.assertTrue(self.pool.should_split(5))
+        parallel = GoPassService.generate_bulk_pdf(self.gopasses)
+
+        self.pool.workers = 1
+        serial = GoPassService.generate_bulk_pdf(self.gopasses)
+
+        texts = self.page_texts(parallel)
+        self.assertEqual(texts, self.page_texts(serial))
+        self.assertEqual(len(texts), 5)
+        for i, text in enumerate(texts):
+            self.assertIn(f'PASSENGER {i}', text)
+            self.assertIn('FL-P', text)
+
+    def test_small_orders_stay_serial(self):
+        self.assertFalse(self.pool.should_split(3))
+        pdf = GoPassService.generate_bulk_pdf(self.gopasses[:3])
+
+        self.assertEqual(len(self.page_texts(pdf)), 3)
+        self.assertIsNone(self.pool._executor)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from app import create_app
+from models import db, Flight, GoPass, User, PassNumberSequence
+from services.gopass_service import GoPassService
+from services.pass_number_service import PassNumberService
+from datetime import datetime
+
+class TestPassNumbers(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['PASS_NUMBER_BLOCK_SIZE'] = 10
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.agent = User(
+            username='agent', email='agent@test.com', role='agent',
+            first_name='Agent', last_name='Desk'
+        )
+        self.agent.set_password('password')
+        db.session.add(self.agent)
+
+        self.fih = Flight(
+            flight_number='FL-N1', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        self.fbm = Flight(
+            flight_number='FL-N2', airline='TestAir', departure_airport='FBM', arrival_airport='FIH',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add_all([self.fih, self.fbm])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def sell(self, flight, count):
+        passengers = [
+            {'passenger_name': f'Passenger {i}', 'passenger_passport': f'P{i:07d}'}
+            for i in range(count)
+        ]
+        return GoPassService.create_gopasses_bulk(flight.id, passengers, sold_by=self.agent.id)
+
+    def sequence(self, prefix):
+        db.session.expire_all()
+        return db.session.get(PassNumberSequence, prefix).next_value
+
+    def test_numbers_come_from_reserved_blocks_per_airport(self):
+        first = self.sell(self.fih, 4)
+        self.assertEqual([gp.pass_number for gp in first], ['FIH-0000001', 'FIH-0000002', 'FIH-0000003', 'FIH-0000004'])
+        self.assertEqual(self.sequence('FIH'), 11)
+
+        # Served from memory until the block runs out, then one more block
+        second = self.sell(self.fih, 8)
+        self.assertEqual(second[-1].pass_number, 'FIH-0000012')
+        self.assertEqual(self.sequence('FIH'), 21)
+
+        self.assertEqual(self.sell(self.fbm, 1)[0].pass_number, 'FBM-0000001')
+
+    def test_new_worker_never_reuses_numbers(self):
+        self.sell(self.fih, 2)
+        other_worker = PassNumberService(self.app)
+        self.assertEqual(other_worker.allocate('FIH', 2), ['FIH-0000011', 'FIH-0000012'])
+
+    def test_rollback_never_reuses_numbers(self):
+        PassNumberService.get().allocate('FIH', 1)
+        db.session.rollback()
+        # On SQLite the reservation rolls back with the session and its block is dropped;
+        # elsewhere it was committed on its own connection and the block stays in use
+        expected = 'FIH-0000001' if db.engine.dialect.name == 'sqlite' else 'FIH-0000002'
+        self.assertEqual(self.sell(self.fih, 1)[0].pass_number, expected)
+        self.assertEqual(self.sequence('FIH'), 11)
+
+    def test_backfill_numbers_legacy_passes(self):
+        passes = self.sell(self.fih, 3) + self.sell(self.fbm, 2)
+        GoPass.query.update({GoPass.pass_number: None})
+        db.session.commit()
+
+        self.assertEqual(PassNumberService.backfill(batch_size=2), 5)
+        numbers = [db.session.get(GoPass, gp.id).pass_number for gp in passes]
+        self.assertEqual(len(set(numbers)), 5)
+        self.assertEqual([n[:3] for n in numbers], ['FIH', 'FIH', 'FIH', 'FBM', 'FBM'])
+        self.assertEqual(PassNumberService.backfill(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from app import create_app
+from models import db, Flight, GoPass
+from services.gopass_service import GoPassService
+from services.branding_service import BrandingService
+from utils import i18n
+import services.gopass_service as gopass_service
+
+class TestPdfCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['PDF_CACHE_DISK'] = True
+        self.app.config['PDF_CACHE_DIR'] = self.cache_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        # Re-read the cache settings of this test
+        from services.pdf_cache import PdfCache
+        self.cache = PdfCache.init_app(self.app)
+
+        self.flight = Flight(
+            flight_number='FL-C', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+        self.gopasses = GoPassService.create_gopasses_bulk(
+            self.flight.id,
+            [{'passenger_name': f'Passenger {i}', 'passenger_passport': f'C{i:07d}'} for i in range(3)],
+            payment_ref='PAY-CACHE'
+        )
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_repeat_download_is_not_rendered_again(self):
+        url = f'/download/{self.gopasses[0].id}'
+        with patch.object(GoPassService, 'generate_pdf_bytes', wraps=GoPassService.generate_pdf_bytes) as render:
+            first = self.client.get(url)
+            second = self.client.get(url)
+            revalidated = self.client.get(url, headers={'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.data, b'')
+        self.assertIn('private', first.headers['Cache-Control'])
+        self.assertNotIn('no-store', first.headers['Cache-Control'])
+
+        # Other pages keep the default policy
+        self.assertIn('no-store', self.client.get('/').headers['Cache-Control'])
+
+    def test_etag_changes_with_status_format_and_logo(self):
+        gopass = self.gopasses[0]
+        etag = GoPassService.pdf_etag(gopass)
+
+        self.assertEqual(GoPassService.pdf_etag(gopass), etag)
+        self.assertNotEqual(GoPassService.pdf_etag(gopass, fmt='thermal'), etag)
+        self.assertNotEqual(GoPassService.pdf_etag(gopass, lang='en'), etag)
+
+        gopass.status = 'consumed'
+        db.session.commit()
+        self.assertNotEqual(GoPassService.pdf_etag(gopass), etag)
+
+        logo = os.path.join(self.cache_dir, 'logo.png')
+        with open(logo, 'wb') as f:
+            f.write(b'old')
+        with patch.object(BrandingService, 'resolve_logo_paths', return_value=(logo, None)):
+            BrandingService.invalidate()
+            before = GoPassService.pdf_etag(gopass)
+            with open(logo, 'wb') as f:
+                f.write(b'new logo')
+            BrandingService.invalidate() # As a logo upload does
+            self.assertNotEqual(GoPassService.pdf_etag(gopass), before)
+        BrandingService.invalidate()
+
+    def test_etag_changes_with_layout_and_ticket_texts(self):
+        gopass = self.gopasses[0]
+        etag = GoPassService.pdf_etag(gopass)
+
+        with patch.object(gopass_service, 'TICKET_LAYOUT_VERSION', gopass_service.TICKET_LAYOUT_VERSION + 1):
+            self.assertNotEqual(GoPassService.pdf_etag(gopass), etag)
+
+        i18n.get_text('ticket_pdf.keep_ticket', 'fr')
+        with patch.dict(i18n._translations['fr']['ticket_pdf'], {'keep_ticket': 'Conservez ce billet.'}):
+            i18n._section_digests.clear()
+            self.assertNotEqual(GoPassService.pdf_etag(gopass), etag)
+        i18n._section_digests.clear()
+        self.assertEqual(GoPassService.pdf_etag(gopass), etag)
+
+    def test_prune_drops_old_then_least_recently_used(self):
+        def entry(key, size, age_days):
+            path = self.cache._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+            stamp = time.time() - age_days * 86400
+            os.utime(path, (stamp, stamp))
+            return path
+
+        expired = entry('aa' * 32, 1024, 40)
+        older = entry('bb' * 32, 600 * 1024, 3)
+        recent = entry('cc' * 32, 600 * 1024, 1)
+        self.assertEqual(self.cache._read('bb' * 32)[:1], b'x') # A hit makes it the most recent
+
+        files, size = self.cache.prune(max_age_days=30, max_mb=1)
+
+        self.assertEqual((files, size), (2, 1024 + 600 * 1024))
+        self.assertFalse(os.path.exists(expired))
+        self.assertFalse(os.path.exists(recent))
+        self.assertTrue(os.path.exists(older))
+
+    def test_batch_is_cached_once_fully_streamed(self):
+        url = '/download/batch/PAY-CACHE'
+        first = self.client.get(url)
+        etag = first.headers['ETag']
+        self.assertTrue(first.is_streamed)
+        body = first.get_data()
+
+        with patch.object(GoPassService, 'stream_bulk_pdf') as render:
+            second = self.client.get(url)
+        render.assert_not_called()
+        self.assertEqual(second.get_data(), body)
+        self.assertEqual(second.headers['ETag'], etag)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        # A new pass in the order gives a new document
+        GoPassService.create_gopasses_bulk(self.flight.id, [{'passenger_name': 'Late', 'passenger_passport': 'C9999999'}], payment_ref='PAY-CACHE')
+        self.assertNotEqual(self.client.get(url).headers['ETag'], etag)
+
+    def test_interrupted_stream_is_not_cached(self):
+        etag = GoPassService.batch_pdf_etag(self.gopasses)
+        stream = self.cache.store_stream(etag, GoPassService.stream_bulk_pdf(self.gopasses))
+        next(stream)
+        stream.close()
+
+        self.assertIsNone(self.cache.cached_path(etag))
+        self.assertEqual([f for _, _, files in os.walk(self.cache_dir) for f in files], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from app import create_app, db
+from models import User, Flight, GoPass, Transaction
+from services.gopass_service import GoPassService
+from datetime import datetime, timedelta
+import json
+
+class PosIdempotencyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+
+            for username in ('agent', 'agent2'):
+                user = User(username=username, email=f'{username}@test.com', role='agent', first_name='Bond', last_name='James', location='FIH')
+                user.set_password('password')
+                db.session.add(user)
+
+            flight = Flight(
+                flight_number='AF123',
+                airline='Air France',
+                departure_airport='FIH',
+                arrival_airport='CDG',
+                departure_time=datetime.now(),
+                status='scheduled'
+            )
+            db.session.add(flight)
+            db.session.commit()
+
+            self.flight_id = flight.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def login(self, username='agent'):
+        return self.client.post('/login', data=dict(
+            username=username,
+            password='password'
+        ), follow_redirects=True)
+
+    def sale(self, key):
+        payload = {
+            'flight_mode': 'today',
+            'flight_id': self.flight_id,
+            'price': 50.0,
+            'passengers': [
+                {'name': 'Passenger 1', 'doc_num': 'A100', 'doc_type': 'Passport'},
+                {'name': 'Passenger 2', 'doc_num': 'B200', 'doc_type': 'ID Card'}
+            ]
+        }
+        return self.client.post('/ops/pos/sale',
+                                data=json.dumps(payload),
+                                content_type='application/json',
+                                headers={'Idempotency-Key': key})
+
+    def test_retry_returns_original_tickets(self):
+        with self.client:
+            self.login()
+            first = self.sale('key-1')
+            retry = self.sale('key-1')
+
+            self.assertEqual(retry.status_code, 200)
+            self.assertEqual(retry.headers.get('Idempotent-Replayed'), 'true')
+            self.assertEqual(retry.get_json()['tickets'], first.get_json()['tickets'])
+            self.assertEqual(retry.get_json()['total_price'], 100.0)
+            self.assertEqual(retry.get_json()['time'], first.get_json()['time']) # One clock for both
+
+            self.assertEqual(self.sale('key-2').status_code, 200)
+
+        with self.app.app_context():
+            self.assertEqual(GoPass.query.count(), 4)
+            self.assertEqual(Transaction.query.count(), 2)
+
+    def test_key_of_another_agent_is_rejected(self):
+        with self.client:
+            self.login()
+            self.sale('key-1')
+            self.client.get('/logout')
+            self.login('agent2')
+            self.assertEqual(self.sale('key-1').status_code, 409)
+
+    def test_expired_keys_are_cleared(self):
+        with self.client:
+            self.login()
+            self.sale('old-key')
+            self.sale('new-key')
+
+        with self.app.app_context():
+            old = Transaction.query.filter_by(idempotency_key='old-key').one()
+            old.created_at = datetime.utcnow() - timedelta(hours=30)
+            db.session.commit()
+
+            self.assertEqual(GoPassService.expire_idempotency_keys(), 1)
+            self.assertEqual(GoPassService.find_sale('old-key'), (None, []))
+            self.assertEqual(len(GoPassService.find_sale('new-key')[1]), 2)
+
+if __name__ == '__main__':
+    unittest.main()
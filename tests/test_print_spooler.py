@@ -0,0 +1,202 @@
+import json
+import socket
+import threading
+import unittest
+from datetime import datetime
+from app import create_app
+from models import db, User, Flight, Printer, PrintJob
+from services.escpos_service import EscPosService
+from services.gopass_service import GoPassService
+
+class PrinterStandIn:
+    """Local TCP server in place of a network printer: keeps what each connection sent."""
+
+    def __init__(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.received = []
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with conn:
+                chunks = []
+                while True:
+                    data = conn.recv(65536)
+                    if not data:
+                        break
+                    chunks.append(data)
+                self.received.append(b''.join(chunks))
+
+    def close(self):
+        try:
+            self.server.shutdown(socket.SHUT_RDWR) # Wakes accept()
+        except OSError:
+            pass
+        self.server.close()
+
+class TestPrintSpooler(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['PRINT_SPOOLER_WORKERS'] = 0 # Jobs are run explicitly
+        self.app.config['PRINT_MAX_ATTEMPTS'] = 2
+        self.client = self.app.test_client()
+        self.printer_stand_in = PrinterStandIn()
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        user = User(username='agent', email='agent@test.com', role='agent', first_name='Bond', last_name='James', location='FIH')
+        user.set_password('password')
+        db.session.add(user)
+        flight = Flight(
+            flight_number='AF123', airline='Air France', departure_airport='FIH', arrival_airport='CDG',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(flight)
+        db.session.commit()
+
+        self.printer = Printer(name='Printer-Counter-1', assigned_to=user.id, ip_address='127.0.0.1', port=self.printer_stand_in.port)
+        db.session.add(self.printer)
+        db.session.commit()
+        self.flight_id = flight.id
+        self.spooler = self.app.extensions['print_spooler']
+
+    def tearDown(self):
+        self.printer_stand_in.close()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def sell(self, *names):
+        self.client.post('/login', data=dict(username='agent', password='password'))
+        payload = {
+            'flight_mode': 'today',
+            'flight_id': self.flight_id,
+            'price': 50.0,
+            'passengers': [{'name': name, 'doc_num': f'D{i}', 'doc_type': 'Passport'} for i, name in enumerate(names)]
+        }
+        return self.client.post('/ops/pos/sale', data=json.dumps(payload), content_type='application/json').get_json()
+
+    def wait_received(self, count):
+        for _ in range(100):
+            if len(self.printer_stand_in.received) >= count:
+                break
+            threading.Event().wait(0.02)
+        return self.printer_stand_in.received
+
+    def test_escpos_ticket(self):
+        gopass = GoPassService.create_gopasses_bulk(self.flight_id, [{'passenger_name': 'Jean Dupont', 'passenger_passport': 'P1'}])[0]
+        qr_data = GoPassService.qr_payload(gopass)
+        raw = EscPosService.render_ticket(GoPassService._bulk_ticket(gopass))
+
+        self.assertTrue(raw.startswith(b'\x1b@'))
+        self.assertTrue(raw.endswith(b'\x1dV\x42\x03'))
+        self.assertIn(b'JEAN DUPONT', raw)
+        self.assertIn(b'AF123', raw)
+        self.assertIn('Reçu'.encode('cp1252'), raw)
+
+        # QR code sent as data for the printer's own encoder, then printed
+        stored = len(qr_data) + 3
+        self.assertIn(b'\x1d(k' + bytes([stored % 256, stored // 256]) + b'1P0' + qr_data.encode('utf-8'), raw)
+        self.assertIn(b'\x1d(k\x03\x001Q0', raw)
+
+    def test_sale_is_printed_through_the_spooler(self):
+        data = self.sell('Passenger 1', 'Passenger 2')
+        job_ids = [ticket['print_job_id'] for ticket in data['tickets']]
+        self.assertEqual(len(job_ids), 2)
+        self.assertEqual(PrintJob.query.filter_by(status='queued').count(), 2)
+
+        self.assertEqual(self.spooler.run_pending(), 2)
+
+        received = self.wait_received(2)
+        self.assertEqual(len(received), 2)
+        self.assertIn(b'PASSENGER 1', received[0])
+        self.assertIn(b'PASSENGER 2', received[1])
+        self.assertEqual([db.session.get(PrintJob, job_id).status for job_id in job_ids], ['done', 'done'])
+
+        status = self.client.get(f'/ops/pos/print-jobs/{job_ids[0]}').get_json()
+        self.assertEqual(status['status'], 'done')
+
+    def test_unreachable_printer_is_retried_then_failed(self):
+        # A port nobody listens on
+        probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        probe.bind(('127.0.0.1', 0))
+        self.printer.port = probe.getsockname()[1]
+        probe.close()
+        db.session.commit()
+
+        data = self.sell('Passenger 1')
+        job_id = data['tickets'][0]['print_job_id']
+
+        self.spooler.run_pending()
+        job = db.session.get(PrintJob, job_id)
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(db.session.get(Printer, self.printer.id).status, 'offline')
+
+        # Retry due now: second and last attempt
+        job.run_after = datetime.utcnow()
+        db.session.commit()
+        self.spooler.run_pending()
+        job = db.session.get(PrintJob, job_id)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('Error', job.last_error)
+
+    def test_one_job_at_a_time_per_printer(self):
+        self.sell('Passenger 1', 'Passenger 2')
+        first = self.spooler.claim()
+        self.assertIsNotNone(first)
+        self.assertIsNone(self.spooler.claim())
+
+        self.spooler.process(first)
+        self.assertIsNotNone(self.spooler.claim())
+
+    def test_retried_job_holds_back_later_jobs(self):
+        self.sell('Passenger 1', 'Passenger 2')
+        first = self.spooler.claim()
+        self.spooler._fail(first, OSError('paper jam'))
+        self.assertEqual(db.session.get(PrintJob, first).status, 'queued')
+
+        # The second ticket waits for the first one's retry
+        self.assertIsNone(self.spooler.claim())
+
+        db.session.get(PrintJob, first).run_after = datetime.utcnow()
+        db.session.commit()
+        self.assertEqual(self.spooler.claim(), first)
+
+    def test_replayed_sale_is_not_printed_again(self):
+        self.client.post('/login', data=dict(username='agent', password='password'))
+        payload = {
+            'flight_mode': 'today', 'flight_id': self.flight_id, 'price': 50.0,
+            'passengers': [{'name': 'Passenger 1', 'doc_num': 'D1', 'doc_type': 'Passport'}]
+        }
+        headers = {'Idempotency-Key': 'sale-1'}
+        first = self.client.post('/ops/pos/sale', json=payload, headers=headers).get_json()
+        replay = self.client.post('/ops/pos/sale', json=payload, headers=headers)
+
+        self.assertEqual(replay.headers.get('Idempotent-Replayed'), 'true')
+        self.assertEqual(replay.get_json()['tickets'][0]['print_job_id'], first['tickets'][0]['print_job_id'])
+        self.assertEqual(PrintJob.query.count(), 1)
+
+    def test_counter_without_network_printer_prints_pdf(self):
+        self.printer.ip_address = None
+        db.session.commit()
+
+        data = self.sell('Passenger 1')
+        self.assertIsNone(data['tickets'][0]['print_job_id'])
+        self.assertEqual(PrintJob.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
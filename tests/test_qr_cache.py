@@ -0,0 +1,152 @@
+import os
+import re
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from app import create_app
+from models import db, Flight, User
+from services.gopass_service import GoPassService
+from services.qr_service import QRService
+from services.qr_cache import QRCache
+
+class TestQRCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['QR_CACHE_DISK'] = True
+        self.app.config['QR_CACHE_DIR'] = self.cache_dir
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.cache = QRCache.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.admin = User(
+            username='admin', email='admin@test.com', role='admin',
+            first_name='Admin', last_name='Root'
+        )
+        self.admin.set_password('password')
+        db.session.add(self.admin)
+
+        self.flight = Flight(
+            flight_number='FL-Q', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+        self.gopass = GoPassService.create_gopass(
+            flight_id=self.flight.id, passenger_name='Jane Doe', passenger_passport='B7654321'
+        )
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_repeated_downloads_skip_qr_generation(self):
+        with patch.object(QRService, '_render', wraps=QRService._render) as render, \
+                patch.object(QRService, '_encode', wraps=QRService._encode) as encode:
+            first = GoPassService.generate_pdf_bytes(self.gopass)
+            GoPassService.generate_pdf_bytes(self.gopass)
+            GoPassService.generate_pdf_bytes(self.gopass, fmt='thermal')
+
+        self.assertTrue(first.startswith(b'%PDF'))
+        self.assertEqual(render.call_count + encode.call_count, 1)
+        stats = self.cache.snapshot()
+        self.assertEqual((stats['misses'], stats['memory_hits'], stats['hit_ratio']), (1, 2, 0.6667))
+
+    def test_disk_cache_is_shared_and_content_addressed(self):
+        png = GoPassService.qr_png(self.gopass)
+        key = QRCache.make_key(GoPassService.qr_payload(self.gopass), 'ticket', 10)
+        with open(os.path.join(self.cache_dir, key[:2], f'{key}.png'), 'rb') as f:
+            self.assertEqual(f.read(), png)
+
+        # Another worker: empty memory, same directory
+        other = QRCache.init_app(self.app)
+        with patch.object(QRService, '_render') as render:
+            self.assertEqual(GoPassService.qr_png(self.gopass), png)
+        render.assert_not_called()
+        self.assertEqual(other.snapshot()['disk_hits'], 1)
+
+    def test_matrices_are_not_stored_as_png(self):
+        matrix = QRService.matrix('GP-MATRIX')
+        key = QRCache.make_key('GP-MATRIX', 'matrix', 1)
+        files = [f for _, _, names in os.walk(self.cache_dir) for f in names]
+        self.assertEqual(files, [f'{key}{QRService.MATRIX_SUFFIX}'])
+
+        other = QRCache.init_app(self.app)
+        self.assertEqual(QRService.matrix('GP-MATRIX'), matrix)
+        self.assertEqual(other.snapshot()['disk_hits'], 1)
+
+    def test_prune_bounds_the_disk_cache(self):
+        png = QRService.render_png('GP-OLD')
+        QRService.matrix('GP-RECENT')
+        old = self.cache._path(QRCache.make_key('GP-OLD', 'ticket', 10))
+        stamp = time.time() - 40 * 86400
+        os.utime(old, (stamp, stamp))
+
+        self.assertEqual(self.cache.prune(max_age_days=30, max_mb=1), (1, len(png)))
+        self.assertFalse(os.path.exists(old))
+        self.assertEqual(len([f for _, _, files in os.walk(self.cache_dir) for f in files]), 1)
+
+    def test_changed_pass_content_is_rendered_again(self):
+        before = GoPassService.qr_png(self.gopass)
+        self.flight.departure_time = datetime(2030, 1, 1, 10, 0)
+        db.session.commit()
+
+        self.assertNotEqual(GoPassService.qr_png(self.gopass), before)
+        self.assertEqual(self.cache.snapshot()['misses'], 2)
+
+    def test_memory_cache_is_bounded(self):
+        self.cache.max_entries = 2
+        self.cache.disk_enabled = False
+        for data in ('a', 'b', 'c', 'a'):
+            QRService.render_png(data)
+
+        stats = self.cache.snapshot()
+        self.assertEqual((stats['entries'], stats['evictions'], stats['misses']), (2, 2, 4))
+
+    def test_metrics_endpoint_is_admin_only(self):
+        GoPassService.qr_png(self.gopass)
+        client = self.app.test_client()
+        client.post('/login', data=dict(username='admin', password='password'))
+
+        stats = client.get('/api/metrics/qr').get_json()
+        self.assertEqual((stats['lookups'], stats['misses']), (1, 1))
+
+    def test_confirmation_page_links_cacheable_qr_images(self):
+        GoPassService.create_gopasses_bulk(
+            self.flight.id,
+            [{'passenger_name': f'Passenger {i}', 'passenger_passport': f'Q{i:07d}'} for i in range(30)],
+            payment_ref='PAY-CONF'
+        )
+        client = self.app.test_client()
+
+        with patch.object(QRService, 'render_png', wraps=QRService.render_png) as render:
+            page = client.get('/confirmation/batch/PAY-CONF').get_data(as_text=True)
+        render.assert_not_called()
+        self.assertNotIn('data:image/png;base64', page)
+        self.assertEqual(page.count('loading="lazy"'), 30)
+
+        url = re.search(r'src="(/qr/\d+/[0-9a-f]{16}\.png)"', page).group(1)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertTrue(response.data.startswith(b'\x89PNG'))
+        cache_control = response.headers['Cache-Control']
+        for directive in ('private', 'max-age=31536000', 'immutable'):
+            self.assertIn(directive, cache_control)
+        self.assertNotIn('no-store', cache_control)
+
+        self.assertEqual(client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code, 304)
+        wrong_version = re.sub(r'/[0-9a-f]{16}\.png', '/0000000000000000.png', url)
+        self.assertEqual(client.get(wrong_version).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+from unittest.mock import patch
+from app import create_app
+from models import db, Flight, GoPass, User, ScanIndex
+from services.gopass_service import GoPassService
+from services.scan_index_service import ScanIndexService
+from services.offline_sync_service import OfflineSyncService
+from datetime import datetime, timedelta
+
+class TestScanIndex(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['GATE_SESSION_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.agent = User(
+            username='controller', email='controller@test.com', role='controller',
+            first_name='Agent', last_name='Gate'
+        )
+        self.agent.set_password('password')
+        db.session.add(self.agent)
+
+        today = datetime.now()
+        self.flight = Flight(
+            flight_number='FL-I', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today, status='boarding'
+        )
+        self.sibling = Flight(
+            flight_number='FL-J', airline='TestAir', departure_airport='FIH', arrival_airport='GOM',
+            departure_time=today, status='boarding'
+        )
+        self.tomorrow = Flight(
+            flight_number='FL-K', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today + timedelta(days=1), status='scheduled'
+        )
+        db.session.add_all([self.flight, self.sibling, self.tomorrow])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_pass(self, flight):
+        return GoPassService.create_gopass(
+            flight_id=flight.id, passenger_name='Jane Doe',
+            passenger_passport='B7654321', sold_by=self.agent.id
+        )
+
+    def create_legacy_pass(self, flight):
+        """A pass written before the scan index existed."""
+        gopass = GoPass(
+            token='LEGACY-' + flight.flight_number, flight_id=flight.id,
+            passenger_name='John Doe', passenger_passport='C1234567', status='valid'
+        )
+        db.session.add(gopass)
+        db.session.commit()
+        return gopass
+
+    def scan(self, gopass, flight):
+        return GoPassService.validate_gopass(gopass.token, flight.id, self.agent.id, 'FIH')
+
+    def test_sale_is_indexed(self):
+        gp = self.create_pass(self.flight)
+
+        entry = ScanIndexService.lookup(gp.token)
+        self.assertEqual(entry.pass_id, gp.id)
+        self.assertEqual(entry.flight_id, self.flight.id)
+        self.assertEqual(entry.flight_date, self.flight.departure_time.date())
+        self.assertEqual(entry.departure_airport, 'FIH')
+        self.assertEqual(entry.status, 'valid')
+        self.assertEqual(ScanIndex.query.one().token_digest, GoPassService.token_digest(gp.token))
+
+    def test_rejections_are_answered_from_the_index(self):
+        sibling = self.create_pass(self.sibling)
+        other_day = self.create_pass(self.tomorrow)
+
+        with patch.object(GoPass, 'query') as mock_query:
+            wrong = self.scan(sibling, self.flight)
+            expired = self.scan(other_day, self.flight)
+            mock_query.filter_by.assert_not_called()
+
+        self.assertEqual(wrong, GoPassService._wrong_flight_response('FL-J', self.sibling.departure_time))
+        self.assertEqual(expired, GoPassService._expired_response(
+            self.tomorrow.departure_time, self.flight.departure_time, 'FL-K'
+        ))
+
+    def test_scan_mirrors_consumption(self):
+        gp = self.create_pass(self.flight)
+
+        self.assertEqual(self.scan(gp, self.flight)['code'], 'VALID')
+        self.assertEqual(ScanIndexService.lookup(gp.token).status, 'consumed')
+        self.assertEqual(self.scan(gp, self.flight)['code'], 'ALREADY_SCANNED')
+
+    def test_offline_sync_mirrors_consumption(self):
+        gp = self.create_pass(self.flight)
+
+        OfflineSyncService.sync_batch([{
+            'token': gp.token,
+            'flight_id': self.flight.id,
+            'timestamp': datetime.utcnow().isoformat()
+        }], self.agent.id, 'FIH')
+
+        self.assertEqual(ScanIndexService.lookup(gp.token).status, 'consumed')
+
+    def test_legacy_pass_is_indexed_on_first_scan(self):
+        gp = self.create_legacy_pass(self.flight)
+        self.assertIsNone(ScanIndexService.lookup(gp.token))
+
+        self.assertEqual(self.scan(gp, self.flight)['code'], 'VALID')
+        self.assertEqual(ScanIndexService.lookup(gp.token).status, 'consumed')
+
+    def test_rebuild_backfills_and_repairs(self):
+        legacy = self.create_legacy_pass(self.flight)
+        gp = self.create_pass(self.sibling)
+        db.session.execute(db.update(ScanIndex).values(status='cancelled'))
+        db.session.commit()
+
+        self.assertEqual(ScanIndexService.rebuild(batch_size=1), 2)
+
+        self.assertEqual(ScanIndexService.lookup(legacy.token).pass_id, legacy.id)
+        self.assertEqual(ScanIndexService.lookup(gp.token).status, 'valid')
+        self.assertEqual(ScanIndex.query.count(), 2)
+
+if __name__ == '__main__':
+    unittest.main()
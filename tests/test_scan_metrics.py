@@ -0,0 +1,119 @@
+import threading
+import unittest
+from app import create_app
+from models import db, Flight, User
+from services.gopass_service import GoPassService
+from services.scan_metrics import ScanMetrics, Histogram
+from datetime import datetime
+
+class TestScanMetrics(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['GATE_SESSION_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.admin = User(
+            username='admin', email='admin@test.com', role='admin',
+            first_name='Admin', last_name='Root'
+        )
+        self.admin.set_password('password')
+        self.agent = User(
+            username='controller', email='controller@test.com', role='controller',
+            first_name='Agent', last_name='Gate'
+        )
+        self.agent.set_password('password')
+        db.session.add_all([self.admin, self.agent])
+
+        self.flight = Flight(
+            flight_number='FL-M', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='boarding'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+        self.metrics = ScanMetrics.get()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def scan(self, token, location='FIH'):
+        return GoPassService.validate_gopass(token, self.flight.id, self.agent.id, location)
+
+    def series(self, **kwargs):
+        return self.metrics.snapshot(**kwargs)['series']
+
+    def test_outcomes_and_phases_are_recorded(self):
+        gp = GoPassService.create_gopass(
+            flight_id=self.flight.id, passenger_name='Jane Doe',
+            passenger_passport='B7654321', sold_by=self.agent.id
+        )
+        self.scan(gp.token)
+        self.scan(gp.token)
+        self.scan('0' * 64)
+
+        by_outcome = {entry['outcome']: entry for entry in self.series()}
+        self.assertEqual(set(by_outcome), {'VALID', 'ALREADY_SCANNED', 'INVALID'})
+
+        valid = by_outcome['VALID']
+        self.assertEqual(valid['count'], 1)
+        self.assertLessEqual(valid['p50_ms'], valid['p99_ms'])
+        # On PostgreSQL the lookup and log phases fold into the single update statement
+        self.assertTrue({'resolve', 'update', 'commit'} <= set(valid['phases']))
+
+    def test_grouping_and_filters(self):
+        self.scan('0' * 64, 'FIH')
+        self.scan('1' * 64, 'FIH')
+        self.scan('2' * 64, 'GOM')
+
+        by_airport = {entry['airport']: entry['count'] for entry in self.series(group_by=['airport'])}
+        self.assertEqual(by_airport, {'FIH': 2, 'GOM': 1})
+
+        fih = self.series(group_by=['outcome', 'flight_id'], airport='FIH')
+        self.assertEqual(fih, [dict(fih[0], outcome='INVALID', flight_id=self.flight.id, count=2)])
+
+    def test_histogram_percentiles(self):
+        histogram = Histogram()
+        for ms in [1.0] * 90 + [100.0] * 10:
+            histogram.add(ms)
+
+        self.assertAlmostEqual(histogram.percentile(0.50), 1.0, delta=0.2)
+        self.assertAlmostEqual(histogram.percentile(0.99), 100.0, delta=20.0)
+        self.assertIsNone(Histogram().percentile(0.5))
+
+    def test_shards_of_exited_threads_are_folded(self):
+        flight_id = self.flight.id
+        def scan_in_thread(airport):
+            self.metrics.record('INVALID', airport, flight_id, 1.0, {'resolve': 0.1})
+
+        for airport in ['FIH', 'FIH', 'GOM']:
+            thread = threading.Thread(target=scan_in_thread, args=(airport,))
+            thread.start()
+            thread.join()
+        self.scan('0' * 64)
+
+        by_airport = {entry['airport']: entry['count'] for entry in self.series(group_by=['airport'])}
+        self.assertEqual(by_airport, {'FIH': 3, 'GOM': 1})
+        self.assertEqual(len(self.metrics._shards), 1) # Only this thread's shard is left
+        self.assertEqual(self.metrics._base[('INVALID', 'FIH', flight_id)][0].count, 2)
+
+    def test_endpoint_is_admin_only(self):
+        self.scan('0' * 64)
+        client = self.app.test_client()
+
+        client.post('/login', data=dict(username='controller', password='password'))
+        self.assertEqual(client.get('/api/metrics/scan').status_code, 403)
+
+        client.get('/logout')
+        client.post('/login', data=dict(username='admin', password='password'))
+        response = client.get('/api/metrics/scan?group_by=outcome,airport')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['series'][0]['airport'], 'FIH')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import unittest
+from unittest.mock import patch
+from app import create_app
+from config import config
+from models import db, Flight, GoPass, User, AccessLog, FlightCounter
+from services.gopass_service import GoPassService
+from datetime import datetime, timedelta
+
+# The single-statement scan path only runs on PostgreSQL, e.g.
+# TEST_POSTGRES_URL=postgresql://postgres@localhost/sgi_test
+POSTGRES_URL = os.environ.get('TEST_POSTGRES_URL')
+
+@unittest.skipUnless(POSTGRES_URL, "TEST_POSTGRES_URL not set")
+class TestScanSingleStatement(unittest.TestCase):
+    def setUp(self):
+        # The engine is bound in create_app, so the URL must be set beforehand
+        with patch.object(config['default'], 'SQLALCHEMY_DATABASE_URI', POSTGRES_URL):
+            self.app = create_app(config_name='default')
+        self.app.config['GATE_SESSION_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+
+        self.agent = User(
+            username='controller', email='controller@test.com', role='controller',
+            first_name='Agent', last_name='Gate'
+        )
+        self.agent.set_password('password')
+        db.session.add(self.agent)
+
+        today = datetime.now()
+        self.flight = Flight(
+            flight_number='PG-1', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today, status='boarding'
+        )
+        self.sibling = Flight(
+            flight_number='PG-2', airline='TestAir', departure_airport='FIH', arrival_airport='GOM',
+            departure_time=today, status='boarding'
+        )
+        self.tomorrow = Flight(
+            flight_number='PG-3', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today + timedelta(days=1), status='scheduled'
+        )
+        db.session.add_all([self.flight, self.sibling, self.tomorrow])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_pass(self, flight):
+        return GoPassService.create_gopass(
+            flight_id=flight.id, passenger_name='Jane Doe',
+            passenger_passport='B7654321', sold_by=self.agent.id
+        )
+
+    def scan(self, gopass, flight):
+        return GoPassService.validate_gopass(gopass.token, flight.id, self.agent.id, 'FIH')
+
+    def test_valid_then_already_scanned(self):
+        gp = self.create_pass(self.flight)
+
+        with patch.object(GoPass, 'query') as mock_query:
+            first = self.scan(gp, self.flight)
+            mock_query.filter_by.assert_not_called()
+
+        second = self.scan(gp, self.flight)
+
+        self.assertEqual(first, GoPassService._valid_response('Jane Doe', 'B7654321', 'Passeport'))
+        self.assertEqual(second['code'], 'ALREADY_SCANNED')
+        self.assertEqual(second['data']['flight'], 'PG-1')
+        self.assertEqual(second['data']['original_scan']['scanned_by'], 'controller')
+        self.assertEqual(second['data']['original_scan']['location'], 'FIH')
+
+        db.session.expire_all()
+        self.assertEqual(db.session.get(GoPass, gp.id).status, 'consumed')
+        self.assertEqual(db.session.get(FlightCounter, self.flight.id).scanned, 1)
+        self.assertEqual(
+            sorted(log.status for log in AccessLog.query.filter_by(flight_id=self.flight.id)),
+            ['ALREADY_SCANNED', 'VALID']
+        )
+
+    def test_rejections_match_generic_path(self):
+        sibling = self.create_pass(self.sibling)
+        other_day = self.create_pass(self.tomorrow)
+
+        wrong = self.scan(sibling, self.flight)
+        expired = self.scan(other_day, self.flight)
+        invalid = GoPassService.validate_gopass('0' * 64, self.flight.id, self.agent.id, 'FIH')
+
+        self.assertEqual(wrong, GoPassService._wrong_flight_response('PG-2', self.sibling.departure_time))
+        self.assertEqual(expired, GoPassService._expired_response(
+            self.tomorrow.departure_time, self.flight.departure_time, 'PG-3'
+        ))
+        self.assertEqual(invalid, GoPassService._invalid_response())
+        self.assertEqual(db.session.get(GoPass, sibling.id).status, 'valid')
+
+    def test_closed_flight_is_not_boarded(self):
+        gp = self.create_pass(self.flight)
+        self.flight.status = 'closed'
+        db.session.commit()
+
+        result = self.scan(gp, self.flight)
+
+        self.assertEqual(result['code'], 'FLIGHT_CLOSED')
+        db.session.expire_all()
+        self.assertEqual(db.session.get(GoPass, gp.id).status, 'valid')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import json
+import unittest
+from unittest.mock import patch
+from app import create_app
+from models import db, Flight, GoPass, User, SecurityKey
+from services.gopass_service import GoPassService
+from services.token_signing_service import TokenSigningService
+from datetime import datetime, timedelta, timezone
+
+class TestSignedTokens(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['GATE_SESSION_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.key = SecurityKey(
+            key_value='ab' * 32, key_type='flight_bound',
+            expires_at=datetime.now(timezone.utc) + timedelta(days=90)
+        )
+        db.session.add(self.key)
+
+        self.agent = User(
+            username='controller', email='controller@test.com', role='controller',
+            first_name='Agent', last_name='Gate'
+        )
+        self.agent.set_password('password')
+        db.session.add(self.agent)
+
+        today = datetime.now()
+        self.flight = Flight(
+            flight_number='FL-S', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today, status='boarding'
+        )
+        self.sibling = Flight(
+            flight_number='FL-T', airline='TestAir', departure_airport='FIH', arrival_airport='GOM',
+            departure_time=today, status='boarding'
+        )
+        self.tomorrow = Flight(
+            flight_number='FL-U', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today + timedelta(days=1), status='scheduled'
+        )
+        db.session.add_all([self.flight, self.sibling, self.tomorrow])
+        db.session.commit()
+
+        self.gopass = GoPassService.create_gopass(
+            flight_id=self.flight.id, passenger_name='Jane Doe',
+            passenger_passport='B7654321', sold_by=self.agent.id
+        )
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def qr_text(self):
+        return GoPassService.qr_payload(self.gopass)
+
+    def test_qr_carries_signed_token(self):
+        signed = json.loads(self.qr_text())['hash_signature']
+        self.assertTrue(signed.startswith(f'GP1.{self.key.id}.{self.gopass.id}.{self.flight.id}.'))
+
+        parsed = TokenSigningService.verify(signed)
+        self.assertEqual(parsed.token_hash, self.gopass.token)
+        self.assertEqual(parsed.flight_date, self.flight.departure_time.date())
+
+    def test_signed_token_boards(self):
+        result = GoPassService.validate_gopass(self.qr_text(), self.flight.id, self.agent.id, 'FIH')
+        self.assertEqual(result['code'], 'VALID')
+
+    def test_forged_token_rejected_without_lookup(self):
+        payload = json.loads(self.qr_text())
+        parts = payload['hash_signature'].split('.')
+        parts[3] = str(self.sibling.id)
+        payload['hash_signature'] = '.'.join(parts)
+
+        with patch.object(GoPass, 'query') as mock_query:
+            result = GoPassService.validate_gopass(json.dumps(payload), self.sibling.id, self.agent.id, 'FIH')
+            mock_query.filter_by.assert_not_called()
+
+        self.assertEqual(result['code'], 'INVALID')
+
+    def test_wrong_date_and_wrong_flight_without_lookup(self):
+        with patch.object(GoPass, 'query') as mock_query:
+            expired = GoPassService.validate_gopass(self.qr_text(), self.tomorrow.id, self.agent.id, 'FIH')
+            wrong = GoPassService.validate_gopass(self.qr_text(), self.sibling.id, self.agent.id, 'FIH')
+            mock_query.filter_by.assert_not_called()
+
+        self.assertEqual(expired['code'], 'EXPIRED')
+        self.assertEqual(expired['data']['flight'], 'FL-S')
+        self.assertEqual(wrong['code'], 'WRONG_FLIGHT')
+        self.assertEqual(wrong['data']['valid_for'], 'FL-S')
+
+    def test_deactivated_key_revokes_tokens(self):
+        qr = self.qr_text()
+
+        self.key.is_active = False
+        db.session.commit()
+        TokenSigningService.invalidate_keyring()
+
+        result = GoPassService.validate_gopass(qr, self.flight.id, self.agent.id, 'FIH')
+        self.assertEqual(result['code'], 'INVALID')
+
+    def test_rotation_signs_with_newest_key(self):
+        old_qr = self.qr_text()
+        new_key = SecurityKey(key_value='cd' * 32, key_type='flight_bound')
+        db.session.add(new_key)
+        db.session.commit()
+        TokenSigningService.invalidate_keyring()
+
+        new_signed = json.loads(self.qr_text())['hash_signature']
+        self.assertEqual(new_signed.split('.')[1], str(new_key.id))
+
+        # Tokens signed with the previous, still active key keep verifying
+        result = GoPassService.validate_gopass(old_qr, self.flight.id, self.agent.id, 'FIH')
+        self.assertEqual(result['code'], 'VALID')
+
+    def test_legacy_hash_still_accepted(self):
+        result = GoPassService.validate_gopass(self.gopass.token, self.flight.id, self.agent.id, 'FIH')
+        self.assertEqual(result['code'], 'VALID')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import io
+import unittest
+from datetime import datetime
+from pypdf import PdfReader
+from app import create_app
+from models import db, Flight
+from services.gopass_service import GoPassService
+
+class TestStreamingPdf(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['BULK_PDF_STREAM_CHUNK_SIZE'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.flight = Flight(
+            flight_number='FL-S', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+        self.gopasses = GoPassService.create_gopasses_bulk(
+            self.flight.id,
+            [{'passenger_name': f'Passenger {i}', 'passenger_passport': f'P{i:07d}'} for i in range(5)],
+            payment_ref='PAY-STREAM'
+        )
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def page_texts(self, pdf):
+        return [page.extract_text() for page in PdfReader(io.BytesIO(pdf), strict=True).pages]
+
+    def test_stream_is_sent_part_by_part(self):
+        parts = list(GoPassService.stream_bulk_pdf(self.gopasses))
+
+        # Header, 3 parts of at most 2 tickets, page tree and xref
+        self.assertEqual(len(parts), 5)
+        self.assertTrue(parts[0].startswith(b'%PDF'))
+        self.assertTrue(parts[-1].endswith(b'%%EOF\n'))
+        self.assertEqual(self.page_texts(b''.join(parts)), self.page_texts(GoPassService.generate_bulk_pdf(self.gopasses)))
+
+    def test_batch_download_is_streamed(self):
+        response = self.app.test_client().get('/download/batch/PAY-STREAM')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'application/pdf')
+        self.assertIn('GoPasses_PAY-STREAM.pdf', response.headers['Content-Disposition'])
+
+        texts = self.page_texts(response.get_data())
+        self.assertEqual(len(texts), 5)
+        self.assertIn('PASSENGER 4', texts[4])
+
+if __name__ == '__main__':
+    unittest.main()
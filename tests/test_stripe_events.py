@@ -0,0 +1,132 @@
+import json
+import os
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy import event
+from app import create_app
+from models import db, Flight, GoPass, User, Transaction, FulfilmentJob, StripeEvent
+from services.fulfilment_service import FulfilmentService
+from services.stripe_event_service import StripeEventService
+from scripts.send_stripe_fixture import sign_payload, load_fixture
+
+SECRET = 'whsec_test_fixture'
+
+class TestStripeEvents(unittest.TestCase):
+    def setUp(self):
+        self.env = patch.dict(os.environ, {'STRIPE_WEBHOOK_SECRET': SECRET, 'STRIPE_SECRET_KEY': 'sk_test_fixture'})
+        self.env.start()
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['FULFILMENT_WORKERS'] = 0 # Jobs are run explicitly
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.admin = User(
+            username='admin', email='admin@test.com', role='admin',
+            first_name='Admin', last_name='Root'
+        )
+        self.admin.set_password('password')
+        db.session.add(self.admin)
+
+        self.flight = Flight(
+            flight_number='FL-E', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.service = FulfilmentService.get()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.env.stop()
+
+    def deliver(self, stripe_event):
+        payload = json.dumps(stripe_event)
+        return self.client.post(
+            '/api/payment/stripe-webhook', data=payload, content_type='application/json',
+            headers={'Stripe-Signature': sign_payload(payload, SECRET)}
+        )
+
+    def login_admin(self):
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client.post('/login', data=dict(username='admin', password='password'))
+
+    def test_redelivery_is_a_single_statement_no_op(self):
+        stripe_event = load_fixture(event_id='evt_fixture_dup', flight_id=self.flight.id, quantity=20)
+        first = self.deliver(stripe_event).get_json()
+        self.assertEqual(first['status'], 'received')
+
+        statements = []
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            second = self.deliver(stripe_event).get_json()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        self.assertEqual(second, {'success': True, 'duplicate': True})
+        self.assertEqual(len(statements), 1) # The conflicting INSERT only
+        self.assertEqual((StripeEvent.query.count(), FulfilmentJob.query.count()), (1, 1))
+
+        # Still a no-op once processed: no second basket
+        with patch.object(FulfilmentService, 'deliver'):
+            self.service.run_pending()
+        self.assertTrue(self.deliver(stripe_event).get_json()['duplicate'])
+        self.assertEqual(self.service.run_pending(), 0)
+        self.assertEqual((Transaction.query.count(), GoPass.query.count()), (1, 20))
+        self.assertEqual(db.session.get(StripeEvent, 'evt_fixture_dup').status, 'processed')
+
+    def test_unhandled_event_type_is_ignored(self):
+        stripe_event = load_fixture(flight_id=self.flight.id)
+        stripe_event['type'] = 'charge.refunded'
+        response = self.deliver(stripe_event).get_json()
+
+        self.assertEqual((response['status'], response['job_id']), ('ignored', None))
+        self.assertEqual(FulfilmentJob.query.count(), 0)
+        self.assertIsNotNone(db.session.get(StripeEvent, stripe_event['id']).processed_at)
+
+    def test_failed_event_replays_from_where_it_stopped(self):
+        self.app.config['FULFILMENT_MAX_ATTEMPTS'] = 1
+        self.deliver(load_fixture(flight_id=self.flight.id))
+        stripe_event = StripeEvent.query.one()
+
+        calls = []
+        def flaky_delivery(job, gopass, pdf_bytes):
+            calls.append(gopass.id)
+            if len(calls) == 2:
+                raise ConnectionError("SMTP down")
+
+        with patch.object(FulfilmentService, 'deliver', side_effect=flaky_delivery):
+            self.service.run_pending()
+            db.session.expire_all()
+            self.assertEqual((stripe_event.status, stripe_event.job.status), ('failed', 'failed'))
+            with self.assertRaises(LookupError):
+                StripeEventService.replay('evt_unknown')
+
+            self.login_admin()
+            failed = self.client.get('/api/stripe/events?status=failed').get_json()
+            self.assertEqual([e['id'] for e in failed], [stripe_event.id])
+
+            response = self.client.post(f'/api/stripe/events/{stripe_event.id}/replay')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.get_json()['status'], response.get_json()['replay_count']), ('received', 1))
+            self.assertEqual(self.client.post(f'/api/stripe/events/{stripe_event.id}/replay').status_code, 409)
+            self.assertEqual(self.client.post('/api/stripe/events/evt_unknown/replay').status_code, 404)
+
+            self.service.run_pending()
+
+        db.session.expire_all()
+        self.assertEqual((stripe_event.status, stripe_event.job.status, stripe_event.job.delivered_count), ('processed', 'done', 3))
+        self.assertEqual(len(set(calls)), 3)
+        self.assertEqual((Transaction.query.count(), GoPass.query.count()), (1, 3))
+
+if __name__ == '__main__':
+    unittest.main()
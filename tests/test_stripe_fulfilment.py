@@ -0,0 +1,164 @@
+import json
+import os
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from app import create_app
+from models import db, Flight, GoPass, User, Transaction, FulfilmentJob
+from services.fulfilment_service import FulfilmentService
+from services.print_spooler_service import PrintSpoolerService
+from config import config
+from scripts.send_stripe_fixture import sign_payload, load_fixture
+
+SECRET = 'whsec_test_fixture'
+
+class TestStripeFulfilment(unittest.TestCase):
+    def setUp(self):
+        self.env = patch.dict(os.environ, {'STRIPE_WEBHOOK_SECRET': SECRET, 'STRIPE_SECRET_KEY': 'sk_test_fixture'})
+        self.env.start()
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['FULFILMENT_WORKERS'] = 0 # Jobs are run explicitly
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.admin = User(
+            username='admin', email='admin@test.com', role='admin',
+            first_name='Admin', last_name='Root'
+        )
+        self.admin.set_password('password')
+        db.session.add(self.admin)
+
+        self.flight = Flight(
+            flight_number='FL-S', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.service = FulfilmentService.get()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.env.stop()
+
+    def deliver(self, event, secret=SECRET):
+        payload = json.dumps(event)
+        return self.client.post(
+            '/api/payment/stripe-webhook', data=payload, content_type='application/json',
+            headers={'Stripe-Signature': sign_payload(payload, secret)}
+        )
+
+    def test_webhook_queues_and_workers_fulfil(self):
+        response = self.deliver(load_fixture(flight_id=self.flight.id))
+        self.assertEqual(response.status_code, 200)
+        job = db.session.get(FulfilmentJob, response.get_json()['job_id'])
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(GoPass.query.count(), 0)
+
+        with patch.object(FulfilmentService, 'deliver') as deliver:
+            self.assertEqual(self.service.run_pending(), 1)
+        self.assertEqual(deliver.call_count, 3)
+        self.assertTrue(all(call.args[2].startswith(b'%PDF') for call in deliver.call_args_list))
+
+        db.session.expire_all()
+        self.assertEqual((job.status, job.attempts, job.ticket_count, job.delivered_count), ('done', 1, 3, 3))
+        self.assertEqual((job.transaction.amount_collected, job.transaction.ticket_count), (45.0, 3))
+        self.assertEqual({gp.payment_ref for gp in GoPass.query.all()}, {'pi_fixture_0001'})
+
+        # CSRF stays on above: the webhook is exempt, the login form is not
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client.post('/login', data=dict(username='admin', password='password'))
+        listing = self.client.get('/api/fulfilment/jobs?status=done').get_json()
+        self.assertEqual((listing['counts'], listing['jobs'][0]['id']), ({'done': 1}, job.id))
+
+    def test_bad_signature_is_rejected(self):
+        self.assertEqual(self.deliver(load_fixture(flight_id=self.flight.id), secret='whsec_other').status_code, 400)
+        self.assertEqual(FulfilmentJob.query.count(), 0)
+
+    def test_retry_resumes_without_duplicates(self):
+        job_id = self.deliver(load_fixture(flight_id=self.flight.id)).get_json()['job_id']
+
+        calls = []
+        def flaky_delivery(job, gopass, pdf_bytes):
+            calls.append(gopass.id)
+            if len(calls) == 2:
+                raise ConnectionError("SMTP down")
+
+        with patch.object(FulfilmentService, 'deliver', side_effect=flaky_delivery):
+            self.service.run_pending()
+            job = db.session.get(FulfilmentJob, job_id)
+            self.assertEqual((job.status, job.delivered_count), ('queued', 1))
+            self.assertIn('SMTP down', job.last_error)
+            self.assertEqual(self.service.run_pending(), 0) # Backing off
+
+            job.run_after = datetime.utcnow()
+            db.session.commit()
+            self.service.run_pending()
+
+        db.session.expire_all()
+        self.assertEqual((job.status, job.attempts, job.delivered_count), ('done', 2, 3))
+        self.assertEqual(len(set(calls)), 3)
+        self.assertEqual(GoPass.query.count(), 3)
+        self.assertEqual(Transaction.query.count(), 1)
+
+    def test_worker_stops_once_its_job_is_taken_over(self):
+        job_id = self.deliver(load_fixture(flight_id=self.flight.id)).get_json()['job_id']
+        stale_claim = self.service.claim()
+
+        # The lease expired while the first worker was stalled: another one takes over
+        job = db.session.get(FulfilmentJob, job_id)
+        job.started_at = datetime(2000, 1, 1)
+        db.session.commit()
+        self.assertEqual(self.service.claim(), (job_id, 2))
+
+        with patch.object(FulfilmentService, 'deliver') as deliver:
+            self.service.process(*stale_claim)
+        deliver.assert_not_called()
+        self.assertEqual(GoPass.query.count(), 0) # Its tickets were rolled back
+
+        db.session.expire_all()
+        job = db.session.get(FulfilmentJob, job_id)
+        self.assertEqual((job.status, job.attempts, job.transaction_id), ('running', 2, None))
+
+        with patch.object(FulfilmentService, 'deliver') as deliver:
+            self.service.process(job_id, 2)
+        self.assertEqual(deliver.call_count, 3)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(FulfilmentJob, job_id).status, 'done')
+
+    def test_workers_autostart_with_the_first_request(self):
+        with patch.object(config['default'], 'WORKERS_AUTOSTART', True), \
+                patch.object(FulfilmentService, 'start', return_value=None) as start, \
+                patch.object(PrintSpoolerService, 'start', return_value=None) as spooler_start:
+            app = create_app(config_name='default')
+            start.assert_not_called()
+            app.test_client().get('/login')
+        start.assert_called_once_with()
+        spooler_start.assert_called_once_with()
+
+    def test_passes_are_priced_from_the_tariff(self):
+        event = load_fixture(flight_id=self.flight.id)
+        event['data']['object']['amount'] = 5000 # Not the tariff, and not divisible by 3
+        self.deliver(event)
+        with patch.object(FulfilmentService, 'deliver'):
+            self.service.run_pending()
+
+        self.assertEqual({gp.price for gp in GoPass.query.all()}, {15.0})
+        self.assertEqual(Transaction.query.one().amount_collected, 45.0)
+
+    def test_invalid_order_fails_without_retry(self):
+        event = load_fixture(flight_id=9999)
+        job_id = self.deliver(event).get_json()['job_id']
+        self.service.run_pending()
+
+        job = db.session.get(FulfilmentJob, job_id)
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
+        self.assertIn('Vol invalide', job.last_error)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import io
+import unittest
+from datetime import datetime
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from app import create_app
+from models import db, Flight
+from services.gopass_service import GoPassService
+
+class TestTicketTemplate(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.flight = Flight(
+            flight_number='FL-T', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+        self.gopasses = GoPassService.create_gopasses_bulk(
+            self.flight.id,
+            [{'passenger_name': f'Passenger {i}', 'passenger_passport': f'P{i:07d}'} for i in range(3)]
+        )
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_bulk_pdf_stamps_one_template(self):
+        pdf = GoPassService.generate_bulk_pdf(self.gopasses)
+
+        self.assertEqual(pdf.count(b'/Type /Page\n'), 3)
+        self.assertEqual(pdf.count(b'/Subtype /Form'), 1)
+        # Every page references the same template
+        self.assertEqual(pdf.count(b'/FormXob.gopass_a4_fr_0 '), 3)
+
+    def test_one_template_per_format_and_language(self):
+        buffer = io.BytesIO()
+        p = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        templates = {}
+        for lang in ('fr', 'en', 'fr'):
+            qr = GoPassService._create_qr(self.gopasses[0])
+            GoPassService._draw_gopass_on_canvas(p, self.gopasses[0], width, height, qr, 'a4', lang, None, None, templates)
+            p.showPage()
+        p.save()
+
+        self.assertEqual(sorted(templates.values()), ['gopass_a4_en_1', 'gopass_a4_fr_0'])
+        self.assertEqual(buffer.getvalue().count(b'/Subtype /Form'), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+from app import create_app
+from models import db, Flight, GoPass, User, Device
+from services.gopass_service import GoPassService
+from services.token_pack_service import TokenPackService, FLAG_DELTA
+from services.offline_sync_service import OfflineSyncService
+from datetime import datetime, timedelta
+
+class TestTokenPack(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['TESTING'] = True
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.agent = User(
+            username='controller', email='controller@test.com', role='controller',
+            first_name='Agent', last_name='Gate'
+        )
+        self.agent.set_password('password')
+        db.session.add(self.agent)
+
+        today = datetime.now()
+        self.flight = Flight(
+            flight_number='FL-P', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today, status='boarding'
+        )
+        self.sibling = Flight(
+            flight_number='FL-Q', airline='TestAir', departure_airport='FIH', arrival_airport='GOM',
+            departure_time=today, status='boarding'
+        )
+        self.tomorrow = Flight(
+            flight_number='FL-R', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=today + timedelta(days=1), status='scheduled'
+        )
+        db.session.add_all([self.flight, self.sibling, self.tomorrow])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_pass(self, flight):
+        return GoPassService.create_gopass(
+            flight_id=flight.id, passenger_name='Jane Doe',
+            passenger_passport='B7654321', sold_by=self.agent.id
+        )
+
+    def test_full_pack_is_sorted_and_searchable(self):
+        passes = [self.create_pass(self.flight) for _ in range(20)]
+        sibling = self.create_pass(self.sibling)
+        other_day = self.create_pass(self.tomorrow)
+
+        pack, version = TokenPackService.build_pack(self.flight.id)
+        header = TokenPackService.read_header(pack)
+
+        self.assertEqual(header.count, 21)
+        self.assertEqual(header.flags & FLAG_DELTA, 0)
+        self.assertEqual(version, f"{header.max_pass_id}-{header.generated_at}")
+
+        for gp in passes:
+            entry = TokenPackService.lookup(pack, gp.token)
+            self.assertEqual(entry.pass_id, gp.id)
+            self.assertEqual(entry.status, 'valid')
+
+        self.assertEqual(TokenPackService.lookup(pack, sibling.token).flight_id, self.sibling.id)
+        self.assertIsNone(TokenPackService.lookup(pack, other_day.token))
+        self.assertIsNone(TokenPackService.lookup(pack, '0' * 64))
+
+    def test_delta_carries_new_sales_and_scans(self):
+        scanned = self.create_pass(self.flight)
+        untouched = self.create_pass(self.flight)
+        _, version = TokenPackService.build_pack(self.flight.id)
+
+        GoPassService.validate_gopass(scanned.token, self.flight.id, self.agent.id, 'FIH')
+        sold_later = self.create_pass(self.flight)
+
+        delta, delta_version = TokenPackService.build_pack(self.flight.id, since=version)
+        header = TokenPackService.read_header(delta)
+
+        self.assertTrue(header.flags & FLAG_DELTA)
+        self.assertEqual(TokenPackService.lookup(delta, scanned.token).status, 'consumed')
+        self.assertEqual(TokenPackService.lookup(delta, sold_later.token).pass_id, sold_later.id)
+        self.assertEqual(header.max_pass_id, sold_later.id)
+        self.assertNotEqual(delta_version, version)
+
+    def test_delta_carries_offline_scans_uploaded_late(self):
+        scanned = self.create_pass(self.flight)
+        untouched = self.create_pass(self.flight)
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        GoPass.query.update({'issue_date': yesterday, 'updated_at': yesterday})
+        db.session.commit()
+        _, version = TokenPackService.build_pack(self.flight.id)
+
+        # Scanned offline an hour ago, uploaded now: scan_date is older than the pack
+        OfflineSyncService.sync_batch([{
+            'token': scanned.token, 'flight_id': self.flight.id,
+            'timestamp': (datetime.utcnow() - timedelta(hours=1)).isoformat()
+        }], self.agent.id)
+
+        delta, _ = TokenPackService.build_pack(self.flight.id, since=version)
+
+        self.assertEqual(TokenPackService.lookup(delta, scanned.token).status, 'consumed')
+        self.assertIsNone(TokenPackService.lookup(delta, untouched.token))
+
+    def test_pack_endpoint(self):
+        gp = self.create_pass(self.flight)
+        device = Device(unique_id='PDA-01', mac_address='00:11:22:33:44:55', device_type='PDA', is_sync=False)
+        db.session.add(device)
+        db.session.commit()
+
+        client = self.app.test_client()
+        client.post('/login', data=dict(username='controller', password='password'), follow_redirects=True)
+
+        response = client.get(f'/ops/scanner/pack/{self.flight.id}', headers={'X-Device-Id': 'PDA-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/octet-stream')
+        self.assertEqual(TokenPackService.lookup(response.data, gp.token).pass_id, gp.id)
+        self.assertTrue(db.session.get(Device, device.id).is_sync)
+
+        bad = client.get(f'/ops/scanner/pack/{self.flight.id}?since=latest')
+        self.assertEqual(bad.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import io
+import unittest
+from datetime import datetime
+from PIL import Image
+from app import create_app
+from models import db, Flight
+from services.gopass_service import GoPassService
+from services.qr_service import QRService
+
+class TestVectorQR(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_name='default')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.flight = Flight(
+            flight_number='FL-V', airline='TestAir', departure_airport='FIH', arrival_airport='FBM',
+            departure_time=datetime.now(), status='scheduled'
+        )
+        db.session.add(self.flight)
+        db.session.commit()
+
+        self.gopass = GoPassService.create_gopass(
+            flight_id=self.flight.id, passenger_name='Jane Doe', passenger_passport='B7654321'
+        )
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_matrix_matches_the_bitmap_render(self):
+        data = GoPassService.qr_payload(self.gopass)
+        matrix = QRService.matrix(data)
+        image = Image.open(io.BytesIO(QRService.render_png(data))).convert('L')
+
+        box, border = QRService.DEFAULT_BOX_SIZE['ticket'], QRService.TICKET_BORDER
+        sampled = [
+            ''.join(
+                '1' if image.getpixel(((border + c) * box + box // 2, (border + r) * box + box // 2)) < 128 else '0'
+                for c in range(len(matrix))
+            )
+            for r in range(len(matrix))
+        ]
+        self.assertEqual(sampled, matrix)
+        self.assertEqual(image.size[0], (len(matrix) + 2 * border) * box)
+
+    def test_vector_mode_embeds_no_image(self):
+        for fmt in ('a4', 'thermal'):
+            self.app.config['TICKET_QR_MODE'] = 'bitmap'
+            bitmap = GoPassService.generate_pdf_bytes(self.gopass, fmt=fmt)
+            self.app.config['TICKET_QR_MODE'] = 'vector'
+            vector = GoPassService.generate_pdf_bytes(self.gopass, fmt=fmt)
+
+            self.assertTrue(vector.startswith(b'%PDF'))
+            self.assertIn(b'/Subtype /Image', bitmap)
+            self.assertLess(vector.count(b'/Subtype /Image'), bitmap.count(b'/Subtype /Image'))
+            self.assertLess(len(vector), len(bitmap))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,15 +6,18 @@
  * Auditer par : La CyberConfiance, www.cyberconfiance.com
 """
 
+import hashlib
 import json
 import os
 from flask import current_app, session, request
 
 _translations = {}
+_section_digests = {}
 
 def load_translations():
     """Loads translation files from locales/ directory."""
     global _translations
+    _section_digests.clear()
     locales_dir = os.path.join(os.getcwd(), 'locales')
     for lang in ['fr', 'en']:
         file_path = os.path.join(locales_dir, f'{lang}.json')
@@ -65,3 +68,18 @@ def get_text(key, lang=None):
 
     # Fallback to key
     return key
+
+def section_digest(section, lang):
+    """
+    Digest of the texts of a translation section in lang and in the French
+    fallback, for cache keys of documents printed with them.
+    """
+    if not _translations:
+        load_translations()
+
+    digest = _section_digests.get((section, lang))
+    if digest is None:
+        texts = [_translations.get(lang, {}).get(section), _translations.get('fr', {}).get(section)]
+        digest = hashlib.sha256(json.dumps(texts, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        _section_digests[(section, lang)] = digest
+    return digest